@@ -0,0 +1,152 @@
+"""Many-to-many travel times for dispatch planning and coverage analysis.
+
+Planners ask for travel times from every ambulance base to every hospital,
+or from a grid of incident points to the nearest capable hospital. Each
+distinct origin gets one one-to-many Dijkstra that settles all
+destinations (`dijkstra_to_targets`). Origins that snap to the same road
+node share that search tree, and so do destinations that snap to the same
+node.
+
+Distinct origins are split into chunks. The server runs the chunks on the
+RoutePool workers and streams each chunk as soon as it finishes
+(`/route/batch`). Scripts can call `travel_time_matrix` directly.
+"""
+import numpy as np
+
+from route_pool import RoutePool, worker_batch
+
+# distinct origins per worker task; small enough to stream steadily
+CHUNK_SIZE = 8
+
+
+def group(nodes):
+    """node -> list of positions it occupies in `nodes`, first-seen order."""
+    positions = {}
+    for i, node in enumerate(nodes):
+        positions.setdefault(node, []).append(i)
+    return positions
+
+
+def chunked(items, size=CHUNK_SIZE):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def expand(results, destinations, k=None):
+    """One-to-many results -> (destination index, travel_time, route) rows.
+
+    results are (target_node, travel_time, route) tuples sorted by time;
+    destinations maps each target node to its destination indexes.
+    """
+    rows = []
+    for node, travel_time, route in results:
+        for j in destinations[node]:
+            rows.append((j, travel_time, route))
+    return rows if k is None else rows[:k]
+
+
+def batch_search(search, origin_nodes, destination_nodes, k=None):
+    """Yield (origin index, rows) for every origin, one search per distinct origin.
+
+    search(origin_node, target_nodes, k) returns (target_node, travel_time,
+    route) tuples sorted by travel time, like `CSRGraph.dijkstra_to_targets`
+    or `routing.calculate_routes_to_targets`. Unreachable destinations are
+    left out of the rows.
+    """
+    destinations = group(destination_nodes)
+    targets = list(destinations)
+    for origin, indexes in group(origin_nodes).items():
+        rows = expand(search(origin, targets, k), destinations, k)
+        for i in indexes:
+            yield i, rows
+
+
+def travel_time_matrix(csr, origin_nodes, destination_nodes, workers=0):
+    """(origins x destinations) travel times in seconds, inf where unreachable.
+
+    With workers > 0 the chunks run on that many processes over a shared
+    copy of the graph.
+    """
+    matrix = np.full((len(origin_nodes), len(destination_nodes)), np.inf)
+    destinations = group(destination_nodes)
+    targets = list(destinations)
+    origins = group(origin_nodes)
+    if workers <= 0:
+        for i, rows in batch_search(csr.dijkstra_to_targets, origin_nodes, destination_nodes):
+            for j, travel_time, _ in rows:
+                matrix[i, j] = travel_time
+        return matrix
+
+    pool = RoutePool(csr, workers)
+    try:
+        chunks = chunked(origins)
+        done = pool.executor.map(
+            worker_batch, chunks, [targets] * len(chunks), [None] * len(chunks), [False] * len(chunks)
+        )
+        for chunk, (results, _) in zip(chunks, done):
+            for origin, found in zip(chunk, results):
+                for j, travel_time, _ in expand(found, destinations):
+                    matrix[origins[origin], j] = travel_time
+    finally:
+        pool.close()
+    return matrix
+
+
+class _Sink:
+    """Write-only file object that hands back what was written since the last drain."""
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+class ArrowEncoder:
+    """Rows -> Arrow IPC stream bytes, one record batch per call (needs pyarrow)."""
+
+    def __init__(self, include_routes=False):
+        import pyarrow as pa
+
+        self.pa = pa
+        fields = [
+            ("origin", pa.int32()),
+            ("destination", pa.int32()),
+            ("hospital_id", pa.int64()),
+            ("travel_time_s", pa.float64()),
+        ]
+        if include_routes:
+            fields.append(("route", pa.list_(pa.list_(pa.float64()))))
+        self.schema = pa.schema(fields)
+        self.sink = _Sink()
+        self.writer = pa.ipc.new_stream(pa.PythonFile(self.sink, mode='w'), self.schema)
+
+    def encode(self, rows):
+        if rows:
+            self.writer.write_batch(self.pa.RecordBatch.from_pylist(rows, schema=self.schema))
+        return self.sink.drain()
+
+    def close(self):
+        self.writer.close()
+        return self.sink.drain()
@@ -0,0 +1,260 @@
+"""Customizable contraction hierarchy (CCH) over the CSR road graph.
+
+Preprocessing is split the way CCH does it:
+
+* `ContractionHierarchy(csr)` contracts nodes in a metric-independent
+  min-degree order. That fixes the shortcut topology (the "chordal
+  supergraph") and the triangle list, and never needs to run again.
+* `customize(weights)` pushes the current travel times through the
+  triangles, bottom-up one elimination-tree level at a time, with NumPy.
+  Run it after `randomize_traffic` or a live feed changes edge weights.
+  It is much cheaper than rebuilding the hierarchy.
+* `query(start, end)` scans only the elimination-tree ancestors of both
+  endpoints, a few hundred nodes instead of the whole graph. It then
+  unpacks the shortcuts back into OSM node IDs.
+
+Every arc joins a lower-ranked node `lo` to a higher-ranked node `hi`.
+`fw[a]` is the cost of travelling lo -> hi, and `bw[a]` is the cost of
+travelling hi -> lo.
+"""
+import heapq
+import time
+
+import networkx as nx
+import numpy as np
+
+from metrics import SEARCH_EXPANDED, SEARCH_SECONDS
+
+INF = float('inf')
+
+
+class ContractionHierarchy:
+    def __init__(self, csr):
+        self.csr = csr
+        n = len(csr)
+        indptr, indices = csr._indptr, csr._indices
+
+        # undirected neighbourhoods of the road graph
+        adj = [set() for _ in range(n)]
+        for u in range(n):
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                if v != u:
+                    adj[u].add(v)
+                    adj[v].add(u)
+
+        # min-degree elimination; neighbours at elimination time become the
+        # node's upward arcs and are joined pairwise (fill-in)
+        rank = [-1] * n
+        up_nodes = [None] * n
+        heap = [(len(adj[v]), v) for v in range(n)]
+        heapq.heapify(heap)
+        r = 0
+        while heap:
+            d, v = heapq.heappop(heap)
+            if rank[v] >= 0 or d != len(adj[v]):
+                continue
+            rank[v] = r
+            r += 1
+            nbrs = adj[v]
+            up_nodes[v] = list(nbrs)
+            for a in nbrs:
+                adj_a = adj[a]
+                adj_a.discard(v)
+                adj_a.update(nbrs)
+                adj_a.discard(a)
+                heapq.heappush(heap, (len(adj_a), a))
+            adj[v] = None
+        self.rank = rank
+
+        # arcs, grouped by their lower endpoint and sorted by rank
+        order = sorted(range(n), key=rank.__getitem__)
+        arc_id = {}
+        arc_lo = []
+        arc_hi = []
+        self.up_arcs = [None] * n
+        for v in order:
+            ups = sorted(up_nodes[v], key=rank.__getitem__)
+            arcs = []
+            for w in ups:
+                arc_id[(v, w)] = len(arc_lo)
+                arcs.append((w, len(arc_lo)))
+                arc_lo.append(v)
+                arc_hi.append(w)
+            self.up_arcs[v] = arcs
+        self.arc_lo = np.array(arc_lo, dtype=np.int32)
+        self.arc_hi = np.array(arc_hi, dtype=np.int32)
+        num_arcs = len(arc_lo)
+
+        # elimination tree: parent is the lowest-ranked upward neighbour
+        self.parent = [arcs[0][0] if arcs else -1 for arcs in self.up_arcs]
+        height = [0] * n
+        for v in order:
+            p = self.parent[v]
+            if p >= 0 and height[p] < height[v] + 1:
+                height[p] = height[v] + 1
+
+        # CSR slots of the original edges behind each arc (-1 if pure shortcut)
+        self._fw_slot = np.full(num_arcs, -1, dtype=np.int64)
+        self._bw_slot = np.full(num_arcs, -1, dtype=np.int64)
+        for u in range(n):
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                if v == u:
+                    continue
+                if rank[u] < rank[v]:
+                    self._fw_slot[arc_id[(u, v)]] = i
+                else:
+                    self._bw_slot[arc_id[(v, u)]] = i
+
+        # lower triangles (v, a, b) with rank v < a < b, grouped by the
+        # elimination-tree height of v so each group can be relaxed at once
+        levels = {}
+        for v in order:
+            arcs = self.up_arcs[v]
+            if len(arcs) < 2:
+                continue
+            tri = levels.setdefault(height[v], ([], [], []))
+            for i in range(len(arcs)):
+                a, va = arcs[i]
+                for j in range(i + 1, len(arcs)):
+                    b, vb = arcs[j]
+                    tri[0].append(arc_id[(a, b)])
+                    tri[1].append(va)
+                    tri[2].append(vb)
+        self._levels = [
+            tuple(np.array(t, dtype=np.int32) for t in levels[h]) for h in sorted(levels)
+        ]
+        self.num_triangles = sum(len(t[0]) for t in self._levels)
+
+        self.customize(csr.weights)
+
+    @property
+    def num_arcs(self):
+        return len(self.arc_lo)
+
+    def customize(self, weights):
+        """Recompute all arc costs for a new per-CSR-slot travel time array."""
+        weights = np.asarray(weights, dtype=np.float64)
+        fw = np.full(self.num_arcs, np.inf)
+        bw = np.full(self.num_arcs, np.inf)
+        has_fw = self._fw_slot >= 0
+        has_bw = self._bw_slot >= 0
+        fw[has_fw] = weights[self._fw_slot[has_fw]]
+        bw[has_bw] = weights[self._bw_slot[has_bw]]
+        # shortcut unpacking: the two arcs each shortcut was built from
+        fw_mid = np.full((self.num_arcs, 2), -1, dtype=np.int32)
+        bw_mid = np.full((self.num_arcs, 2), -1, dtype=np.int32)
+
+        for ab, va, vb in self._levels:
+            # a -> v -> b improves a -> b, and b -> v -> a improves b -> a
+            cand = bw[va] + fw[vb]
+            before = fw[ab]
+            np.minimum.at(fw, ab, cand)
+            won = (cand < before) & (cand == fw[ab])
+            fw_mid[ab[won], 0] = va[won]
+            fw_mid[ab[won], 1] = vb[won]
+
+            cand = bw[vb] + fw[va]
+            before = bw[ab]
+            np.minimum.at(bw, ab, cand)
+            won = (cand < before) & (cand == bw[ab])
+            bw_mid[ab[won], 0] = vb[won]
+            bw_mid[ab[won], 1] = va[won]
+
+        self.fw, self.bw = fw, bw
+        # swapped in one assignment so concurrent queries never mix metrics
+        self._metric = (fw.tolist(), bw.tolist(), fw_mid, bw_mid)
+
+    @staticmethod
+    def _relax(d, arcs, costs, dist, pred):
+        for w, a in arcs:
+            nd = d + costs[a]
+            if nd < dist.get(w, INF):
+                dist[w] = nd
+                pred[w] = a
+
+    def _unpack(self, arc, upward, fw_mid, bw_mid, out):
+        # append the original nodes after the arc's start node to out
+        lo, hi = self.arc_lo, self.arc_hi
+        stack = [(arc, upward)]
+        while stack:
+            a, up = stack.pop()
+            first, second = (fw_mid if up else bw_mid)[a]
+            if first < 0:
+                out.append(int(hi[a]) if up else int(lo[a]))
+                continue
+            # first is travelled downward, then second upward
+            stack.append((second, True))
+            stack.append((first, False))
+
+    def query(self, start_node, end_node):
+        """Shortest path as (OSM node IDs, travel time in seconds)."""
+        started = time.perf_counter()
+        csr = self.csr
+        try:
+            s = csr.index[start_node]
+            t = csr.index[end_node]
+        except KeyError as e:
+            raise nx.NodeNotFound(f"Node {e.args[0]} not in graph")
+        if s == t:
+            return [start_node], 0
+
+        # Walk both elimination-tree chains upward in rank order. Above their
+        # lowest common ancestor the chains coincide; there the best meeting
+        # cost is known and prunes the expensive top-of-hierarchy nodes.
+        rank, parent, up_arcs = self.rank, self.parent, self.up_arcs
+        fw, bw, fw_mid, bw_mid = self._metric
+        df, pf = {s: 0.0}, {s: None}
+        db, pb = {t: 0.0}, {t: None}
+        best = INF
+        meet = -1
+        u, v = s, t
+        while u >= 0 or v >= 0:
+            if v < 0 or (u >= 0 and rank[u] < rank[v]):
+                d = df.get(u, INF)
+                if d < best:
+                    self._relax(d, up_arcs[u], fw, df, pf)
+                u = parent[u]
+            elif u < 0 or rank[v] < rank[u]:
+                d = db.get(v, INF)
+                if d < best:
+                    self._relax(d, up_arcs[v], bw, db, pb)
+                v = parent[v]
+            else:
+                d1 = df.get(u, INF)
+                d2 = db.get(u, INF)
+                if d1 + d2 < best:
+                    best = d1 + d2
+                    meet = u
+                if d1 < best:
+                    self._relax(d1, up_arcs[u], fw, df, pf)
+                if d2 < best:
+                    self._relax(d2, up_arcs[u], bw, db, pb)
+                u = v = parent[u]
+
+        if meet < 0:
+            raise nx.NetworkXNoPath(f"Node {end_node} not reachable from {start_node}")
+
+        # forward half: arcs from s up to meet, travelled upward
+        arcs = []
+        v = meet
+        while pf[v] is not None:
+            a = pf[v]
+            arcs.append(a)
+            v = int(self.arc_lo[a])
+        arcs.reverse()
+        path = [s]
+        for a in arcs:
+            self._unpack(a, True, fw_mid, bw_mid, path)
+
+        # backward half: arcs from meet down to t
+        v = meet
+        while pb[v] is not None:
+            a = pb[v]
+            self._unpack(a, False, fw_mid, bw_mid, path)
+            v = int(self.arc_lo[a])
+
+        SEARCH_SECONDS.since(started, "ch", "query")
+        SEARCH_EXPANDED.observe(len(df) + len(db), "ch", "query")
+        return [csr.node_ids[i] for i in path], best
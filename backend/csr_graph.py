@@ -0,0 +1,343 @@
+"""Compressed-sparse-row view of the road graph for fast routing.
+
+NetworkX stores the graph as nested dicts and calls a Python weight function
+per edge relaxation. `CSRGraph` flattens it once into int32 index arrays,
+float32 coordinates and one travel time per (u, v) pair (the minimum over
+parallel edges, same as `routing._edge_weight`). The A* and Dijkstra below
+run over those arrays and return OSM node IDs and travel time in seconds,
+exactly like `calculate_route_astar` / `calculate_route_dijkstra`.
+
+The A* estimate is the straight-line distance on a local flat projection
+(longitude scaled by cos(latitude)) times the smallest seconds per km any
+arc currently has. That keeps it admissible and consistent on roads
+faster than any assumed top speed. It is recomputed whenever new weights
+are published.
+"""
+import heapq
+import math
+import time
+from itertools import count
+
+import networkx as nx
+import numpy as np
+
+from metrics import SEARCH_EXPANDED, SEARCH_SECONDS
+
+KM_PER_DEGREE = 111.0
+
+
+def _pair_weight(keydict):
+    # minimum current_travel_time over the parallel edges u->v
+    return min(d.get('current_travel_time', d.get('travel_time', 0)) for d in keydict.values())
+
+
+def _observe(algorithm, started, expanded):
+    SEARCH_SECONDS.since(started, "csr", algorithm)
+    SEARCH_EXPANDED.observe(expanded, "csr", algorithm)
+
+
+class CSRGraph:
+    def __init__(self, G):
+        self.node_ids = list(G.nodes)
+        self.index = {n: i for i, n in enumerate(self.node_ids)}
+        n = len(self.node_ids)
+
+        self.lat = np.empty(n, dtype=np.float32)
+        self.lon = np.empty(n, dtype=np.float32)
+        for i, node in enumerate(self.node_ids):
+            data = G.nodes[node]
+            self.lat[i] = data.get('y', data.get('lat'))
+            self.lon[i] = data.get('x', data.get('lon'))
+
+        indptr = [0]
+        indices = []
+        # keydicts backing each CSR slot, so weights can be refreshed in place
+        self._edge_refs = []
+        self._slot = {}
+        for node in self.node_ids:
+            for nbr, keydict in G._adj[node].items():
+                self._slot[(node, nbr)] = len(indices)
+                indices.append(self.index[nbr])
+                self._edge_refs.append(keydict)
+            indptr.append(len(indices))
+
+        self.indptr = np.array(indptr, dtype=np.int32)
+        self.indices = np.array(indices, dtype=np.int32)
+        self.version = 0
+        self._mirror()
+        self.refresh_weights(version=0)
+
+    @classmethod
+    def from_arrays(cls, node_ids, lat, lon, indptr, indices, weights, version=0):
+        """Search-only graph over existing arrays (e.g. in a worker process).
+
+        It has no NetworkX edge references, so weights can only change
+        through `_publish`.
+        """
+        self = cls.__new__(cls)
+        self.node_ids = node_ids.tolist() if isinstance(node_ids, np.ndarray) else list(node_ids)
+        self.index = {n: i for i, n in enumerate(self.node_ids)}
+        self.lat = np.asarray(lat, dtype=np.float32)
+        self.lon = np.asarray(lon, dtype=np.float32)
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.version = version
+        self._mirror()
+        self._publish(np.asarray(weights, dtype=np.float64).tolist(), version)
+        return self
+
+    def _mirror(self):
+        # plain-list mirrors: element access on lists is far cheaper than on
+        # NumPy arrays inside the Python search loops
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._lat = self.lat.tolist()
+        self._lon = self.lon.tolist()
+        # flat km coordinates around the mean latitude: a true metric, so the
+        # straight-line estimate obeys the triangle inequality
+        lat = self.lat.astype(np.float64)
+        lon = self.lon.astype(np.float64)
+        ref = math.cos(math.radians(float(lat.mean()))) if len(lat) else 1.0
+        x = lon * ref * KM_PER_DEGREE
+        y = lat * KM_PER_DEGREE
+        self._x = x.tolist()
+        self._y = y.tolist()
+        tails = np.repeat(np.arange(len(lat)), np.diff(self.indptr))
+        self._arc_km = np.hypot(x[self.indices] - x[tails], y[self.indices] - y[tails])
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self._indices)
+
+    def refresh_weights(self, version=None):
+        """Re-read every current_travel_time from G after a traffic update."""
+        self._publish([_pair_weight(keydict) for keydict in self._edge_refs], version)
+
+    def bind_edges(self, edges):
+        """Map traffic-model edge IDs ((u, v, k, data) list order) to CSR slots."""
+        self.edge_slot = np.array([self._slot[(u, v)] for u, v, _, _ in edges], dtype=np.int64)
+        # slots backed by parallel edges need a min over all of them
+        counts = np.bincount(self.edge_slot, minlength=self.num_edges)
+        self._parallel = {slot: [] for slot in np.flatnonzero(counts > 1).tolist()}
+        for edge_id, slot in enumerate(self.edge_slot.tolist()):
+            if slot in self._parallel:
+                self._parallel[slot].append(edge_id)
+
+    def update_edge_weights(self, edge_ids, travel_times, version=None):
+        """Apply changed edge travel times (indexed by edge ID) to the slots.
+
+        Returns True if any (u, v) weight decreased.
+        """
+        old = self.weights
+        weights = old.copy()
+        slots = self.edge_slot[edge_ids]
+        weights[slots] = travel_times[edge_ids]
+        for slot in np.unique(slots).tolist():
+            parallel = self._parallel.get(slot)
+            if parallel:
+                weights[slot] = travel_times[parallel].min()
+        self._publish(weights.tolist(), version)
+        return bool((weights[slots] < old[slots]).any())
+
+    def _publish(self, weights, version):
+        # copy-on-write: searches hold on to the list they started with, so
+        # they always see a single consistent weight version
+        weights_array = np.array(weights, dtype=np.float64)
+        self._weights = weights
+        # weights and their estimate scale, swapped together
+        self._metric = (weights, self._heuristic_scale(weights_array))
+        self.weights = weights_array
+        self.version = self.version + 1 if version is None else version
+        self._published = (weights_array, self.version)
+
+    def published(self):
+        """(weights array, version) as one consistent pair."""
+        return self._published
+
+    def _heuristic_scale(self, weights):
+        """Seconds per straight-line km on the fastest arc (0 disables the estimate)."""
+        moving = self._arc_km > 0
+        if not moving.any():
+            return 0.0
+        if (weights[moving] <= 0).any():
+            return 0.0
+        return float((weights[moving] / self._arc_km[moving]).min())
+
+    def _heuristic(self, u, target, s_per_km):
+        # no arc covers straight-line distance faster than s_per_km
+        return math.hypot(self._x[target] - self._x[u], self._y[target] - self._y[u]) * s_per_km
+
+    def _node_index(self, node):
+        try:
+            return self.index[node]
+        except KeyError:
+            raise nx.NodeNotFound(f"Node {node} not in graph")
+
+    def _path(self, parents, target):
+        path = []
+        node = target
+        while node is not None:
+            path.append(self.node_ids[node])
+            node = parents[node]
+        path.reverse()
+        return path
+
+    def astar(self, start_node, end_node):
+        """A* over the CSR arrays, with nx.astar_path's search order."""
+        started = time.perf_counter()
+        source = self._node_index(start_node)
+        target = self._node_index(end_node)
+        indptr, indices = self._indptr, self._indices
+        weights, s_per_km = self._metric
+        push, pop = heapq.heappush, heapq.heappop
+        c = count()
+
+        queue = [(0, next(c), source, 0, None)]
+        enqueued = {}
+        explored = {}
+        while queue:
+            _, __, cur, dist, parent = pop(queue)
+            if cur == target:
+                explored[cur] = parent
+                _observe("astar", started, len(explored))
+                return self._path(explored, target), dist
+            if cur in explored:
+                if explored[cur] is None:
+                    continue
+                qcost, h = enqueued[cur]
+                if qcost < dist:
+                    continue
+            explored[cur] = parent
+
+            for i in range(indptr[cur], indptr[cur + 1]):
+                nbr = indices[i]
+                ncost = dist + weights[i]
+                if nbr in enqueued:
+                    qcost, h = enqueued[nbr]
+                    if qcost <= ncost:
+                        continue
+                else:
+                    h = self._heuristic(nbr, target, s_per_km)
+                enqueued[nbr] = ncost, h
+                push(queue, (ncost + h, next(c), nbr, ncost, cur))
+
+        raise nx.NetworkXNoPath(f"Node {end_node} not reachable from {start_node}")
+
+    def dijkstra(self, start_node, end_node):
+        """Plain Dijkstra over the CSR arrays, stopping at the target."""
+        started = time.perf_counter()
+        source = self._node_index(start_node)
+        target = self._node_index(end_node)
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        push, pop = heapq.heappush, heapq.heappop
+
+        dist = {source: 0}
+        parents = {source: None}
+        settled = set()
+        queue = [(0, source)]
+        while queue:
+            d, cur = pop(queue)
+            if cur in settled:
+                continue
+            if cur == target:
+                _observe("dijkstra", started, len(settled))
+                return self._path(parents, target), d
+            settled.add(cur)
+
+            for i in range(indptr[cur], indptr[cur + 1]):
+                nbr = indices[i]
+                nd = d + weights[i]
+                if nbr not in dist or nd < dist[nbr]:
+                    dist[nbr] = nd
+                    parents[nbr] = cur
+                    push(queue, (nd, nbr))
+
+        raise nx.NetworkXNoPath(f"Node {end_node} not reachable from {start_node}")
+
+    def dijkstra_to_targets(self, start_node, target_nodes, k=None):
+        """One-to-many Dijkstra from start_node to a set of target nodes.
+
+        The search stops as soon as every target (or the first `k` of them)
+        has been settled, so picking the closest of ~20 hospitals costs about
+        the same as one point-to-point query. Returns a list of
+        (target_node, travel_time, route_nodes) sorted by travel time;
+        unreachable targets are left out.
+        """
+        started = time.perf_counter()
+        source = self._node_index(start_node)
+        remaining = {self.index[t] for t in target_nodes if t in self.index}
+        wanted = len(remaining) if k is None else min(k, len(remaining))
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        push, pop = heapq.heappush, heapq.heappop
+
+        dist = {source: 0}
+        parents = {source: None}
+        settled = set()
+        results = []
+        queue = [(0, source)]
+        while queue and len(results) < wanted:
+            d, cur = pop(queue)
+            if cur in settled:
+                continue
+            settled.add(cur)
+            if cur in remaining:
+                results.append((self.node_ids[cur], d, self._path(parents, cur)))
+
+            for i in range(indptr[cur], indptr[cur + 1]):
+                nbr = indices[i]
+                nd = d + weights[i]
+                if nbr not in dist or nd < dist[nbr]:
+                    dist[nbr] = nd
+                    parents[nbr] = cur
+                    push(queue, (nd, nbr))
+        _observe("dijkstra_to_targets", started, len(settled))
+        return results
+
+    def astar_with_waits(self, start_node, end_node, row_of, wait):
+        """A* on arrival time where some nodes add a wait on arrival.
+
+        row_of[i] is -1 for plain nodes; otherwise wait(row_of[i], t) is
+        the extra seconds spent at node i when reaching it t seconds after
+        leaving start (see signal_delay.SignalDelays). Waiting never lets a
+        later arrival leave earlier, so the search stays label-setting.
+        """
+        started = time.perf_counter()
+        source = self._node_index(start_node)
+        target = self._node_index(end_node)
+        indptr, indices = self._indptr, self._indices
+        weights, s_per_km = self._metric
+        heuristic = self._heuristic
+        push, pop = heapq.heappush, heapq.heappop
+
+        dist = {source: 0}
+        parents = {source: None}
+        estimate = {}
+        settled = set()
+        queue = [(0, 0, source)]
+        while queue:
+            _, d, cur = pop(queue)
+            if cur in settled:
+                continue
+            if cur == target:
+                _observe("astar_with_waits", started, len(settled))
+                return self._path(parents, target), d
+            settled.add(cur)
+
+            for i in range(indptr[cur], indptr[cur + 1]):
+                nbr = indices[i]
+                nd = d + weights[i]
+                row = row_of[nbr]
+                if row >= 0 and nbr != target:
+                    nd += wait(row, nd)
+                if nbr not in dist or nd < dist[nbr]:
+                    dist[nbr] = nd
+                    parents[nbr] = cur
+                    h = estimate.get(nbr)
+                    if h is None:
+                        h = estimate[nbr] = heuristic(nbr, target, s_per_km)
+                    push(queue, (nd + h, nd, nbr))
+
+        raise nx.NetworkXNoPath(f"Node {end_node} not reachable from {start_node}")
@@ -0,0 +1,300 @@
+"""Server-side ambulance fleet, advanced together in one vectorized tick.
+
+Each vehicle is registered once with a computed route (a RouteCorridor).
+All routes are packed end to end into flat arrays of cumulative distance,
+so locating every vehicle on its route, finding the on-route signals each
+one reaches within the preemption lead time and interpolating positions
+are a handful of `np.searchsorted` calls for the whole fleet.
+
+A vehicle can be switched to a new route mid-trip (`reroute`, used by the
+replanner); it keeps its place on the road it is driving along.
+
+Preemption conflicts: a signal is held by at most one approach (the road
+node a vehicle arrives from). The vehicle with the earliest ETA claims a
+free signal, and a holder keeps it until it has driven through. Vehicles
+arriving on the same approach share the green. Any other vehicle is held
+a few meters before the stop line until the signal is released.
+"""
+import threading
+import uuid
+
+import numpy as np
+
+from metrics import PREEMPTIONS
+from signal_model import trigger_preemption
+from simulation import PREEMPT_LEAD_TIME_S
+
+# held vehicles wait this far before the stop line (m)
+STOP_GAP_M = 10.0
+
+
+class Vehicle:
+    def __init__(self, vehicle_id, corridor, speed_kmh, route_id=None):
+        self.id = vehicle_id
+        self.corridor = corridor
+        self.speed_kmh = speed_kmh
+        self.route_id = route_id
+        self.length = corridor.dist_along[-1]
+
+
+class Fleet:
+    def __init__(self, signals, lead_time_s=PREEMPT_LEAD_TIME_S, max_vehicles=1000):
+        self.signals = signals
+        self.lead_time_s = lead_time_s
+        self.max_vehicles = max_vehicles
+        self.vehicles = {}       # vehicle id -> Vehicle, registration order
+        self.holders = {}        # signal position -> (vehicle id, approach node, distance along its route)
+        self.held_at = {}        # vehicle id -> signal id it is waiting for
+        self.preempted = set()   # vehicle ids that triggered a preemption last tick
+        self.time_s = 0.0
+        self._signal_pos = {s["id"]: i for i, s in enumerate(signals)}
+        self._lock = threading.Lock()
+        self.ids = []
+        self.row = {}            # vehicle id -> row in the packed arrays
+        self.pos = np.zeros(0)
+        self.arrived = np.zeros(0, dtype=np.bool_)
+        self._moved = {}         # vehicle id -> distance on its new route (reroute)
+        self._stale = True
+        self._pack()
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def register(self, corridor, speed_kmh=60.0, vehicle_id=None, route_id=None):
+        """Add a vehicle at the start of the corridor's route; returns its id."""
+        with self._lock:
+            vehicle_id = vehicle_id or uuid.uuid4().hex
+            if vehicle_id in self.vehicles:
+                self._forget(vehicle_id)
+            self.vehicles[vehicle_id] = Vehicle(vehicle_id, corridor, speed_kmh, route_id)
+            self._stale = True
+            while len(self.vehicles) > self.max_vehicles:
+                self._evict()
+            return vehicle_id
+
+    def trips(self):
+        """(vehicle id, corridor, distance driven) of every vehicle still en route."""
+        with self._lock:
+            self._pack()
+            return [
+                (vid, self.vehicles[vid].corridor, float(self.pos[row]))
+                for vid, row in self.row.items() if not self.arrived[row]
+            ]
+
+    def reroute(self, vehicle_id, corridor, route_id, vertex):
+        """Switch a vehicle to a new route, keeping its place on the road.
+
+        The new corridor must start with the old route's nodes vertex - 1
+        and vertex (the road the vehicle is on; just node `vertex` when
+        vertex is 0). Returns False if the vehicle has left that road
+        since, or is gone.
+        """
+        with self._lock:
+            self._pack()
+            row = self.row.get(vehicle_id)
+            if row is None or self.arrived[row]:
+                return False
+            vehicle = self.vehicles[vehicle_id]
+            dist_along = vehicle.corridor.dist_along
+            distance = float(self.pos[row])
+            if vertex > 0 and not dist_along[vertex - 1] <= distance < dist_along[vertex]:
+                return False
+            if vertex == 0 and distance > 0:
+                return False
+            self.vehicles[vehicle_id] = Vehicle(vehicle_id, corridor, vehicle.speed_kmh, route_id)
+            self._moved[vehicle_id] = distance - dist_along[vertex - 1] if vertex > 0 else 0.0
+            # signals claimed at distances along the old route
+            self.held_at.pop(vehicle_id, None)
+            for pos, holder in list(self.holders.items()):
+                if holder[0] == vehicle_id:
+                    del self.holders[pos]
+            self._stale = True
+            return True
+
+    def route(self, vehicle_id):
+        """[[lat, lon], ...] of the vehicle's current route, or None."""
+        with self._lock:
+            vehicle = self.vehicles.get(vehicle_id)
+            if vehicle is None:
+                return None
+            return [[lat, lon] for lat, lon in zip(vehicle.corridor.lats, vehicle.corridor.lons)]
+
+    def remove(self, vehicle_id):
+        with self._lock:
+            if vehicle_id not in self.vehicles:
+                return False
+            self._forget(vehicle_id)
+            return True
+
+    def _evict(self):
+        # oldest arrived vehicle first, else the oldest one
+        arrived = [vid for i, vid in enumerate(self.ids) if self.arrived[i] and vid in self.vehicles]
+        self._forget(arrived[0] if arrived else next(iter(self.vehicles)))
+
+    def _forget(self, vehicle_id):
+        # a re-registered vehicle starts over from the beginning of its route
+        self._stale = True
+        self.row.pop(vehicle_id, None)
+        self._moved.pop(vehicle_id, None)
+        del self.vehicles[vehicle_id]
+        self.held_at.pop(vehicle_id, None)
+        self.preempted.discard(vehicle_id)
+        for pos, holder in list(self.holders.items()):
+            if holder[0] == vehicle_id:
+                del self.holders[pos]
+
+    def _pack(self):
+        """Lay all routes end to end in flat arrays.
+
+        Runs lazily on the first tick or read after vehicles were added or
+        removed, so registering many vehicles costs one repack.
+        """
+        if not self._stale:
+            return
+        self._stale = False
+        carried = {vid: (float(self.pos[i]), bool(self.arrived[i])) for vid, i in self.row.items()}
+        carried.update((vid, (distance, False)) for vid, distance in self._moved.items())
+        self._moved = {}
+        state = [carried.get(vid, (0.0, False)) for vid in self.vehicles]
+        vehicles = list(self.vehicles.values())
+        self.ids = [v.id for v in vehicles]
+        self.row = {vid: i for i, vid in enumerate(self.ids)}
+        n = len(vehicles)
+        self.length = np.array([v.length for v in vehicles], dtype=np.float64)
+        self.speed = np.array([max(v.speed_kmh, 1.0) / 3.6 for v in vehicles], dtype=np.float64)
+        # 1 m between routes keeps every route's distances disjoint
+        self.base = np.concatenate(([0.0], np.cumsum(self.length + 1.0)[:-1])) if n else np.zeros(0)
+        self.pos = np.array([p for p, _ in state], dtype=np.float64)
+        self.arrived = np.array([a for _, a in state], dtype=np.bool_)
+
+        vert_dist, vert_lat, vert_lon, first_vertex = [], [], [], []
+        stop_dist, stop_signal, stop_approach, stop_vehicle = [], [], [], []
+        count = 0
+        for i, v in enumerate(vehicles):
+            c = v.corridor
+            first_vertex.append(count)
+            count += len(c.dist_along)
+            vert_dist.append(self.base[i] + np.asarray(c.dist_along))
+            vert_lat.append(c.lats)
+            vert_lon.append(c.lons)
+            for (dist, s), vertex in zip(c.stops, c.stop_vertices):
+                stop_dist.append(self.base[i] + dist)
+                stop_signal.append(self._signal_pos[s["id"]])
+                stop_approach.append(c.nodes[vertex - 1] if vertex > 0 else None)
+                stop_vehicle.append(i)
+        self.vert_dist = np.concatenate(vert_dist) if n else np.zeros(0)
+        self.vert_lat = np.concatenate(vert_lat) if n else np.zeros(0)
+        self.vert_lon = np.concatenate(vert_lon) if n else np.zeros(0)
+        self.first_vertex = np.array(first_vertex, dtype=np.int64)
+        self.last_vertex = np.append(self.first_vertex[1:], count) - 1 if n else np.zeros(0, dtype=np.int64)
+        self.stop_dist = np.array(stop_dist, dtype=np.float64)
+        self.stop_signal = np.array(stop_signal, dtype=np.int64)
+        self.stop_approach = stop_approach
+        self.stop_vehicle = np.array(stop_vehicle, dtype=np.int64)
+        self.limit = self.length.copy()
+        self._locate()
+
+    def _locate(self):
+        # lat/lon of every vehicle by interpolating along its route
+        if not len(self.ids):
+            self.lat = self.lon = np.zeros(0)
+            return
+        at = self.base + self.pos
+        vertex = np.searchsorted(self.vert_dist, at, side='right') - 1
+        vertex = np.clip(vertex, self.first_vertex, self.last_vertex)
+        nxt = np.minimum(vertex + 1, self.last_vertex)
+        span = self.vert_dist[nxt] - self.vert_dist[vertex]
+        frac = np.where(span > 0, (at - self.vert_dist[vertex]) / np.where(span > 0, span, 1.0), 0.0)
+        frac = np.clip(frac, 0.0, 1.0)
+        self.lat = self.vert_lat[vertex] + frac * (self.vert_lat[nxt] - self.vert_lat[vertex])
+        self.lon = self.vert_lon[vertex] + frac * (self.vert_lon[nxt] - self.vert_lon[vertex])
+
+    def tick(self, dt):
+        """Advance every vehicle by dt seconds and resolve signal preemption."""
+        with self._lock:
+            self._pack()
+            self.time_s += dt
+            self.preempted = set()
+            if not len(self.ids):
+                return
+            # 1. move, stopping short of any signal held against us
+            self.pos = np.minimum(self.pos + self.speed * dt, np.maximum(self.limit, self.pos))
+            self.arrived |= self.pos >= self.length
+            at = self.base + self.pos
+
+            # 2. release signals whose holder drove through or is gone
+            for pos, (holder, _, dist) in list(self.holders.items()):
+                row = self.row.get(holder)
+                if row is None or self.arrived[row] or self.pos[row] > dist:
+                    del self.holders[pos]
+
+            # 3. every vehicle's upcoming stops within the lead time
+            lo = np.searchsorted(self.stop_dist, at, side='left')
+            reach = self.base + np.minimum(self.pos + self.speed * self.lead_time_s, self.length)
+            hi = np.searchsorted(self.stop_dist, reach, side='right')
+            hi = np.where(self.arrived, lo, np.maximum(hi, lo))
+            counts = hi - lo
+            total = int(counts.sum())
+            self.limit = self.length.copy()
+            self.held_at = {}
+            if total == 0:
+                PREEMPTIONS.observe(0, "fleet")
+                self._locate()
+                return
+            starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            stops = starts + np.arange(total)
+            vehicles = self.stop_vehicle[stops]
+            eta = (self.stop_dist[stops] - at[vehicles]) / self.speed[vehicles]
+
+            # 4. per signal: holder keeps it, else earliest ETA claims it
+            order = np.lexsort((eta, self.stop_signal[stops]))
+            triggered = 0
+            for k in order.tolist():
+                stop = int(stops[k])
+                row = int(vehicles[k])
+                signal_pos = int(self.stop_signal[stop])
+                approach = self.stop_approach[stop]
+                vehicle_id = self.ids[row]
+                dist = float(self.stop_dist[stop] - self.base[row])
+                holder = self.holders.get(signal_pos)
+                if holder is None:
+                    holder = self.holders[signal_pos] = (vehicle_id, approach, dist)
+                if holder[0] == vehicle_id or holder[1] == approach:
+                    if trigger_preemption(self.signals[signal_pos]):
+                        self.preempted.add(vehicle_id)
+                        triggered += 1
+                elif dist - STOP_GAP_M < self.limit[row]:
+                    # conflicting approach: wait before the nearest such stop line
+                    self.limit[row] = max(dist - STOP_GAP_M, 0.0)
+                    self.held_at[vehicle_id] = self.signals[signal_pos]["id"]
+            PREEMPTIONS.observe(triggered, "fleet")
+            self._locate()
+
+    def state(self, vehicle_id):
+        """Position and preemption status of one vehicle, or None."""
+        with self._lock:
+            self._pack()
+            row = self.row.get(vehicle_id)
+            if row is None:
+                return None
+            return self._state(row)
+
+    def states(self):
+        with self._lock:
+            self._pack()
+            return [self._state(row) for row in range(len(self.ids))]
+
+    def _state(self, row):
+        vehicle_id = self.ids[row]
+        return {
+            "vehicle_id": vehicle_id,
+            "route_id": self.vehicles[vehicle_id].route_id,
+            "lat": float(self.lat[row]),
+            "lon": float(self.lon[row]),
+            "distance_m": round(float(self.pos[row]), 1),
+            "remaining_m": round(float(self.length[row] - self.pos[row]), 1),
+            "speed_kmh": round(float(self.speed[row] * 3.6), 1),
+            "arrived": bool(self.arrived[row]),
+            "preemption_active": vehicle_id in self.preempted,
+            "held_at_signal": self.held_at.get(vehicle_id),
+        }
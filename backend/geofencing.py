@@ -1,5 +1,8 @@
 import math
+import numpy as np
+from metrics import PREEMPTIONS
 from signal_model import trigger_preemption
+from spatial_index import SpatialIndex, EARTH_RADIUS_M
 
 def get_distance(lat1, lon1, lat2, lon2):
     #Distance in meters between two lat/lon points using Haversine.
@@ -14,15 +17,58 @@ def get_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     return R * c
 
-def check_geofence(current_lat, current_lon, signals, radius_m=300):
+def get_distances(lat, lon, lats, lons):
+    #Vectorized Haversine: meters from one point to arrays of points.
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(np.asarray(lons) - lon)
+    a = np.sin(delta_phi/2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda/2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+class SignalIndex:
+    """Signal coordinates as NumPy arrays plus a KD-tree over them.
+
+    Built once for a signal list; geofence queries then only look at the
+    signals inside the radius instead of computing a distance to all of them.
+    """
+    def __init__(self, signals):
+        self.signals = signals
+        self.lat = np.array([s["lat"] for s in signals], dtype=np.float64)
+        self.lon = np.array([s["lon"] for s in signals], dtype=np.float64)
+        self.index = SpatialIndex(np.arange(len(signals)), self.lat, self.lon)
+
+    def nearby(self, lat, lon, radius_m):
+        #Positions in the signal list within radius_m of one point.
+        return self.index.within(lat, lon, radius_m)
+
+    def nearby_many(self, lats, lons, radius_m):
+        #Per-position candidate lists for a batch of points, in one tree query.
+        return self.index.within_many(lats, lons, radius_m)
+
+def _preempt(signals, candidates):
+    preempted = 0
+    for i in sorted(candidates):
+        s = signals[i]
+        # Trigger preemption only if not already preempted
+        if s["state"] != "PREEMPTED_GREEN":
+            if trigger_preemption(s):
+                preempted += 1
+    PREEMPTIONS.observe(preempted, "geofence")
+    return preempted > 0
+
+def check_geofence(current_lat, current_lon, signals, radius_m=300, index=None):
     #Geofencing check: trigger preemption if signal < radius_m away.
-    preempted_trigger = False
-    for s in signals:
-        dist = get_distance(current_lat, current_lon, s["lat"], s["lon"])
-        if dist < radius_m: 
-            # Default 300m radius geofence
-            # Trigger preemption only if not already preempted
-            if s["state"] != "PREEMPTED_GREEN":
-                if trigger_preemption(s):
-                    preempted_trigger = True
-    return preempted_trigger
\ No newline at end of file
+    # Default 300m radius geofence
+    if index is not None:
+        return _preempt(signals, index.nearby(current_lat, current_lon, radius_m))
+    if not signals:
+        return False
+    lats = np.array([s["lat"] for s in signals], dtype=np.float64)
+    lons = np.array([s["lon"] for s in signals], dtype=np.float64)
+    dist = get_distances(current_lat, current_lon, lats, lons)
+    return _preempt(signals, np.flatnonzero(dist < radius_m).tolist())
+
+def check_geofence_batch(lats, lons, signals, index, radius_m=300):
+    #Check N ambulance positions against all signals; one flag per position.
+    return [_preempt(signals, candidates) for candidates in index.nearby_many(lats, lons, radius_m)]
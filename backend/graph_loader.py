@@ -1,34 +1,69 @@
+import os
 import osmnx as ox
 import networkx as nx
 import random
 import math
 
-def get_nearest_node(G, lat, lon):
-    return ox.distance.nearest_nodes(G, X=lon, Y=lat)
+from graph_snapshot import save_snapshot, load_snapshot, SnapshotError
+from spatial_index import SpatialIndex
+
+def build_node_index(G):
+    """Spatial index over node coordinates, stored on G for snapping."""
+    ids = list(G.nodes)
+    lats = [G.nodes[n].get('y', G.nodes[n].get('lat')) for n in ids]
+    lons = [G.nodes[n].get('x', G.nodes[n].get('lon')) for n in ids]
+    G.graph['node_index'] = SpatialIndex(ids, lats, lons)
+    return G.graph['node_index']
+
+def nearest_nodes(G, lats, lons):
+    """Batch snap: list of nearest node IDs for arrays of coordinates."""
+    index = G.graph.get('node_index')
+    if index is None:
+        index = build_node_index(G)
+    return index.nearest(lats, lons).tolist()
 
-def load_graph(place_name="Kochi, Kerala, India"):
-    
+def get_nearest_node(G, lat, lon):
+    # scalar in, scalar out; lists are snapped in one batch like ox.nearest_nodes
+    if isinstance(lat, (list, tuple)):
+        return nearest_nodes(G, lat, lon)
+    return nearest_nodes(G, [lat], [lon])[0]
 
+def download_graph(place_name="Kochi, Kerala, India", osm_file=None, cache_folder=None):
+    """Fetch the raw drive network from OSM, a local extract or the OSMnx cache.
 
+    `osm_file` builds from a local .osm/.xml extract without any network access.
+    `cache_folder` points OSMnx at a directory of saved Nominatim/Overpass
+    responses (e.g. the repo's `cache/*.json`) so they are replayed instead of
+    downloaded again.
+    """
     ox.settings.log_console = False
     ox.settings.use_cache = True
-    
+    if cache_folder is not None:
+        ox.settings.cache_folder = cache_folder
+
+    if osm_file is not None:
+        print(f"Building road network from OSM extract {osm_file}...")
+        return ox.graph_from_xml(osm_file, simplify=True)
+
     # Download drive network
     print(f"Downloading road network for {place_name}...")
     try:
         G = ox.graph_from_place(place_name, network_type='drive', simplify=True)
     except Exception as e:
         print(f"Failed to load {place_name}. Falling back to a smaller bbox (Ernakulam center). Error: {e}")
-        
+
         north, south, east, west = 10.0500, 9.9200, 76.3500, 76.2200
         G = ox.graph_from_bbox(bbox=(north, south, east, west), network_type='drive')
-    
+    return G
+
+def prepare_graph(G):
+    """Largest SCC, OSMnx speeds/travel times and our traffic attributes."""
     if G is None or len(G.nodes) == 0:
         raise RuntimeError("Failed to load graph data.")
 
-    
+
     print("Extracting largest strongly connected component...")
-   
+
     try:
         G = ox.utils_graph.get_largest_component(G, strongly=True)
     except AttributeError:
@@ -39,9 +74,9 @@ def load_graph(place_name="Kochi, Kerala, India"):
     G = ox.add_edge_speeds(G)
     G = ox.add_edge_travel_times(G)
 
-   
+
     for u, v, k, data in G.edges(keys=True, data=True):
-        
+
         base = None
         maxspeed = data.get('maxspeed')
         if isinstance(maxspeed, (list, tuple)) and maxspeed:
@@ -61,29 +96,34 @@ def load_graph(place_name="Kochi, Kerala, India"):
         # compute a matching travel time based on current speed
         length = data.get('length', 0.0)  # meters
         if base > 0:
-            data['current_travel_time'] = length / base * 3600
+            data['current_travel_time'] = length / base * 3.6
         else:
             data['current_travel_time'] = data.get('travel_time', 0)
     # === end traffic initialization ===
+    return G
 
-   
-    # randomly assign 200 intersections as traffic signals 
+def assign_signals(G, count=200):
+    """Randomly mark `count` intersections as traffic signals."""
+    # randomly assign 200 intersections as traffic signals
     nodes = list(G.nodes)
-    signal_nodes = random.sample(nodes, min(200, len(nodes)))
-    
+    signal_nodes = random.sample(nodes, min(count, len(nodes)))
+
     nx.set_node_attributes(G, False, 'is_signal')
     for n in signal_nodes:
         G.nodes[n]['is_signal'] = True
 
-   
+    return build_signals(G, signal_nodes)
+
+def build_signals(G, signal_nodes, timers=None):
+    """Create the signal dicts for `signal_nodes` (random initial timers by default)."""
     signals = []
     signal_id = 1
-    for n in signal_nodes:
-       
+    for i, n in enumerate(signal_nodes):
+
         node_attr = G.nodes[n]
         lat = node_attr.get('y', node_attr.get('lat'))
         lon = node_attr.get('x', node_attr.get('lon'))
-        
+
         if lat is None or lon is None:
             continue
 
@@ -93,10 +133,39 @@ def load_graph(place_name="Kochi, Kerala, India"):
             "lat": lat,
             "lon": lon,
             "state": "RED",
-            "timer": random.randint(10, 30),
+            "timer": timers[i] if timers is not None else random.randint(10, 30),
             "cycle": ["RED", "GREEN", "YELLOW"]
         })
         signal_id += 1
-        
+    return signals
+
+def build_graph(place_name="Kochi, Kerala, India", osm_file=None, cache_folder=None):
+    """Run the full OSMnx pipeline and return (G, signals)."""
+    G = download_graph(place_name, osm_file=osm_file, cache_folder=cache_folder)
+    G = prepare_graph(G)
+    signals = assign_signals(G)
     print(f"Graph loaded with {len(G.nodes)} nodes and {len(G.edges)} edges.")
     return G, signals
+
+def load_graph(place_name="Kochi, Kerala, India", snapshot_path=None, rebuild=False):
+    """Return (G, signals), preferring a prepared snapshot over the OSMnx pipeline.
+
+    When `snapshot_path` is given and valid it is loaded directly. Otherwise
+    the graph is built from OSM and, if a path was given, written back so the
+    next start (and every other worker) can skip the pipeline.
+    """
+    if snapshot_path and not rebuild and os.path.exists(snapshot_path):
+        try:
+            G, signals = load_snapshot(snapshot_path)
+            build_node_index(G)
+            print(f"Graph loaded from snapshot {snapshot_path} with {len(G.nodes)} nodes and {len(G.edges)} edges.")
+            return G, signals
+        except SnapshotError as e:
+            print(f"Ignoring snapshot {snapshot_path}: {e}. Rebuilding from OSM.")
+
+    G, signals = build_graph(place_name)
+    build_node_index(G)
+    if snapshot_path:
+        save_snapshot(G, signals, snapshot_path, place_name=place_name)
+        print(f"Wrote graph snapshot to {snapshot_path}.")
+    return G, signals
@@ -0,0 +1,250 @@
+"""Versioned binary snapshot of the fully prepared road graph.
+
+`load_graph()` normally runs the whole OSMnx pipeline (download, largest SCC,
+speeds, maxspeed parsing, signal assignment) on every start. The snapshot
+stores the result as flat NumPy arrays in a single `.npz` file so a worker can
+rebuild the MultiDiGraph in well under a second.
+
+Numeric edge attributes are float64 columns. The OSM tags (`osmid`, `name`,
+`highway`, `maxspeed`, ...; strings, numbers or lists after simplification)
+are kept as one JSON list per attribute, and missing values stay missing.
+Edge `geometry` LineStrings are not rebuilt: their points are stored as
+flat arrays and served by `G.graph['edge_shapes']` (route_geometry).
+
+Build it once with:
+
+    python graph_snapshot.py --out graph_snapshot.npz
+    python graph_snapshot.py --out graph_snapshot.npz --osm-file kochi.osm
+    python graph_snapshot.py --out graph_snapshot.npz --cache-folder ../cache
+"""
+import argparse
+import gc
+import hashlib
+import json
+import time
+import zipfile
+
+import networkx as nx
+import numpy as np
+
+from route_geometry import EdgeShapes, interior_points
+
+SNAPSHOT_FORMAT = "ambulance-graph"
+SNAPSHOT_VERSION = 4
+
+# edge attributes stored as float64 columns, in this order
+EDGE_FLOAT_ATTRS = [
+    'length',
+    'speed_kph',
+    'travel_time',
+    'base_speed_kph',
+    'current_speed_kph',
+    'current_travel_time',
+]
+# OSM tags stored as JSON, one list per attribute
+EDGE_TAG_ATTRS = ['osmid', 'name', 'highway', 'maxspeed', 'oneway', 'lanes', 'ref', 'reversed']
+NODE_TAG_ATTRS = ['street_count', 'highway', 'ref']
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing, corrupt or from another version."""
+
+
+def _checksum(arrays):
+    h = hashlib.sha256()
+    for name in sorted(arrays):
+        arr = np.ascontiguousarray(arrays[name])
+        h.update(name.encode())
+        h.update(str(arr.dtype).encode())
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def encode_tags(data, attrs):
+    """JSON bytes of {attr: [value or None per item]} for the attrs present."""
+    columns = {}
+    for attr in attrs:
+        column = [d.get(attr) for d in data]
+        if any(value is not None for value in column):
+            columns[attr] = column
+    return np.frombuffer(json.dumps(columns, default=_json_default).encode(), dtype=np.uint8)
+
+
+def decode_tags(blob):
+    # JSON has no tuples: tags that were tuples come back as lists
+    return json.loads(blob.tobytes().decode())
+
+
+def graph_to_arrays(G, signals):
+    """Flatten G and its signals into a dict of NumPy arrays."""
+    node_ids = list(G.nodes)
+    index = {n: i for i, n in enumerate(node_ids)}
+    node_data = [G.nodes[n] for n in node_ids]
+
+    edges = list(G.edges(keys=True, data=True))
+    arrays = {
+        'node_id': np.array(node_ids, dtype=np.int64),
+        'node_x': np.array([d.get('x', d.get('lon')) for d in node_data], dtype=np.float64),
+        'node_y': np.array([d.get('y', d.get('lat')) for d in node_data], dtype=np.float64),
+        'node_is_signal': np.array([bool(d.get('is_signal', False)) for d in node_data], dtype=np.bool_),
+        'edge_u': np.array([index[u] for u, _, _, _ in edges], dtype=np.int32),
+        'edge_v': np.array([index[v] for _, v, _, _ in edges], dtype=np.int32),
+        'edge_key': np.array([k for _, _, k, _ in edges], dtype=np.int32),
+        'signal_node': np.array([index[s["node_id"]] for s in signals], dtype=np.int32),
+        'signal_timer': np.array([s["timer"] for s in signals], dtype=np.int32),
+        'node_tags': encode_tags(node_data, NODE_TAG_ATTRS),
+        'edge_tags': encode_tags([d for _, _, _, d in edges], EDGE_TAG_ATTRS),
+    }
+    for attr in EDGE_FLOAT_ATTRS:
+        arrays['edge_' + attr] = np.array(
+            [d.get(attr, np.nan) for _, _, _, d in edges], dtype=np.float64
+        )
+
+    # road shapes: edge i bends through shape_x/y[offset[i]:offset[i + 1]]
+    shapes = G.graph.get('edge_shapes')
+    offsets = [0]
+    shape_x = []
+    shape_y = []
+    for u, v, k, d in edges:
+        points = shapes.get(u, v, k) if shapes is not None else interior_points(G, u, v, d)
+        shape_y.extend(lat for lat, _ in points)
+        shape_x.extend(lon for _, lon in points)
+        offsets.append(len(shape_x))
+    arrays['edge_shape_offset'] = np.array(offsets, dtype=np.int64)
+    arrays['shape_x'] = np.array(shape_x, dtype=np.float64)
+    arrays['shape_y'] = np.array(shape_y, dtype=np.float64)
+    return arrays
+
+
+def _with_tags(rows, tags):
+    # add each item's present tags to its attribute dict
+    for attr, column in tags.items():
+        for row, value in zip(rows, column):
+            if value is not None:
+                row[attr] = value
+    return rows
+
+
+def arrays_to_graph(arrays, crs="epsg:4326"):
+    """Rebuild the MultiDiGraph and signal list from snapshot arrays."""
+    from graph_loader import build_signals
+
+    G = nx.MultiDiGraph(crs=crs)
+    node_ids = arrays['node_id'].tolist()
+    columns = [arrays['edge_' + attr].tolist() for attr in EDGE_FLOAT_ATTRS]
+    # ~100k attribute dicts that all stay alive: pausing the GC while they
+    # are built and inserted saves most of the load time
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        node_attrs = _with_tags(
+            [
+                {'x': x, 'y': y, 'is_signal': s}
+                for x, y, s in zip(
+                    arrays['node_x'].tolist(),
+                    arrays['node_y'].tolist(),
+                    arrays['node_is_signal'].tolist(),
+                )
+            ],
+            decode_tags(arrays['node_tags']),
+        )
+        edge_attrs = _with_tags(
+            [dict(zip(EDGE_FLOAT_ATTRS, values)) for values in zip(*columns)],
+            decode_tags(arrays['edge_tags']),
+        )
+        G.add_nodes_from(zip(node_ids, node_attrs))
+        G.add_edges_from(
+            (node_ids[u], node_ids[v], k, data)
+            for u, v, k, data in zip(
+                arrays['edge_u'].tolist(),
+                arrays['edge_v'].tolist(),
+                arrays['edge_key'].tolist(),
+                edge_attrs,
+            )
+        )
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    G.graph['edge_shapes'] = EdgeShapes(
+        node_ids, arrays['edge_u'], arrays['edge_v'], arrays['edge_key'],
+        arrays['edge_shape_offset'], arrays['shape_y'], arrays['shape_x'],
+    )
+    signal_nodes = [node_ids[i] for i in arrays['signal_node'].tolist()]
+    signals = build_signals(G, signal_nodes, timers=arrays['signal_timer'].tolist())
+    return G, signals
+
+
+def save_snapshot(G, signals, path, place_name=None):
+    """Write G and its signals to `path` as a checksummed `.npz` file."""
+    arrays = graph_to_arrays(G, signals)
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'checksum': _checksum(arrays),
+        'place_name': place_name,
+        'crs': str(G.graph.get('crs', 'epsg:4326')),
+        'created': time.time(),
+        'nodes': len(G.nodes),
+        'edges': len(G.edges),
+    }
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+    # np.savez appends .npz to bare names, so open the file ourselves
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+    return meta
+
+
+def read_snapshot_arrays(path):
+    """Load, version-check and verify the arrays stored in a snapshot."""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        raise SnapshotError(f"cannot read snapshot: {e}")
+
+    if 'meta' not in arrays:
+        raise SnapshotError("snapshot has no metadata")
+    meta = json.loads(arrays.pop('meta').tobytes().decode())
+    if meta.get('format') != SNAPSHOT_FORMAT or meta.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError(
+            f"unsupported snapshot {meta.get('format')} v{meta.get('version')}, "
+            f"expected {SNAPSHOT_FORMAT} v{SNAPSHOT_VERSION}"
+        )
+    if _checksum(arrays) != meta.get('checksum'):
+        raise SnapshotError("checksum mismatch")
+    return arrays, meta
+
+
+def load_snapshot(path):
+    """Return (G, signals) from a snapshot written by `save_snapshot`."""
+    arrays, meta = read_snapshot_arrays(path)
+    return arrays_to_graph(arrays, crs=meta.get('crs', 'epsg:4326'))
+
+
+def main():
+    from graph_loader import build_graph
+
+    parser = argparse.ArgumentParser(description="Build the prepared road graph snapshot.")
+    parser.add_argument('--out', default='graph_snapshot.npz', help="snapshot file to write")
+    parser.add_argument('--place', default="Kochi, Kerala, India", help="OSM place name to download")
+    parser.add_argument('--osm-file', help="build from a local .osm/.xml extract instead of downloading")
+    parser.add_argument('--cache-folder', help="replay saved OSMnx responses from this folder (e.g. ../cache)")
+    args = parser.parse_args()
+
+    G, signals = build_graph(args.place, osm_file=args.osm_file, cache_folder=args.cache_folder)
+    meta = save_snapshot(G, signals, args.out, place_name=args.place)
+    print(f"Wrote {args.out}: {meta['nodes']} nodes, {meta['edges']} edges, sha256 {meta['checksum'][:12]}")
+
+
+if __name__ == "__main__":
+    main()
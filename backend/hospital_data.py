@@ -1,3 +1,8 @@
+import threading
+
+from spatial_index import SpatialIndex
+
+
 def get_hospitals():
     """
     Comprehensive list of hospitals in Ernakulam district, Kerala.
@@ -183,3 +188,104 @@ def filter_hospitals(hospitals, case_type):
             
         valid_hospitals.append(h)
     return valid_hospitals
+
+
+# case type -> capability it needs; other case types need none
+CASE_CAPABILITY = {
+    "trauma": "trauma",
+    "cardiac": "cardiac",
+    "stroke": "neuro",
+    "neuro": "neuro",
+    "burns": "burns",
+    "pediatric": "pediatric",
+}
+
+
+def _capabilities(h):
+    # same rules as filter_hospitals, evaluated once per hospital
+    caps = {c.lower() for c in h.get("capabilities", [])}
+    for cap in ("trauma", "cardiac"):
+        if not h.get(f"{cap}_capability", cap in caps):
+            caps.discard(cap)
+        else:
+            caps.add(cap)
+    return caps
+
+
+class HospitalRegistry:
+    """Hospitals indexed by capability and location, with live ICU bed counts.
+
+    Capabilities are parsed once into an inverted index (capability ->
+    hospital ids). For every case type the registry keeps the ready list
+    of capable hospitals that have ICU beds, in registry order, so a lookup
+    is a dict access. A bed update that makes a hospital full (or
+    available again) rebuilds only the lists that hospital belongs to and
+    swaps them in under a lock. Readers always get one consistent list and
+    routing stops offering a full ICU with the very next request.
+    """
+    def __init__(self, hospitals):
+        self.hospitals = hospitals
+        self.by_id = {h["id"]: h for h in hospitals}
+        self.order = {h["id"]: i for i, h in enumerate(hospitals)}
+        self.capable = {}        # capability -> set of hospital ids
+        for h in hospitals:
+            for cap in _capabilities(h):
+                self.capable.setdefault(cap, set()).add(h["id"])
+        self.beds = {h["id"]: h["icu_beds_available"] for h in hospitals}
+        self.version = 0
+        self._lock = threading.Lock()
+        self._available = {}     # capability (None = any) -> hospitals with beds
+        for cap in [None] + sorted(self.capable):
+            self._available[cap] = self._collect(cap)
+        self.index = SpatialIndex(
+            [h["id"] for h in hospitals], [h["lat"] for h in hospitals], [h["lon"] for h in hospitals]
+        )
+
+    def _collect(self, cap):
+        ids = self.by_id if cap is None else self.capable[cap]
+        return [
+            self.by_id[hid] for hid in sorted(ids, key=self.order.get) if self.beds[hid] > 0
+        ]
+
+    def candidates(self, case_type):
+        """Hospitals that can take case_type and have an ICU bed (same rules as filter_hospitals)."""
+        cap = CASE_CAPABILITY.get(case_type.lower()) if case_type else None
+        return self._available.get(cap, [])
+
+    def nearest(self, lat, lon, k=1, case_type=None):
+        """Up to k candidates for case_type by straight-line distance, nearest first."""
+        allowed = {h["id"] for h in self.candidates(case_type)} if case_type else None
+        found = []
+        for pos in self.index.nearest_k(lat, lon, len(self.hospitals)):
+            hid = self.index.ids[pos].item()
+            if allowed is None or hid in allowed:
+                found.append(self.by_id[hid])
+                if len(found) == k:
+                    break
+        return found
+
+    def update_beds(self, updates):
+        """Apply bed counts atomically; returns the updated hospitals.
+
+        updates is a list of (hospital_id, count, delta) where either an
+        absolute count or a relative delta (e.g. -1 per admission) is set.
+        Unknown ids raise KeyError before anything changes.
+        """
+        with self._lock:
+            for hid, _, _ in updates:
+                if hid not in self.by_id:
+                    raise KeyError(hid)
+            flipped = set()
+            for hid, count, delta in updates:
+                old = self.beds[hid]
+                new = max(0, (old if count is None else count) + (delta or 0))
+                self.beds[hid] = new
+                self.by_id[hid]["icu_beds_available"] = new
+                if (old > 0) != (new > 0):
+                    flipped.add(hid)
+            if flipped:
+                for cap in self._available:
+                    if cap is None or self.capable[cap] & flipped:
+                        self._available[cap] = self._collect(cap)
+            self.version += 1
+            return [self.by_id[hid] for hid, _, _ in updates]
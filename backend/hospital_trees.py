@@ -0,0 +1,128 @@
+"""Reverse shortest-path trees toward every hospital.
+
+There are only a couple of dozen hospitals, so for each one we keep the
+travel time from every road node to it (`dist`) and the next node to drive
+to (`next_hop`), as flat (hospitals x nodes) arrays. "Nearest capable
+hospital + route" from any node is then an argmin over a few entries plus
+an O(path length) walk.
+
+Trees are rebuilt in a background thread when traffic weights change. A
+build works on its own copy of the weights and is published by swapping a
+single reference, so a request always reads one complete, versioned set of
+trees and never a half-updated one.
+"""
+import threading
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from metrics import STAGE_SECONDS
+
+# csgraph drops explicit zeros, so zero-length edges get a tiny cost
+_MIN_WEIGHT = 1e-9
+
+
+class HospitalTrees:
+    def __init__(self, csr, hospital_nodes, weights, version):
+        """Build the trees; hospital_nodes maps hospital id -> OSM node."""
+        started = time.perf_counter()
+        self.version = version
+        self.node_ids = csr.node_ids
+        self.hospital_ids = list(hospital_nodes)
+        self.row = {hid: i for i, hid in enumerate(self.hospital_ids)}
+        sources = [csr.index[hospital_nodes[hid]] for hid in self.hospital_ids]
+
+        n = len(csr)
+        graph = csr_matrix(
+            (np.maximum(weights, _MIN_WEIGHT), csr.indices, csr.indptr), shape=(n, n)
+        )
+        # Dijkstra from each hospital over reversed arcs: dist[h, u] is the
+        # time from u to h, and the predecessor of u is its next hop toward h
+        dist, pred = dijkstra(graph.T.tocsr(), indices=sources, return_predecessors=True)
+        self.dist = dist
+        self.next_hop = pred.astype(np.int32)
+        STAGE_SECONDS.since(started, "hospital_trees")
+
+    def route(self, hospital_id, start_node_index):
+        """(route node IDs, travel time) from a node to one hospital, or None."""
+        row = self.row[hospital_id]
+        travel_time = self.dist[row, start_node_index]
+        if not np.isfinite(travel_time):
+            return None
+        hops = self.next_hop[row]
+        path = [start_node_index]
+        node = start_node_index
+        while hops[node] >= 0:
+            node = int(hops[node])
+            path.append(node)
+        return [self.node_ids[i] for i in path], float(travel_time)
+
+    def rank(self, start_node_index, hospital_ids, k=1):
+        """Up to k (hospital_id, route_nodes, travel_time), fastest first."""
+        ids = [hid for hid in hospital_ids if hid in self.row]
+        if not ids:
+            return []
+        times = self.dist[[self.row[hid] for hid in ids], start_node_index]
+        ranked = []
+        for i in np.argsort(times, kind='stable')[:k]:
+            result = self.route(ids[i], start_node_index)
+            if result is None:
+                break
+            ranked.append((ids[i], result[0], result[1]))
+        return ranked
+
+
+class HospitalTreeStore:
+    """Holds the latest trees and rebuilds them in the background."""
+
+    def __init__(self, csr, hospital_nodes):
+        self.csr = csr
+        self.hospital_nodes = dict(hospital_nodes)
+        self.current = None
+        self._lock = threading.Lock()
+        self._pending = None
+        self._worker = None
+
+    def get(self, version):
+        """The trees if they were built for `version`, else None."""
+        trees = self.current
+        if trees is not None and trees.version == version:
+            return trees
+        return None
+
+    def rebuild(self, version):
+        """Build synchronously from the current weights (used at startup)."""
+        self._publish(HospitalTrees(self.csr, self.hospital_nodes, self.csr.weights.copy(), version))
+
+    def request_rebuild(self, version):
+        """Schedule a background rebuild for the weights as of `version`.
+
+        Requests arriving while a build runs are coalesced: only the newest
+        weights are built next.
+        """
+        weights = self.csr.weights.copy()
+        with self._lock:
+            self._pending = (weights, version)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._pending is None:
+                    self._worker = None
+                    return
+                weights, version = self._pending
+                self._pending = None
+            try:
+                self._publish(HospitalTrees(self.csr, self.hospital_nodes, weights, version))
+            except Exception as e:
+                print(f"Hospital tree rebuild failed: {e}")
+
+    def _publish(self, trees):
+        current = self.current
+        if current is None or trees.version >= current.version:
+            self.current = trees
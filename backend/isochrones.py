@@ -0,0 +1,92 @@
+"""Isochrones: what each hospital can reach within a few minutes.
+
+One bounded Dijkstra from all hospitals at once (scipy's csgraph with a
+`limit`, so nodes beyond the largest threshold are never expanded) gives
+the travel time from every hospital to every road node on the
+current_travel_time weights. Every threshold (8, 15 and 30 minutes by
+default) is then a cut of that one (hospitals x nodes) array.
+
+Results are kept per traffic version: the first request after a traffic
+update recomputes, every other request reuses the arrays. The caller
+passes the weights together with their version, so a result is never
+labelled with a version its distances were not computed on. Polygons are
+the convex hull of the reached nodes, a coarse outline for the map that
+also covers water and land the ambulance cannot reach. The per-node reach
+times are the exact answer.
+"""
+import threading
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import ConvexHull, QhullError
+
+from hospital_trees import _MIN_WEIGHT
+from metrics import STAGE_SECONDS
+
+
+class Isochrones:
+    def __init__(self, csr, hospital_nodes, weights, version, limit_s):
+        """Reach times from every hospital, up to limit_s seconds."""
+        started = time.perf_counter()
+        self.version = version
+        self.limit_s = limit_s
+        self.csr = csr
+        self.hospital_ids = list(hospital_nodes)
+        self.row = {hid: i for i, hid in enumerate(self.hospital_ids)}
+        sources = [csr.index[hospital_nodes[hid]] for hid in self.hospital_ids]
+
+        n = len(csr)
+        graph = csr_matrix(
+            (np.maximum(weights, _MIN_WEIGHT), csr.indices, csr.indptr), shape=(n, n)
+        )
+        # dist[h, u]: time from hospital h out to node u, inf beyond the limit
+        self.dist = dijkstra(graph, indices=sources, limit=limit_s)
+        STAGE_SECONDS.since(started, "isochrones")
+        self._polygons = {}
+
+    def reach(self, hospital_id, limit_s):
+        """(node indexes, seconds) of the nodes reached within limit_s."""
+        times = self.dist[self.row[hospital_id]]
+        nodes = np.flatnonzero(times <= limit_s)
+        return nodes, times[nodes]
+
+    def polygon(self, hospital_id, limit_s):
+        """Convex hull of the reached nodes as [[lat, lon], ...]."""
+        key = (hospital_id, limit_s)
+        polygon = self._polygons.get(key)
+        if polygon is None:
+            nodes, _ = self.reach(hospital_id, limit_s)
+            points = np.column_stack((self.csr.lat[nodes], self.csr.lon[nodes])).astype(np.float64)
+            if len(points) >= 3:
+                try:
+                    points = points[ConvexHull(points).vertices]
+                except QhullError:
+                    pass  # all reached nodes on one line
+            polygon = self._polygons[key] = points.tolist()
+        return polygon
+
+
+class IsochroneStore:
+    """Latest isochrones, recomputed on demand when traffic moved on."""
+
+    def __init__(self, csr, hospital_nodes):
+        self.csr = csr
+        self.hospital_nodes = dict(hospital_nodes)
+        self.current = None
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    def get(self, weights, version, limit_s):
+        """Isochrones on `weights` (at `version`) covering at least limit_s seconds."""
+        with self._lock:
+            current = self.current
+            if current is None or current.version != version or current.limit_s < limit_s:
+                # keep the largest bound asked for at this version
+                if current is not None and current.version == version:
+                    limit_s = max(limit_s, current.limit_s)
+                current = Isochrones(self.csr, self.hospital_nodes, weights, version, limit_s)
+                self.current = current
+                self.builds += 1
+            return current
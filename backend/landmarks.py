@@ -0,0 +1,263 @@
+"""ALT routing: A*, Landmarks and the Triangle inequality, from both ends.
+
+A handful of landmarks is chosen once at load time by farthest selection
+(each new landmark is the node farthest, by travel time, from those
+already chosen), so they sit on the edges of the road network. For every
+landmark L we keep d(L, v) and d(v, L) for all nodes, from one scipy
+Dijkstra in each direction. By the triangle inequality both
+d(L, t) - d(L, v) and d(v, L) - d(t, L) are lower bounds on d(v, t). On
+roads these bounds are far tighter than a straight line at top speed,
+because they already know about rivers, one-way streets and congestion.
+
+Queries run a bidirectional A* with the average of the forward and the
+backward potential (Ikeda et al.). Both searches then see the same
+non-negative reduced costs, so the usual stopping rule (the two queue
+heads together reach the best meeting path) keeps the result exact.
+
+The distance arrays are only valid for the weights they were built on.
+After a traffic update the bounds are scaled by the smallest new/old
+weight ratio over all arcs, which keeps them admissible and consistent,
+until a background rebuild (coalesced like the hospital trees) publishes
+arrays for the new weights.
+"""
+import heapq
+import math
+import threading
+import time
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from hospital_trees import _MIN_WEIGHT
+from metrics import SEARCH_EXPANDED, SEARCH_SECONDS, STAGE_SECONDS
+
+# landmarks used per query: the ones giving the best bound between its ends
+ACTIVE_LANDMARKS = 4
+
+
+def _graph(csr, weights):
+    n = len(csr)
+    return csr_matrix((np.maximum(weights, _MIN_WEIGHT), csr.indices, csr.indptr), shape=(n, n))
+
+
+def choose_landmarks(graph, count, seed=0):
+    """Node indexes of up to `count` landmarks, by farthest selection."""
+    reverse = graph.T.tocsr()
+
+    def round_trip(node):
+        return dijkstra(graph, indices=node) + dijkstra(reverse, indices=node)
+
+    # start from the node farthest from an arbitrary one, not at it
+    score = round_trip(seed)
+    chosen = []
+    nearest = None
+    for _ in range(count):
+        node = int(np.argmax(np.where(np.isfinite(score), score, -1)))
+        if node in chosen:
+            break
+        chosen.append(node)
+        far = round_trip(node)
+        nearest = far if nearest is None else np.minimum(nearest, far)
+        score = nearest
+    return chosen
+
+
+class LandmarkDistances:
+    def __init__(self, csr, landmarks, weights, version):
+        """d(L, v) and d(v, L) for every landmark L on `weights`."""
+        started = time.perf_counter()
+        self.landmarks = list(landmarks)
+        self.weights = weights
+        self.version = version
+        graph = _graph(csr, weights)
+        # plain lists: the query reads them element by element
+        self.to_node = dijkstra(graph, indices=self.landmarks).tolist()
+        self.from_node = dijkstra(graph.T.tocsr(), indices=self.landmarks).tolist()
+        STAGE_SECONDS.since(started, "landmarks")
+
+    def active(self, source, target, k=ACTIVE_LANDMARKS):
+        """(to_node, from_node, ...) of the k landmarks with the best s-t bound.
+
+        None if some landmark cannot reach or be reached from either end, in
+        which case its bounds would mix infinities.
+        """
+        ranked = []
+        for to_node, from_node in zip(self.to_node, self.from_node):
+            ends = (to_node[target], from_node[target], to_node[source], from_node[source])
+            if not all(math.isfinite(d) for d in ends):
+                return None
+            bound = max(ends[0] - ends[2], ends[3] - ends[1])
+            ranked.append((bound, (to_node, from_node) + ends))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [landmark for _, landmark in ranked[:k]]
+
+
+def _scale(built, current):
+    """Largest factor f with f * built <= current on every arc (at most 1)."""
+    moving = built > 0
+    if not moving.any():
+        return 1.0
+    return min(1.0, float((current[moving] / built[moving]).min()))
+
+
+class LandmarkRouter:
+    """Exact point-to-point routes by bidirectional ALT over a CSRGraph."""
+
+    def __init__(self, csr, count=8, version=0):
+        started = time.perf_counter()
+        self.csr = csr
+        weights = csr.weights.copy()
+        self.landmarks = choose_landmarks(_graph(csr, weights), count)
+
+        # reverse adjacency: the arcs entering each node, as (tail, arc slot)
+        n = len(csr)
+        order = np.argsort(csr.indices, kind='stable')
+        tails = np.repeat(np.arange(n), np.diff(csr.indptr))
+        self._rev_indptr = np.concatenate(([0], np.cumsum(np.bincount(csr.indices, minlength=n)))).tolist()
+        self._rev_tails = tails[order].tolist()
+        self._rev_arcs = order.tolist()
+
+        distances = LandmarkDistances(csr, self.landmarks, weights, version)
+        # (distances, bound scale, weights list, weights array, version),
+        # swapped as one so a query never mixes versions
+        self._state = (distances, 1.0, csr._weights, csr.weights, version)
+        self._lock = threading.Lock()
+        self._pending = None
+        self._worker = None
+        STAGE_SECONDS.since(started, "landmarks_setup")
+
+    @property
+    def version(self):
+        return self._state[4]
+
+    @property
+    def distances_version(self):
+        return self._state[0].version
+
+    def on_weights_changed(self, version):
+        """Take the CSR graph's new weights; rebuild the distances in the background."""
+        weights, weights_array = self.csr._weights, self.csr.weights
+        with self._lock:
+            distances = self._state[0]
+            self._state = (distances, _scale(distances.weights, weights_array), weights, weights_array, version)
+            # requests arriving while a build runs are coalesced
+            self._pending = (weights_array.copy(), version)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._pending is None:
+                    self._worker = None
+                    return
+                weights, version = self._pending
+                self._pending = None
+            try:
+                distances = LandmarkDistances(self.csr, self.landmarks, weights, version)
+            except Exception as e:
+                print(f"Landmark rebuild failed: {e}")
+                continue
+            with self._lock:
+                _, _, current, current_array, current_version = self._state
+                self._state = (distances, _scale(weights, current_array), current, current_array, current_version)
+
+    def query(self, start_node, end_node):
+        """(route node IDs, travel time in seconds), same answer as CSRGraph.astar."""
+        started = time.perf_counter()
+        csr = self.csr
+        source = csr._node_index(start_node)
+        target = csr._node_index(end_node)
+        if source == target:
+            return [start_node], 0
+        distances, scale, weights, _, _ = self._state
+        active = distances.active(source, target)
+        if active is None or scale <= 0:
+            return csr.astar(start_node, end_node)
+
+        half = scale / 2
+        potentials = {}
+
+        def potential(v):
+            # half of (lower bound to target - lower bound from source)
+            p = potentials.get(v)
+            if p is None:
+                to_target = from_source = 0.0
+                for to_node, from_node, to_t, from_t, to_s, from_s in active:
+                    dv = to_node[v]
+                    fv = from_node[v]
+                    if to_t - dv > to_target:
+                        to_target = to_t - dv
+                    if fv - from_t > to_target:
+                        to_target = fv - from_t
+                    if dv - to_s > from_source:
+                        from_source = dv - to_s
+                    if from_s - fv > from_source:
+                        from_source = from_s - fv
+                p = potentials[v] = half * (to_target - from_source)
+            return p
+
+        indptr, indices = csr._indptr, csr._indices
+        rev_indptr, rev_tails, rev_arcs = self._rev_indptr, self._rev_tails, self._rev_arcs
+        push, pop = heapq.heappush, heapq.heappop
+
+        dist_f = {source: 0}
+        dist_r = {target: 0}
+        parents_f = {source: None}
+        parents_r = {target: None}
+        settled_f = set()
+        settled_r = set()
+        queue_f = [(potential(source), source)]
+        queue_r = [(-potential(target), target)]
+        best = math.inf
+        meet = None
+        while queue_f and queue_r:
+            if queue_f[0][0] + queue_r[0][0] >= best:
+                break
+            if queue_f[0][0] <= queue_r[0][0]:
+                _, u = pop(queue_f)
+                if u in settled_f:
+                    continue
+                settled_f.add(u)
+                du = dist_f[u]
+                for i in range(indptr[u], indptr[u + 1]):
+                    v = indices[i]
+                    nd = du + weights[i]
+                    if v not in dist_f or nd < dist_f[v]:
+                        dist_f[v] = nd
+                        parents_f[v] = u
+                        push(queue_f, (nd + potential(v), v))
+                        if v in dist_r and nd + dist_r[v] < best:
+                            best = nd + dist_r[v]
+                            meet = v
+            else:
+                _, u = pop(queue_r)
+                if u in settled_r:
+                    continue
+                settled_r.add(u)
+                du = dist_r[u]
+                for j in range(rev_indptr[u], rev_indptr[u + 1]):
+                    v = rev_tails[j]
+                    nd = du + weights[rev_arcs[j]]
+                    if v not in dist_r or nd < dist_r[v]:
+                        dist_r[v] = nd
+                        parents_r[v] = u
+                        push(queue_r, (nd - potential(v), v))
+                        if v in dist_f and dist_f[v] + nd < best:
+                            best = dist_f[v] + nd
+                            meet = v
+
+        SEARCH_SECONDS.since(started, "alt", "bidirectional")
+        SEARCH_EXPANDED.observe(len(settled_f) + len(settled_r), "alt", "bidirectional")
+        if meet is None:
+            raise nx.NetworkXNoPath(f"Node {end_node} not reachable from {start_node}")
+
+        path = csr._path(parents_f, meet)
+        node = parents_r[meet]
+        while node is not None:
+            path.append(csr.node_ids[node])
+            node = parents_r[node]
+        return path, best
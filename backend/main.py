@@ -1,20 +1,54 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import Optional
 import uvicorn
+import os
+import secrets
+import asyncio
+import bisect
 import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
 import httpx
 
 from contextlib import asynccontextmanager
 
 from graph_loader import load_graph, get_nearest_node
-from hospital_data import filter_hospitals
-from routing import calculate_route_astar, calculate_route_dijkstra
-from signal_model import update_signals
-from simulation import simulate_step
+from hospital_data import HospitalRegistry
+from routing import (
+    calculate_route_astar,
+    calculate_route_dijkstra,
+    calculate_routes_to_targets,
+    calculate_route_time_dependent,
+    calculate_routes_to_targets_time_dependent,
+)
+from csr_graph import CSRGraph
+from contraction import ContractionHierarchy
+from landmarks import LandmarkRouter
+from hospital_trees import HospitalTreeStore
+from isochrones import IsochroneStore
+from signal_model import SignalController
+from signal_delay import SignalDelays
+from simulation import simulate_step, RouteCorridor
+from geofencing import SignalIndex
+from speed_profiles import load_speed_profiles, SpeedProfileError
+from route_cache import RouteCache
+from route_pool import RoutePool, PoolBusy, worker_route, worker_rank, worker_batch
+from batch_routing import ArrowEncoder, chunked, expand, group
+from fleet import Fleet
+from replanner import Replanner
+from push import EventStreamGZip, PushHub, parse_bbox, encode, sse_event
+from metrics import REGISTRY, ERRORS, REPLANS, SEARCH_FALLBACKS, STAGE_SECONDS, MetricsMiddleware
+from profiler import SamplingProfiler
+from route_geometry import FORMATS, route_points
+from fast_json import FastJSONResponse, dumps
 
 # traffic utilities for demo
-from traffic import randomize_traffic, get_route_traffic, get_overall_traffic
+from traffic import TrafficModel, get_route_traffic
 
 app = FastAPI(title="Intelligent Ambulance Routing")
 
@@ -26,32 +60,224 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prepared graph snapshot; built on first start if missing (see graph_snapshot.py)
+SNAPSHOT_PATH = os.environ.get("GRAPH_SNAPSHOT", "graph_snapshot.npz")
+REBUILD_SNAPSHOT = os.environ.get("GRAPH_SNAPSHOT_REBUILD", "0") == "1"
+
+# Background traffic tick, independent of ambulance steps: every
+# TRAFFIC_TICK_S seconds re-draw the speed of TRAFFIC_TICK_FRACTION of edges
+TRAFFIC_TICK_S = float(os.environ.get("TRAFFIC_TICK_S", "5"))
+TRAFFIC_TICK_FRACTION = float(os.environ.get("TRAFFIC_TICK_FRACTION", "0.02"))
+
+# Routing engine: "csr" (array-backed, default), "ch" (customizable
+# contraction hierarchy on top of csr), "alt" (landmark bounds with
+# bidirectional A* on top of csr) or "networkx"
+ROUTING_ENGINE = os.environ.get("ROUTING_ENGINE", "csr")
+# Landmarks chosen at startup for the "alt" engine
+ALT_LANDMARKS = int(os.environ.get("ALT_LANDMARKS", "8"))
+
+# Optional CSV/Parquet of historical speeds by time of day; enables
+# time-dependent routing for requests that give a departure time
+SPEED_PROFILES_PATH = os.environ.get("SPEED_PROFILES")
+
+# Computed routes per (start, end) and weight version; size 0 disables
+ROUTE_CACHE_SIZE = int(os.environ.get("ROUTE_CACHE_SIZE", "4096"))
+ROUTE_CACHE_TTL_S = float(os.environ.get("ROUTE_CACHE_TTL_S", "300"))
+
+# CSR searches run in this many worker processes (0 = on a thread in this
+# process); at most ROUTE_MAX_PENDING may be queued, each for ROUTE_DEADLINE_S
+ROUTE_WORKERS = int(os.environ.get("ROUTE_WORKERS", str(min(4, max(1, (os.cpu_count() or 2) - 1)))))
+ROUTE_MAX_PENDING = int(os.environ.get("ROUTE_MAX_PENDING", "64"))
+ROUTE_DEADLINE_S = float(os.environ.get("ROUTE_DEADLINE_S", "10"))
+
+# Registered ambulances all advance together every FLEET_TICK_S seconds
+FLEET_TICK_S = float(os.environ.get("FLEET_TICK_S", "1"))
+
+# En-route fleet vehicles are re-planned every REPLAN_INTERVAL_S after a
+# traffic change (0 disables) and switch routes only if the ETA drops by
+# more than REPLAN_MIN_GAIN_S; detours are looked for within
+# REPLAN_CORRIDOR_M of the route
+REPLAN_INTERVAL_S = float(os.environ.get("REPLAN_INTERVAL_S", "2"))
+REPLAN_MIN_GAIN_S = float(os.environ.get("REPLAN_MIN_GAIN_S", "30"))
+REPLAN_CORRIDOR_M = float(os.environ.get("REPLAN_CORRIDOR_M", "1000"))
+
+# Signal/vehicle deltas are pushed to /ws and /events subscribers every
+# PUSH_INTERVAL_S; idle streams get a keepalive every PUSH_KEEPALIVE_S
+PUSH_INTERVAL_S = float(os.environ.get("PUSH_INTERVAL_S", "0.5"))
+PUSH_KEEPALIVE_S = float(os.environ.get("PUSH_KEEPALIVE_S", "15"))
+
+# Opt-in sampling profiler. /debug/profiler (read it, switch it at
+# runtime) is only served with DEBUG_TOKEN set, to callers sending it in
+# the X-Debug-Token header
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") == "1"
+PROFILER_INTERVAL_MS = float(os.environ.get("PROFILER_INTERVAL_MS", "10"))
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN")
+
+# Responses of at least GZIP_MIN_BYTES are gzipped for clients that accept
+# it, at GZIP_LEVEL (1 fastest .. 9 smallest); event streams stay plain
+GZIP_MIN_BYTES = int(os.environ.get("GZIP_MIN_BYTES", "1000"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "5"))
+
+# Default isochrone thresholds (minutes) for GET /isochrones
+ISOCHRONE_MINUTES = os.environ.get("ISOCHRONE_MINUTES", "8,15,30")
+# Largest threshold a request may ask for (bounds the search)
+ISOCHRONE_MAX_MINUTES = float(os.environ.get("ISOCHRONE_MAX_MINUTES", "120"))
+
 # Global state
 G = None
+csr = None
+ch = None
+alt = None  # landmark router (ROUTING_ENGINE=alt)
 signals = []
+signal_index = None     # KD-tree over signal positions for geofencing
+signals_by_node = {}    # road node -> signal
+corridors = OrderedDict()  # route_id -> RouteCorridor, oldest first
+corridors_lock = threading.Lock()  # threadpool handlers and the loop share it
+MAX_CORRIDORS = 1000
 hospitals = []
+hospital_nodes = {}     # hospital id -> snapped road node
+hospital_registry = None  # capability/bed index over hospitals (HospitalRegistry)
+hospital_trees = None   # reverse shortest-path trees (csr/ch engines)
+isochrones = None       # hospital reach times per traffic version (csr/ch engines)
+traffic_model = None    # TrafficModel owning current edge speeds
+traffic_version = 0     # weight version the routing engines have applied
+speed_profiles = None   # SpeedProfiles when SPEED_PROFILES is set
+route_cache = RouteCache(ROUTE_CACHE_SIZE, ROUTE_CACHE_TTL_S)
+route_pool = RoutePool()  # replaced at startup once the CSR graph exists
+fleet = None            # server-side ambulances (Fleet)
+replanner = None        # incremental re-planning of fleet trips (csr engines)
+push_hub = None         # delta push to WebSocket/SSE subscribers
+signal_controller = None  # time-driven signal phases (SignalController)
+_signal_view = None     # (controller changes, signal fields, JSON body) of the last build
+profiler = SamplingProfiler(PROFILER_INTERVAL_MS / 1000)
+signal_delays = None    # per-signal wait model for green-wave routing (csr/ch engines)
 
 class RouteRequest(BaseModel):
     start_lat: float
     start_lon: float
     case_type: str
+    top_k: int = 3
+    # route to this hospital instead of ranking the capable ones
+    hospital_id: Optional[int] = None
+    # seconds since local midnight; routes with historical speed profiles
+    departure_s: Optional[float] = None
+    # add the expected wait at signals on arrival (csr/ch engines only);
+    # preemption=False costs full red phases, e.g. for non-emergency trips
+    green_wave: bool = False
+    preemption: bool = True
+    # route geometry along the road shapes: "coords" ([[lat, lon], ...] in
+    # "route"), "polyline" (Google encoded, "route_polyline") or "float32"
+    # (base64 little-endian lat/lon pairs, "route_f32")
+    geometry: str = "coords"
+
+class BatchRouteRequest(BaseModel):
+    # [[lat, lon], ...]: ambulance bases, incident grid points, ...
+    origins: list
+    # [[lat, lon], ...]; defaults to the hospitals (capable of case_type if given)
+    destinations: Optional[list] = None
+    case_type: Optional[str] = None
+    # only the top_k fastest destinations per origin (1 = nearest), else all
+    top_k: Optional[int] = None
+    # seconds since local midnight; routes with historical speed profiles
+    departure_s: Optional[float] = None
+    include_routes: bool = False
+    # "ndjson" (one JSON row per line) or "arrow" (IPC stream, needs pyarrow)
+    format: str = "ndjson"
+
+class BedUpdate(BaseModel):
+    # absolute free ICU beds, or a change such as -1 for an admission
+    icu_beds_available: Optional[int] = None
+    delta: Optional[int] = None
+    hospital_id: Optional[int] = None   # bulk updates only
+
+class BedUpdateBatch(BaseModel):
+    updates: list[BedUpdate]
 
 class SimulationStepRequest(BaseModel):
-    current_lat: float
-    current_lon: float
-    route: list
-    speed_kmh: float
+    # registered fleet vehicle; the server moves it, nothing else is needed
+    vehicle_id: Optional[str] = None
+    # client-driven ambulances report their own position instead
+    current_lat: Optional[float] = None
+    current_lon: Optional[float] = None
+    route: Optional[list] = None
+    speed_kmh: float = 60
+    # returned by /route; enables on-route signal preemption
+    route_id: Optional[str] = None
+    # clients on the push channel already have the signal states
+    include_signals: bool = True
+
+class VehicleRequest(BaseModel):
+    # returned by /route
+    route_id: str
+    speed_kmh: float = 60
+    vehicle_id: Optional[str] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global G, signals, hospitals
+    global G, csr, ch, alt, signal_delays, traffic_model, speed_profiles, route_pool, fleet, replanner, push_hub, signal_controller, signals, signal_index, signals_by_node, hospitals, hospital_registry, hospital_nodes, hospital_trees, isochrones
     print("Loading graph data for Kerala (Kochi region)...")
-    G, signals = load_graph()
+    G, signals = load_graph(snapshot_path=SNAPSHOT_PATH, rebuild=REBUILD_SNAPSHOT)
+    signal_index = SignalIndex(signals)
+    signal_controller = SignalController(signals)
+    signals_by_node = {s["node_id"]: s for s in signals}
+    if ROUTING_ENGINE in ("csr", "ch", "alt"):
+        csr = CSRGraph(G)
+        print(f"Built CSR routing graph with {len(csr)} nodes and {csr.num_edges} arcs.")
+        signal_delays = SignalDelays(csr, signals, signal_controller)
+    if ROUTING_ENGINE == "ch":
+        ch = ContractionHierarchy(csr)
+        print(f"Built contraction hierarchy with {ch.num_arcs} arcs and {ch.num_triangles} triangles.")
+    if ROUTING_ENGINE == "alt":
+        alt = LandmarkRouter(csr, ALT_LANDMARKS, traffic_version)
+        print(f"Chose {len(alt.landmarks)} routing landmarks.")
     
     from hospital_data import get_hospitals
     hospitals = get_hospitals()
+    hospital_registry = HospitalRegistry(hospitals)
+    snapped = get_nearest_node(G, [h["lat"] for h in hospitals], [h["lon"] for h in hospitals])
+    hospital_nodes = {h["id"]: node for h, node in zip(hospitals, snapped)}
+    if csr is not None:
+        hospital_trees = HospitalTreeStore(csr, hospital_nodes)
+        hospital_trees.rebuild(traffic_version)
+        isochrones = IsochroneStore(csr, hospital_nodes)
     print(f"Loaded {len(hospitals)} hospitals and {len(signals)} signals.")
+
+    if SPEED_PROFILES_PATH:
+        try:
+            speed_profiles = load_speed_profiles(G, SPEED_PROFILES_PATH)
+        except SpeedProfileError as e:
+            print(f"Time-dependent routing disabled: {e}")
+    traffic_model = TrafficModel(G)
+    if csr is not None:
+        csr.bind_edges(traffic_model.edges)
+    traffic_model.add_listener(on_traffic_change)
+
+    # the CH and ALT answer in-process; plain CSR searches go to worker processes
+    route_pool = RoutePool(
+        csr if ch is None and alt is None else None, ROUTE_WORKERS, ROUTE_MAX_PENDING, ROUTE_DEADLINE_S
+    )
+    route_pool.warm()
+    if route_pool.workers:
+        print(f"Routing on {route_pool.workers} worker processes.")
+    fleet = Fleet(signals)
+    if csr is not None:
+        replanner = Replanner(csr, REPLAN_MIN_GAIN_S, REPLAN_CORRIDOR_M)
+    push_hub = PushHub(signals, fleet)
+    tasks = [asyncio.create_task(push_loop())]
+    if TRAFFIC_TICK_S > 0:
+        tasks.append(asyncio.create_task(traffic_loop()))
+    if FLEET_TICK_S > 0:
+        tasks.append(asyncio.create_task(fleet_loop()))
+    if replanner is not None and REPLAN_INTERVAL_S > 0:
+        tasks.append(asyncio.create_task(replan_loop()))
+    if PROFILER_ENABLED:
+        profiler.start()
     yield
+    for task in tasks:
+        task.cancel()
+    profiler.stop()
+    signal_controller.close()
+    route_pool.close()
 
 app = FastAPI(title="Intelligent Ambulance Routing", lifespan=lifespan)
 
@@ -62,6 +288,311 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(EventStreamGZip, paths=("/events",), minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_LEVEL)
+
+def on_traffic_change(changed_edges, version):
+    """Keep the routing engines in sync with a traffic delta."""
+    global traffic_version
+    faster = True
+    if csr is not None:
+        faster = csr.update_edge_weights(changed_edges, traffic_model.travel_time, version)
+        route_pool.publish(csr.weights, version)
+    if ch is not None:
+        # cheap re-customization; the hierarchy's topology is metric-independent
+        ch.customize(csr.weights)
+    if alt is not None:
+        # bounds are scaled down at once, landmark distances rebuilt in the background
+        alt.on_weights_changed(version)
+    traffic_version = version
+    # slowdowns only invalidate cached routes over the changed edges
+    edges = traffic_model.edges
+    route_cache.on_weights_changed(
+        version, None if faster else [edges[i][:2] for i in changed_edges.tolist()]
+    )
+    if hospital_trees is not None:
+        hospital_trees.request_rebuild(version)
+
+async def traffic_loop():
+    """Traffic ticks on their own schedule, decoupled from /simulate/step."""
+    while True:
+        await asyncio.sleep(TRAFFIC_TICK_S)
+        try:
+            await asyncio.to_thread(traffic_model.tick, TRAFFIC_TICK_FRACTION)
+        except Exception as e:
+            ERRORS.inc("traffic_tick")
+            print(f"Traffic tick failed: {e}")
+
+async def run_search(fn, *args, in_worker=False):
+    """Await a search off the event loop; busy/deadline map to 503/504."""
+    try:
+        if in_worker:
+            return await route_pool.run_in_worker(fn, *args)
+        return await route_pool.run_in_thread(fn, *args)
+    except PoolBusy:
+        ERRORS.inc("pool_busy")
+        raise HTTPException(status_code=503, detail="Routing queue is full, retry shortly.",
+                            headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        ERRORS.inc("deadline")
+        raise HTTPException(status_code=504, detail="Routing deadline exceeded.")
+
+async def fleet_loop():
+    """Advance every registered ambulance in one batched tick."""
+    loop = asyncio.get_running_loop()
+    last = loop.time()
+    while True:
+        await asyncio.sleep(FLEET_TICK_S)
+        now = loop.time()
+        try:
+            if len(fleet):
+                started = time.perf_counter()
+                signal_controller.advance()
+                fleet.tick(now - last)
+                STAGE_SECONDS.since(started, "fleet_tick")
+        except Exception as e:
+            ERRORS.inc("fleet_tick")
+            print(f"Fleet tick failed: {e}")
+        last = now
+
+async def replan_loop():
+    """Repair en-route trips' plans after traffic changes."""
+    planned = traffic_version
+    while True:
+        await asyncio.sleep(REPLAN_INTERVAL_S)
+        if traffic_version == planned:
+            continue
+        planned = traffic_version
+        try:
+            started = time.perf_counter()
+            # search in a worker thread, hand the routes over on the loop
+            apply_reroutes(await asyncio.to_thread(replan_trips))
+            STAGE_SECONDS.since(started, "replan")
+        except Exception as e:
+            ERRORS.inc("replan")
+            print(f"Replanning failed: {e}")
+
+def replan_trips():
+    """Faster routes traffic opened up for fleet vehicles.
+
+    Returns (vehicle id, new RouteCorridor, vertex, new ETA, current ETA)
+    per vehicle to move; the caller registers and hands them over.
+    """
+    trips = fleet.trips()
+    replanner.retain(vehicle_id for vehicle_id, _, _ in trips)
+    rerouted = []
+    for vehicle_id, corridor, distance_m in trips:
+        # the vehicle is driving toward route vertex `vertex`
+        vertex = bisect.bisect_right(corridor.dist_along, distance_m)
+        if vertex >= len(corridor.nodes):
+            continue
+        route = [csr.index[n] for n in corridor.nodes]
+        found = replanner.replan(vehicle_id, route, vertex)
+        if found is None:
+            continue
+        path, eta, current = found
+        nodes = corridor.nodes[vertex - 1:vertex] + [csr.node_ids[i] for i in path]
+        rerouted.append((vehicle_id, RouteCorridor(G, nodes, signals_by_node), vertex, eta, current))
+    return rerouted
+
+def apply_reroutes(rerouted):
+    """Register the corridors from replan_trips and move the vehicles onto them."""
+    for vehicle_id, corridor, vertex, eta, current in rerouted:
+        route_id = register_corridor(corridor.nodes, corridor)
+        if fleet.reroute(vehicle_id, corridor, route_id, vertex):
+            REPLANS.inc("pushed")
+            print(f"Rerouted {vehicle_id}: {current:.0f}s -> {eta:.0f}s to the hospital.")
+
+async def push_loop():
+    """Publish signal/vehicle deltas to push subscribers."""
+    while True:
+        await asyncio.sleep(PUSH_INTERVAL_S)
+        try:
+            if push_hub.subscribers:
+                started = time.perf_counter()
+                signal_controller.advance()
+                push_hub.publish()
+                STAGE_SECONDS.since(started, "push_publish")
+        except Exception as e:
+            ERRORS.inc("push_publish")
+            print(f"Push publish failed: {e}")
+
+async def compute_route(start_node, end_node):
+    """Cached A* with the configured engine, falling back to Dijkstra."""
+    version = traffic_version
+    cached = route_cache.get((start_node, end_node), version)
+    if cached is not None:
+        return cached
+    if route_pool.workers:
+        result, version = await run_search(worker_route, start_node, end_node, in_worker=True)
+    else:
+        result = await run_search(search_route, start_node, end_node)
+    route_cache.put((start_node, end_node), version, result, [result[0]])
+    return result
+
+def search_route(start_node, end_node):
+    try:
+        if ch is not None:
+            return ch.query(start_node, end_node)
+        if alt is not None:
+            return alt.query(start_node, end_node)
+        if csr is not None:
+            return csr.astar(start_node, end_node)
+        traffic_model.sync_graph()
+        return calculate_route_astar(G, start_node, end_node)
+    except Exception as e:
+        # Failsafe Mode fallback to Dijkstra
+        SEARCH_FALLBACKS.inc(ROUTING_ENGINE)
+        print(f"A* failed: {e}. Falling back to Dijkstra.")
+        if csr is not None:
+            return csr.dijkstra(start_node, end_node)
+        return calculate_route_dijkstra(G, start_node, end_node)
+
+def search_targets(start_node, by_node, top_k):
+    if csr is not None:
+        return csr.dijkstra_to_targets(start_node, by_node, k=top_k)
+    traffic_model.sync_graph()
+    return calculate_routes_to_targets(G, start_node, by_node, k=top_k)
+
+def time_dependent_routes(start_node, ranked, departure_s):
+    """Re-route ranked candidates by historical speeds at departure_s, fastest first."""
+    rerouted = []
+    for h, route_nodes, travel_time in ranked:
+        try:
+            route_nodes, travel_time = calculate_route_time_dependent(
+                G, start_node, hospital_nodes[h["id"]], speed_profiles, departure_s
+            )
+        except Exception as e:
+            ERRORS.inc("time_dependent")
+            print(f"Time-dependent routing failed: {e}. Keeping current-traffic route.")
+        rerouted.append((h, route_nodes, travel_time))
+    rerouted.sort(key=lambda item: item[2])
+    return rerouted
+
+def green_wave_routes(start_node, ranked, preemption):
+    """Re-route ranked candidates with the expected wait at each signal, fastest first."""
+    # signals another vehicle holds stay red for us until its window ends
+    blocked = {}
+    for pos in list(fleet.holders):
+        until = signal_controller.preempted_until[pos]
+        if until is not None:
+            blocked[pos] = until
+    wait = signal_delays.wait_function(preemption=preemption, blocked=blocked)
+    rerouted = []
+    for h, route_nodes, travel_time in ranked:
+        try:
+            route_nodes, travel_time = csr.astar_with_waits(
+                start_node, hospital_nodes[h["id"]], signal_delays.row_of, wait
+            )
+        except Exception as e:
+            ERRORS.inc("green_wave")
+            print(f"Green-wave routing failed: {e}. Keeping current-traffic route.")
+        rerouted.append((h, route_nodes, travel_time))
+    rerouted.sort(key=lambda item: item[2])
+    return rerouted
+
+def batch_chunk(origin_nodes, targets, k, with_routes, departure_s=None):
+    """In-process counterpart of route_pool.worker_batch."""
+    results = []
+    for origin in origin_nodes:
+        if departure_s is not None:
+            found = calculate_routes_to_targets_time_dependent(
+                G, origin, targets, speed_profiles, departure_s, k=k
+            )
+        else:
+            found = search_targets(origin, targets, k)
+        if not with_routes:
+            found = [(node, travel_time, None) for node, travel_time, _ in found]
+        results.append(found)
+    return results
+
+async def run_batch(chunks, targets, k, with_routes, departure_s=None):
+    """Yield (chunk, results per origin) as chunks finish, one per worker in flight."""
+    in_worker = departure_s is None and route_pool.workers > 0
+    todo = iter(chunks)
+    running = {}
+
+    def start():
+        chunk = next(todo, None)
+        if chunk is None:
+            return
+        if in_worker:
+            coro = route_pool.run_in_worker(worker_batch, chunk, targets, k, with_routes)
+        else:
+            coro = route_pool.run_in_thread(batch_chunk, chunk, targets, k, with_routes, departure_s)
+        running[asyncio.ensure_future(coro)] = chunk
+
+    for _ in range(max(1, route_pool.workers)):
+        start()
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                chunk = running.pop(task)
+                results = task.result()
+                yield chunk, results[0] if in_worker else results
+                start()
+    finally:
+        for task in running:
+            task.cancel()
+
+def register_corridor(route_nodes, corridor=None):
+    """Precompute the on-route signals for a new route; returns its id."""
+    if corridor is None:
+        corridor = RouteCorridor(G, route_nodes, signals_by_node)
+    route_id = uuid.uuid4().hex
+    with corridors_lock:
+        corridors[route_id] = corridor
+        while len(corridors) > MAX_CORRIDORS:
+            corridors.popitem(last=False)
+    return route_id
+
+def get_corridor(route_id):
+    with corridors_lock:
+        return corridors.get(route_id)
+
+async def rank_hospitals(start_node, case_type, top_k=1):
+    """Capable hospitals ranked by real travel time from start_node.
+
+    When the reverse hospital trees are current this is a lookup plus a
+    walk along the next hops. Otherwise one bounded Dijkstra from the
+    ambulance settles the hospital nodes in order of current_travel_time.
+    Returns up to top_k (hospital, route_nodes, travel_time) tuples,
+    fastest first.
+    """
+    valid_hospitals = hospital_registry.candidates(case_type)
+    if not valid_hospitals:
+        # Failsafe Mode: If no capable hospital available, just return nearest general hospital
+        valid_hospitals = hospitals
+    if not valid_hospitals:
+        return []
+
+    trees = hospital_trees.get(traffic_version) if hospital_trees is not None else None
+    if trees is not None:
+        by_id = {h["id"]: h for h in valid_hospitals}
+        ranked = trees.rank(csr.index[start_node], list(by_id), k=top_k)
+        return [(by_id[hid], route_nodes, travel_time) for hid, route_nodes, travel_time in ranked]
+
+    # several hospitals can snap to the same road node
+    by_node = {}
+    for h in valid_hospitals:
+        by_node.setdefault(hospital_nodes[h["id"]], []).append(h)
+
+    key = (start_node, ("rank", tuple(by_node), top_k))
+    version = traffic_version
+    results = route_cache.get(key, version)
+    if results is None:
+        if route_pool.workers:
+            results, version = await run_search(worker_rank, start_node, list(by_node), top_k, in_worker=True)
+        else:
+            results = await run_search(search_targets, start_node, by_node, top_k)
+        route_cache.put(key, version, results, [route_nodes for _, _, route_nodes in results])
+
+    ranked = []
+    for node, travel_time, route_nodes in results:
+        for h in by_node[node]:
+            ranked.append((h, route_nodes, travel_time))
+    return ranked[:top_k]
 
 @app.get("/")
 def read_root():
@@ -71,7 +602,7 @@ def read_root():
 def get_graph_status():
     if G is None:
         return {"status": "error", "message": "Graph not loaded."}
-    return {"status": "loaded", "nodes": len(G.nodes), "edges": len(G.edges)}
+    return {"status": "loaded", "nodes": len(G.nodes), "edges": len(G.edges), "engine": ROUTING_ENGINE}
 
 @app.get("/hospitals")
 def get_all_hospitals():
@@ -80,9 +611,86 @@ def get_all_hospitals():
 
 @app.get("/hospital/filter")
 def get_filtered_hospitals(case_type: str):
-    valid_hospitals = filter_hospitals(hospitals, case_type)
+    valid_hospitals = hospital_registry.candidates(case_type)
     return {"hospitals": valid_hospitals}
 
+@app.get("/hospitals/nearby")
+def get_nearby_hospitals(lat: float, lon: float, case_type: Optional[str] = None, k: int = 3):
+    """Closest capable hospitals with ICU beds by straight-line distance."""
+    return {"hospitals": hospital_registry.nearest(lat, lon, k=max(1, k), case_type=case_type)}
+
+@app.put("/hospitals/{hospital_id}/beds")
+def set_hospital_beds(hospital_id: int, req: BedUpdate):
+    """Set (icu_beds_available) or adjust (delta) one hospital's free ICU beds."""
+    return {"hospitals": update_beds([(hospital_id, req)]), "version": hospital_registry.version}
+
+@app.post("/hospitals/beds")
+def set_beds_bulk(req: BedUpdateBatch):
+    """Several bed updates applied together: all of them or none."""
+    return {"hospitals": update_beds([(u.hospital_id, u) for u in req.updates]),
+            "version": hospital_registry.version}
+
+def update_beds(items):
+    for hid, u in items:
+        if hid is None:
+            raise HTTPException(status_code=400, detail="Every update needs a hospital_id.")
+        if u.icu_beds_available is None and u.delta is None:
+            raise HTTPException(status_code=400, detail="Give icu_beds_available or delta.")
+    try:
+        return hospital_registry.update_beds(
+            [(hid, u.icu_beds_available, u.delta) for hid, u in items]
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Hospital {e.args[0]} not found")
+
+@app.get("/isochrones")
+async def get_isochrones(minutes: str = ISOCHRONE_MINUTES, hospital_id: Optional[int] = None,
+                         include_nodes: bool = False):
+    """Areas each hospital reaches within the given minutes under current traffic.
+
+    All thresholds come from one bounded search from every hospital,
+    cached until traffic changes. Polygons are convex hulls of the reached
+    nodes; include_nodes adds the reached road nodes as [node_id, seconds]
+    for the largest threshold.
+    """
+    if isochrones is None:
+        raise HTTPException(status_code=400, detail="Isochrones need the csr or ch routing engine.")
+    try:
+        thresholds = sorted({float(m) for m in minutes.split(",") if m.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="minutes must be comma-separated numbers")
+    if not thresholds or thresholds[0] <= 0 or not all(math.isfinite(m) for m in thresholds):
+        raise HTTPException(status_code=400, detail="minutes must be positive, finite numbers")
+    if thresholds[-1] > ISOCHRONE_MAX_MINUTES:
+        raise HTTPException(status_code=400, detail=f"minutes must be at most {ISOCHRONE_MAX_MINUTES:g}")
+    ids = [h["id"] for h in hospitals] if hospital_id is None else [hospital_id]
+    if hospital_id is not None and hospital_id not in hospital_nodes:
+        raise HTTPException(status_code=404, detail="Hospital not found")
+
+    weights, version = csr.published()
+    result = await run_search(isochrones.get, weights, version, thresholds[-1] * 60)
+    out = []
+    for hid in ids:
+        entry = {
+            "hospital_id": hid,
+            "isochrones": [
+                {
+                    "minutes": m,
+                    "nodes": int(len(result.reach(hid, m * 60)[0])),
+                    "polygon": result.polygon(hid, m * 60),
+                }
+                for m in thresholds
+            ],
+        }
+        if include_nodes:
+            nodes, seconds = result.reach(hid, thresholds[-1] * 60)
+            entry["reach"] = [
+                [csr.node_ids[i], round(t, 1)] for i, t in zip(nodes.tolist(), seconds.tolist())
+            ]
+        out.append(entry)
+    # polygons are convex hulls of the reached nodes, not the reachable area
+    return {"version": result.version, "minutes": thresholds, "polygon_kind": "convex_hull", "hospitals": out}
+
 @app.get("/overpass/signals")
 async def get_overpass_signals():
     """
@@ -117,77 +725,271 @@ out body;
         raise HTTPException(status_code=503, detail=f"Overpass API error: {str(e)}")
 
 @app.post("/route")
-def get_route(req: RouteRequest):
+async def get_route(req: RouteRequest):
     global G
     if G is None:
         raise HTTPException(status_code=500, detail="Graph not loaded")
-    
-    # 1. Select Hospital based on capability
-    valid_hospitals = filter_hospitals(hospitals, req.case_type)
-    if not valid_hospitals:
-        # Failsafe Mode: If no capable hospital available, just return nearest general hospital
-        valid_hospitals = hospitals
-    
-    # Simple straight-line distance to find the nearest valid hospital roughly
-    best_hospital = None
-    min_dist = float('inf')
-    for h in valid_hospitals:
-        dist = math.hypot(h["lat"] - req.start_lat, h["lon"] - req.start_lon)
-        if dist < min_dist:
-            min_dist = dist
-            best_hospital = h
-            
-    if best_hospital is None:
-        raise HTTPException(status_code=404, detail="No suitable hospital found.")
+    if req.geometry not in FORMATS:
+        raise HTTPException(status_code=400, detail="geometry must be coords, polyline or float32")
 
-    # 2. Get nearest nodes
+    # 1. Snap the ambulance to the road graph
     start_node = get_nearest_node(G, req.start_lat, req.start_lon)
-    end_node = get_nearest_node(G, best_hospital["lat"], best_hospital["lon"])
-    
-    # 3. Calculate route
+
+    # 2. Rank capable hospitals by actual travel time (one search for all),
+    #    or route point-to-point when the operator picked the hospital
     try:
-        route_nodes, travel_time = calculate_route_astar(G, start_node, end_node)
+        if req.hospital_id is not None:
+            chosen = [h for h in hospitals if h["id"] == req.hospital_id]
+            if not chosen:
+                raise HTTPException(status_code=404, detail="Hospital not found")
+            end_node = hospital_nodes[chosen[0]["id"]]
+            route_nodes, travel_time = await compute_route(start_node, end_node)
+            ranked = [(chosen[0], route_nodes, travel_time)]
+        else:
+            ranked = await rank_hospitals(start_node, req.case_type, top_k=max(1, req.top_k))
+    except HTTPException:
+        raise
     except Exception as e:
-        # Failsafe Mode fallback to Dijkstra
-        print(f"A* failed: {e}. Falling back to Dijkstra.")
-        try:
-            route_nodes, travel_time = calculate_route_dijkstra(G, start_node, end_node)
-        except Exception as e2:
-            raise HTTPException(status_code=500, detail="Routing failed completely.")
+        ERRORS.inc("route")
+        print(f"Routing failed: {e}")
+        raise HTTPException(status_code=500, detail="Routing failed completely.")
+    if not ranked:
+        raise HTTPException(status_code=404, detail="No suitable hospital found.")
+    if req.departure_s is not None and speed_profiles is not None:
+        # candidates come from current traffic; cost them along the trip instead
+        ranked = await run_search(time_dependent_routes, start_node, ranked, req.departure_s)
+    elif req.green_wave and signal_delays is not None:
+        ranked = await run_search(green_wave_routes, start_node, ranked, req.preemption)
+
+    # Convert node IDs to the road shape in the requested format; parallel
+    # edges are picked by current travel time, so bring G up to date first
+    traffic_model.sync_graph()
+    field, encode_geometry = FORMATS[req.geometry]
+    options = [
+        {
+            "hospital": h,
+            field: encode_geometry(route_points(G, route_nodes)),
+            "estimated_time_minutes": round(travel_time / 60, 2),
+        }
+        for h, route_nodes, travel_time in ranked
+    ]
+
+    best = options[0]
+    return FastJSONResponse({
+        "hospital": best["hospital"],
+        field: best[field],
+        "route_id": register_corridor(ranked[0][1]),
+        "estimated_time_minutes": best["estimated_time_minutes"],
+        "alternatives": options[1:],
+    })
 
-    # Convert node IDs to coordinates
-    route_coords = [[G.nodes[n]['y'], G.nodes[n]['x']] for n in route_nodes]
+@app.post("/route/batch")
+async def route_batch(req: BatchRouteRequest):
+    """Many-to-many travel times, streamed as NDJSON rows or an Arrow IPC stream.
+
+    Every row is {origin, destination, hospital_id, travel_time_s[, route]}
+    with indexes into the request's lists (or into the hospital list).
+    Without top_k, unreachable pairs come back with travel_time_s null.
+    """
+    if G is None:
+        raise HTTPException(status_code=500, detail="Graph not loaded")
+    if req.format not in ("ndjson", "arrow"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or arrow")
+    try:
+        origins = [(float(lat), float(lon)) for lat, lon in req.origins]
+        if req.destinations is not None:
+            points = [(float(lat), float(lon)) for lat, lon in req.destinations]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="origins/destinations must be [[lat, lon], ...]")
+    if not origins:
+        raise HTTPException(status_code=400, detail="No origins given.")
+
+    if req.destinations is not None:
+        hospital_ids = [None] * len(points)
+        destination_nodes = get_nearest_node(G, [p[0] for p in points], [p[1] for p in points]) if points else []
+    else:
+        chosen = hospital_registry.candidates(req.case_type) if req.case_type else hospitals
+        hospital_ids = [h["id"] for h in chosen]
+        destination_nodes = [hospital_nodes[hid] for hid in hospital_ids]
+    if not destination_nodes:
+        raise HTTPException(status_code=404, detail="No destinations.")
+    origin_nodes = get_nearest_node(G, [p[0] for p in origins], [p[1] for p in origins])
+
+    try:
+        arrow = ArrowEncoder(req.include_routes) if req.format == "arrow" else None
+    except ImportError:
+        raise HTTPException(status_code=400, detail="Arrow output needs pyarrow installed.")
+
+    k = max(1, req.top_k) if req.top_k is not None else None
+    departure_s = req.departure_s if speed_profiles is not None else None
+    destinations = group(destination_nodes)
+    origin_rows = group(origin_nodes)
+    chunks = chunked(origin_rows)
+    if req.include_routes:
+        # route shapes pick parallel edges by the travel times on G
+        traffic_model.sync_graph()
+
+    def rows_for(origin, found):
+        reached = expand(found, destinations, k)
+        if k is None:
+            times = {j: (t, route) for j, t, route in reached}
+            reached = [(j,) + times.get(j, (None, None)) for j in range(len(destination_nodes))]
+        rows = []
+        for i in origin_rows[origin]:
+            for j, travel_time, route in reached:
+                row = {
+                    "origin": i,
+                    "destination": j,
+                    "hospital_id": hospital_ids[j],
+                    "travel_time_s": None if travel_time is None else round(travel_time, 1),
+                }
+                if req.include_routes:
+                    row["route"] = [[lat, lon] for lat, lon in route_points(G, route)] if route else None
+                rows.append(row)
+        return rows
+
+    async def stream():
+        try:
+            async for chunk, results in run_batch(chunks, list(destinations), k, req.include_routes, departure_s):
+                rows = []
+                for origin, found in zip(chunk, results):
+                    rows.extend(rows_for(origin, found))
+                if arrow is not None:
+                    yield arrow.encode(rows)
+                else:
+                    yield "".join(encode(row) + "\n" for row in rows)
+        except (PoolBusy, asyncio.TimeoutError) as e:
+            # the status line is already sent; end the stream with the reason
+            ERRORS.inc("batch")
+            print(f"Batch routing stopped: {e!r}")
+            if arrow is None:
+                yield encode({"error": "Routing queue is full." if isinstance(e, PoolBusy) else "Routing deadline exceeded."}) + "\n"
+        if arrow is not None:
+            yield arrow.close()
 
-    return {
-        "hospital": best_hospital,
-        "route": route_coords,
-        "estimated_time_minutes": round(travel_time / 60, 2)
-    }
+    media_type = "application/vnd.apache.arrow.stream" if arrow is not None else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type)
 
 @app.post("/simulate/step")
 def process_simulation_step(req: SimulationStepRequest):
     global signals
-    # before each simulation tick, adjust traffic speeds to simulate variability
-    if G is not None:
-        randomize_traffic(G)
+    # signal phases follow the clock, not the number of step calls
+    signal_controller.advance()
+    if req.vehicle_id is not None:
+        # fleet vehicles move in fleet_loop
+        vehicle = fleet.state(req.vehicle_id)
+        if vehicle is None:
+            raise HTTPException(status_code=404, detail="Vehicle not found")
+        result = {"vehicle": vehicle, "preemption_active": vehicle["preemption_active"]}
+        if req.include_signals:
+            result["signals"] = signal_view()[0]
+        return FastJSONResponse(result)
+    if req.current_lat is None or req.current_lon is None:
+        raise HTTPException(status_code=422, detail="Send vehicle_id or current_lat/current_lon")
 
-    update_signals(signals) # tick the state machine
-    
-    preemption_triggered = simulate_step(req.current_lat, req.current_lon, signals)
+    # traffic now changes on its own schedule (traffic_loop), not per step
+    corridor = get_corridor(req.route_id) if req.route_id else None
+    if corridor is not None:
+        # only upcoming on-route signals, by ETA
+        preemption_triggered = corridor.step(req.current_lat, req.current_lon, req.speed_kmh)
+    else:
+        preemption_triggered = simulate_step(req.current_lat, req.current_lon, signals, index=signal_index)
     
-    result = {
-        "preemption_active": preemption_triggered,
-        "signals": [{"id": s["id"], "lat": s["lat"], "lon": s["lon"], "state": s["state"]} for s in signals]
-    }
+    result = {"preemption_active": preemption_triggered}
+    if req.include_signals:
+        result["signals"] = signal_view()[0]
     # optionally include global traffic summary for debugging/demo
     if G is not None:
-        result["traffic_summary"] = get_overall_traffic(G)
-    return result
+        result["traffic_summary"] = traffic_model.summary()
+    return FastJSONResponse(result)
+
+@app.post("/fleet/vehicles")
+def register_vehicle(req: VehicleRequest):
+    """Register an ambulance on a route from /route; the server drives it from now on."""
+    corridor = get_corridor(req.route_id)
+    if corridor is None:
+        raise HTTPException(status_code=404, detail="Route not found")
+    vehicle_id = fleet.register(corridor, req.speed_kmh, req.vehicle_id, req.route_id)
+    return fleet.state(vehicle_id)
+
+@app.get("/fleet/vehicles")
+def list_vehicles():
+    return {"vehicles": fleet.states()}
+
+@app.get("/fleet/vehicles/{vehicle_id}")
+def get_vehicle(vehicle_id: str):
+    vehicle = fleet.state(vehicle_id)
+    if vehicle is None:
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+    return vehicle
+
+@app.delete("/fleet/vehicles/{vehicle_id}")
+def remove_vehicle(vehicle_id: str):
+    if not fleet.remove(vehicle_id):
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+    return {"status": "removed", "vehicle_id": vehicle_id}
+
+@app.websocket("/ws")
+async def push_socket(websocket: WebSocket):
+    """Signal/vehicle deltas. Send {"bbox": [south, west, north, east]} (or null) to set the viewport."""
+    await websocket.accept()
+    try:
+        sub = push_hub.subscribe(parse_bbox(websocket.query_params.get("bbox")))
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    async def receive():
+        while True:
+            msg = await websocket.receive_json()
+            try:
+                push_hub.set_viewport(sub, parse_bbox(msg.get("bbox")))
+            except (ValueError, TypeError, AttributeError):
+                await websocket.send_json({"type": "error", "detail": "bbox must be [south, west, north, east]"})
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while not receiver.done():
+            message = await push_hub.next_message(sub, timeout=PUSH_KEEPALIVE_S)
+            await websocket.send_text(encode(message or {"type": "keepalive"}))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receiver.cancel()
+        push_hub.unsubscribe(sub)
+
+@app.get("/events")
+async def push_events(request: Request, bbox: Optional[str] = None):
+    """Server-Sent Events version of /ws; the viewport is the bbox query parameter."""
+    try:
+        sub = push_hub.subscribe(parse_bbox(bbox))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                message = await push_hub.next_message(sub, timeout=PUSH_KEEPALIVE_S)
+                yield sse_event(message) if message else ": keepalive\n\n"
+        finally:
+            push_hub.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def signal_view():
+    """(public signal fields, their /signals/status body), rebuilt only after a state change."""
+    global _signal_view
+    changes = signal_controller.changes
+    cached = _signal_view
+    if cached is None or cached[0] != changes:
+        view = [{"id": s["id"], "lat": s["lat"], "lon": s["lon"], "state": s["state"]} for s in signals]
+        cached = _signal_view = (changes, view, dumps({"signals": view}))
+    return cached[1], cached[2]
 
 @app.get("/signals/status")
 def get_signals_status():
-    global signals
-    return {"signals": [{"id": s["id"], "lat": s["lat"], "lon": s["lon"], "state": s["state"]} for s in signals]}
+    signal_controller.advance()
+    return FastJSONResponse(signal_view()[1])
 
 
 @app.get("/traffic/status")
@@ -195,7 +997,7 @@ def traffic_status():
     """Return overall traffic statistics (min/avg/max speeds)"""
     if G is None:
         raise HTTPException(status_code=500, detail="Graph not loaded")
-    return {"traffic": get_overall_traffic(G)}
+    return {"traffic": traffic_model.summary()}
 
 
 @app.post("/traffic/randomize")
@@ -203,42 +1005,100 @@ def traffic_randomize():
     """Manually trigger a random traffic update."""
     if G is None:
         raise HTTPException(status_code=500, detail="Graph not loaded")
-    randomize_traffic(G)
-    return {"status": "ok"}
+    version = traffic_model.randomize()
+    return {"status": "ok", "version": version}
 
 
 @app.post("/traffic/route")
-def traffic_for_route(req: RouteRequest):
+async def traffic_for_route(req: RouteRequest):
     """Return per-segment speeds for a requested route between start and hospital."""
     # reuse /route logic to pick hospital and compute route nodes
-    valid_hospitals = filter_hospitals(hospitals, req.case_type)
-    if not valid_hospitals:
-        valid_hospitals = hospitals
-    best_hospital = None
-    min_dist = float('inf')
-    for h in valid_hospitals:
-        dist = math.hypot(h["lat"] - req.start_lat, h["lon"] - req.start_lon)
-        if dist < min_dist:
-            min_dist = dist
-            best_hospital = h
-    if best_hospital is None:
-        raise HTTPException(status_code=404, detail="No suitable hospital found.")
+    if G is None:
+        raise HTTPException(status_code=500, detail="Graph not loaded")
     start_node = get_nearest_node(G, req.start_lat, req.start_lon)
-    end_node = get_nearest_node(G, best_hospital["lat"], best_hospital["lon"])
-    try:
-        route_nodes, travel_time = calculate_route_astar(G, start_node, end_node)
-    except Exception:
-        route_nodes, travel_time = calculate_route_dijkstra(G, start_node, end_node)
+    ranked = await rank_hospitals(start_node, req.case_type)
+    if not ranked:
+        raise HTTPException(status_code=404, detail="No suitable hospital found.")
+    best_hospital, route_nodes, travel_time = ranked[0]
+    traffic_model.sync_graph()
     segments = get_route_traffic(G, route_nodes)
-    return {"segments": segments, "estimated_time": travel_time}
+    return {"hospital": best_hospital, "segments": segments, "estimated_time": travel_time}
+
+def collect_runtime():
+    """Cache, pool, fleet and push numbers for /metrics, read at scrape time."""
+    cache = route_cache.stats()
+    pool = route_pool.stats()
+    families = [
+        ("ambulance_route_cache_lookups_total", "counter", "Route cache lookups by result.",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+        ("ambulance_route_cache_hit_ratio", "gauge", "Share of route cache lookups that hit.",
+         [({}, cache["hit_rate"])]),
+        ("ambulance_route_cache_entries", "gauge", "Routes currently cached.", [({}, cache["size"])]),
+        ("ambulance_route_cache_dropped_total", "counter", "Cached routes dropped, by reason.",
+         [({"reason": "evicted"}, cache["evictions"]), ({"reason": "expired"}, cache["expirations"]),
+          ({"reason": "invalidated"}, cache["invalidations"])]),
+        ("ambulance_route_pool_pending", "gauge", "Routing searches queued or running.",
+         [({}, pool["pending"])]),
+        ("ambulance_traffic_version", "gauge", "Weight version the routing engines use.",
+         [({}, traffic_version)]),
+        ("ambulance_profiler_samples_total", "counter", "Sampling profiler ticks since reset.",
+         [({}, profiler.samples)]),
+    ]
+    if fleet is not None:
+        families.append(("ambulance_fleet_vehicles", "gauge", "Registered fleet vehicles.",
+                         [({}, len(fleet))]))
+    if push_hub is not None:
+        families.append(("ambulance_push_subscribers", "gauge", "Open WebSocket/SSE subscribers.",
+                         [({}, len(push_hub.subscribers))]))
+    return families
+
+REGISTRY.add_collector(collect_runtime)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of timings, counters and cache stats."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def check_debug_token(token):
+    # without DEBUG_TOKEN the debug endpoints do not exist
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token is None or not secrets.compare_digest(token, DEBUG_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+@app.get("/debug/profiler")
+def profiler_report(top: Optional[int] = 200, x_debug_token: Optional[str] = Header(None)):
+    """Sampled stacks in collapsed format (flamegraph.pl / speedscope)."""
+    check_debug_token(x_debug_token)
+    return PlainTextResponse(profiler.collapsed(top))
+
+@app.post("/debug/profiler")
+def profiler_toggle(enabled: bool, interval_ms: Optional[float] = None, reset: bool = False,
+                    x_debug_token: Optional[str] = Header(None)):
+    """Start or stop the sampling profiler; reset clears collected stacks."""
+    check_debug_token(x_debug_token)
+    if interval_ms is not None and interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+    if reset:
+        profiler.reset()
+    if enabled:
+        profiler.start(interval_ms / 1000 if interval_ms else None)
+    else:
+        profiler.stop()
+    return {"running": profiler.running, "interval_ms": profiler.interval_s * 1000,
+            "samples": profiler.samples, "stacks": len(profiler.counts)}
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Route cache hit/miss/eviction counters and routing queue state."""
+    return {"route_cache": route_cache.stats(), "route_pool": route_pool.stats()}
 
 @app.post("/preemption/trigger/{signal_id}")
 def manual_override(signal_id: int):
     global signals
     for s in signals:
         if s["id"] == signal_id:
-            s["state"] = "PREEMPTED_GREEN"
-            s["timer"] = 25
+            signal_controller.preempt(s)
             return {"status": "success", "message": f"Signal {signal_id} preempted"}
     raise HTTPException(status_code=404, detail="Signal not found")
 
@@ -0,0 +1,234 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+A deliberately small replacement for prometheus_client: counters and
+fixed-bucket histograms keyed by label values, plus collectors that read
+existing stats (route cache, worker pool, fleet) at scrape time. Recording
+costs one lock and a bisect, so it stays on in production.
+
+Searches in worker processes record into the worker's own registry. Every
+worker reply carries `REGISTRY.take()` (the observations since the last
+reply), and the server merges it into its registry, so /metrics covers
+the whole pool.
+"""
+import bisect
+import math
+import threading
+import time
+
+# seconds: 100 us .. 10 s
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+NODE_BUCKETS = (10, 100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def take(self):
+        with self._lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, value in values.items():
+                self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        return [(self.name, _labels(self.labels, key), value) for key, value in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}   # label values -> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def since(self, start, *label_values):
+        """Observe the seconds elapsed since a time.perf_counter() value."""
+        self.observe(time.perf_counter() - start, *label_values)
+
+    def take(self):
+        with self._lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                state = self.values.get(key)
+                if state is None:
+                    self.values[key] = [list(counts), total]
+                else:
+                    state[0] = [a + b for a, b in zip(state[0], counts)]
+                    state[1] += total
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self.values.items()]
+        out = []
+        names = self.labels + ("le",)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                out.append((self.name + "_bucket", _labels(names, key + (_number(bound),)), cumulative))
+            out.append((self.name + "_sum", _labels(self.labels, key), total))
+            out.append((self.name + "_count", _labels(self.labels, key), cumulative))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []   # fn() -> [(name, kind, help, [(labels dict, value)])]
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, fn):
+        self.collectors.append(fn)
+
+    def take(self):
+        """Observations since the last take (worker side), by metric name."""
+        delta = {}
+        for metric in self.metrics:
+            values = metric.take()
+            if values:
+                delta[metric.name] = values
+        return delta
+
+    def merge(self, delta):
+        by_name = {metric.name: metric for metric in self.metrics}
+        for name, values in delta.items():
+            metric = by_name.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        for collect in self.collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    label_text = _labels(tuple(labels), tuple(labels.values()))
+                    lines.append(f"{name}{label_text} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+SEARCH_SECONDS = Histogram(
+    "ambulance_search_seconds", "Time per routing search.", ("engine", "algorithm"))
+SEARCH_EXPANDED = Histogram(
+    "ambulance_search_expanded_nodes", "Nodes settled (expanded) per routing search.",
+    ("engine", "algorithm"), buckets=NODE_BUCKETS)
+SEARCH_FALLBACKS = Counter(
+    "ambulance_search_fallbacks_total", "A* failures answered by the Dijkstra fallback.", ("engine",))
+ERRORS = Counter(
+    "ambulance_errors_total", "Failures by stage.", ("stage",))
+STAGE_SECONDS = Histogram(
+    "ambulance_stage_seconds", "Time per background or request stage.", ("stage",))
+TRAFFIC_SECONDS = Histogram(
+    "ambulance_traffic_update_seconds", "Time per traffic update, including listeners.", ("operation",))
+PREEMPTIONS = Histogram(
+    "ambulance_preemptions_per_step", "Signals newly preempted per geofence check or fleet tick.",
+    ("source",), buckets=COUNT_BUCKETS)
+REPLANS = Counter(
+    "ambulance_replans_total", "Active-trip replans by outcome.", ("outcome",))
+HTTP_SECONDS = Histogram(
+    "ambulance_http_request_seconds", "Time until the response starts, by route.", ("method", "route"))
+HTTP_RESPONSES = Counter(
+    "ambulance_http_responses_total", "Responses by route and status.", ("method", "route", "status"))
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template.
+
+    Time is measured until the response starts, which covers the whole
+    handler for normal responses and the setup for streams.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                self._record(scope, start, message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not started:
+                self._record(scope, start, 500)
+            raise
+
+    @staticmethod
+    def _record(scope, start, status):
+        route = scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_SECONDS.since(start, scope["method"], path)
+        HTTP_RESPONSES.inc(scope["method"], path, str(status))
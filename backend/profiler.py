@@ -0,0 +1,78 @@
+"""Opt-in sampling profiler for a running server.
+
+A daemon thread wakes every `interval_s` and records the Python stack of
+every other thread (`sys._current_frames()`), counting identical stacks.
+The handlers themselves are not slowed down: the only cost is one stack
+walk per thread per interval, and the thread does not exist while the
+profiler is off.
+
+`collapsed()` returns the counts in the "frame;frame;frame count" format
+that flamegraph.pl and speedscope read.
+"""
+import os
+import sys
+import threading
+import time
+
+# distinct stacks kept; rarer ones beyond this are counted as "[other]"
+MAX_STACKS = 5000
+
+
+class SamplingProfiler:
+    def __init__(self, interval_s=0.01):
+        self.interval_s = interval_s
+        self.counts = {}
+        self.samples = 0
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval_s=None):
+        if interval_s is not None:
+            self.interval_s = interval_s
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        self._thread = None
+
+    def reset(self):
+        self.counts = {}
+        self.samples = 0
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                if key not in self.counts and len(self.counts) >= MAX_STACKS:
+                    key = "[other]"
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self, top=None):
+        """Stacks as 'a;b;c count' lines, most frequent first."""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        if top is not None:
+            ranked = ranked[:top]
+        return "".join(f"{stack} {n}\n" for stack, n in ranked)
@@ -0,0 +1,208 @@
+"""Push channel for signal and vehicle state (WebSocket and SSE).
+
+Instead of every client polling the full signal list, `PushHub.publish()`
+runs on a fixed interval, diffs the current signal states and vehicle
+positions against what it last published and hands each subscriber only
+the changes inside its viewport (a lat/lon bounding box).
+
+Each subscriber keeps one pending update per signal / vehicle. A slow
+client that has not picked up its last batch yet simply gets those
+entries overwritten with the newest state, so its backlog is bounded by
+the number of objects in its viewport rather than by time. The one-time
+`route` sent with a rerouted vehicle is carried over into the newer
+state, so a lagging client still receives it.
+"""
+import asyncio
+
+import numpy as np
+from starlette.middleware.gzip import GZipMiddleware
+
+from fast_json import dumps
+
+# smallest move (degrees, ~1 m) worth pushing
+MIN_MOVE_DEG = 1e-5
+
+
+def parse_bbox(value):
+    """"south,west,north,east" (or a 4-item list) -> tuple, None for everything."""
+    if value is None or value == "":
+        return None
+    parts = value.split(",") if isinstance(value, str) else value
+    if len(parts) != 4:
+        raise ValueError("bbox must be south,west,north,east")
+    south, west, north, east = (float(p) for p in parts)
+    return south, west, north, east
+
+
+def _inside(bbox, lat, lon):
+    if bbox is None:
+        return np.ones(np.shape(lat), dtype=np.bool_)
+    south, west, north, east = bbox
+    return (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+
+
+class Subscriber:
+    def __init__(self, bbox=None):
+        self.bbox = bbox
+        self.signals = {}            # signal id -> pending payload
+        self.vehicles = {}           # vehicle id -> pending payload
+        self.removed = set()         # vehicles that left the viewport or the fleet
+        self.visible = set()         # vehicles the client currently shows
+        self.resync = True           # next message is a full snapshot
+        self.coalesced = 0
+        self.event = asyncio.Event()
+        self.event.set()
+
+
+class PushHub:
+    def __init__(self, signals, fleet):
+        self.signals = signals
+        self.fleet = fleet
+        self.subscribers = set()
+        self.seq = 0
+        self.signal_lat = np.array([s["lat"] for s in signals], dtype=np.float64)
+        self.signal_lon = np.array([s["lon"] for s in signals], dtype=np.float64)
+        self._states = [s["state"] for s in signals]
+        self._vehicles = {}          # vehicle id -> last published state
+
+    def subscribe(self, bbox=None):
+        sub = Subscriber(bbox)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscribers.discard(sub)
+
+    def set_viewport(self, sub, bbox):
+        sub.bbox = bbox
+        sub.resync = True
+        sub.event.set()
+
+    def publish(self):
+        """Diff current state against the last publish and queue the deltas."""
+        self.seq += 1
+        states = [s["state"] for s in self.signals]
+        changed = np.array([i for i, (a, b) in enumerate(zip(states, self._states)) if a != b], dtype=np.int64)
+        self._states = states
+
+        current = {v["vehicle_id"]: v for v in self.fleet.states()} if self.fleet is not None else {}
+        moved = []
+        for vid, v in current.items():
+            last = self._vehicles.get(vid)
+            if (last is None or abs(v["lat"] - last["lat"]) > MIN_MOVE_DEG
+                    or abs(v["lon"] - last["lon"]) > MIN_MOVE_DEG
+                    or v["arrived"] != last["arrived"]
+                    or v["preemption_active"] != last["preemption_active"]
+                    or v["held_at_signal"] != last["held_at_signal"]
+                    or v["route_id"] != last["route_id"]):
+                self._vehicles[vid] = v
+                if last is not None and v["route_id"] != last["route_id"]:
+                    # rerouted mid-trip: send the new route along once
+                    v = dict(v, route=self.fleet.route(vid))
+                moved.append(v)
+        gone = [vid for vid in self._vehicles if vid not in current]
+        for vid in gone:
+            del self._vehicles[vid]
+
+        if not len(changed) and not moved and not gone:
+            return
+        moved_lat = np.array([v["lat"] for v in moved], dtype=np.float64)
+        moved_lon = np.array([v["lon"] for v in moved], dtype=np.float64)
+        for sub in self.subscribers:
+            if sub.resync:
+                continue  # the snapshot will include everything
+            before = len(sub.signals) + len(sub.vehicles)
+            if len(changed):
+                inside = changed[_inside(sub.bbox, self.signal_lat[changed], self.signal_lon[changed])]
+                for i in inside.tolist():
+                    s = self.signals[i]
+                    sub.signals[s["id"]] = {"id": s["id"], "state": states[i]}
+            for v, ok in zip(moved, _inside(sub.bbox, moved_lat, moved_lon).tolist()):
+                vid = v["vehicle_id"]
+                if ok:
+                    pending = sub.vehicles.get(vid)
+                    if (pending is not None and "route" in pending and "route" not in v
+                            and pending["route_id"] == v["route_id"]):
+                        # not picked up yet: keep the new route with the newer state
+                        v = dict(v, route=pending["route"])
+                    sub.vehicles[vid] = v
+                    sub.visible.add(vid)
+                    sub.removed.discard(vid)
+                elif vid in sub.visible:
+                    sub.visible.discard(vid)
+                    sub.vehicles.pop(vid, None)
+                    sub.removed.add(vid)
+            for vid in gone:
+                if vid in sub.visible:
+                    sub.visible.discard(vid)
+                    sub.vehicles.pop(vid, None)
+                    sub.removed.add(vid)
+            if sub.signals or sub.vehicles or sub.removed:
+                if before:
+                    sub.coalesced += 1
+                sub.event.set()
+
+    def snapshot(self, sub):
+        inside = np.flatnonzero(_inside(sub.bbox, self.signal_lat, self.signal_lon))
+        vehicles = [
+            v for v in self._vehicles.values()
+            if _inside(sub.bbox, np.float64(v["lat"]), np.float64(v["lon"]))
+        ]
+        sub.visible = {v["vehicle_id"] for v in vehicles}
+        return {
+            "type": "snapshot",
+            "seq": self.seq,
+            "signals": [
+                {"id": s["id"], "lat": s["lat"], "lon": s["lon"], "state": s["state"]}
+                for s in (self.signals[i] for i in inside.tolist())
+            ],
+            "vehicles": vehicles,
+        }
+
+    async def next_message(self, sub, timeout=None):
+        """Wait for the subscriber's next message (dict), or None on timeout."""
+        try:
+            await asyncio.wait_for(sub.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        sub.event.clear()
+        if sub.resync:
+            sub.resync = False
+            sub.signals, sub.vehicles, sub.removed = {}, {}, set()
+            return self.snapshot(sub)
+        message = {
+            "type": "delta",
+            "seq": self.seq,
+            "signals": list(sub.signals.values()),
+            "vehicles": list(sub.vehicles.values()),
+            "removed_vehicles": sorted(sub.removed),
+        }
+        sub.signals, sub.vehicles, sub.removed = {}, {}, set()
+        return message
+
+
+def encode(message):
+    # same serializer as the HTTP responses (orjson when installed)
+    return dumps(message).decode('utf-8')
+
+
+def sse_event(message):
+    return f"data: {encode(message)}\n\n"
+
+
+class EventStreamGZip:
+    """GZipMiddleware that passes the event-stream paths through untouched.
+
+    Older Starlette releases gzip text/event-stream too, which holds SSE
+    events back in the compressor; these paths never reach it.
+    """
+    def __init__(self, app, paths=("/events",), **options):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.gzip = GZipMiddleware(app, **options)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
@@ -0,0 +1,284 @@
+"""Incremental re-planning for ambulances already en route (D* Lite).
+
+A fleet vehicle drives a fixed route from /route. When traffic changes,
+a better route may open up, but repeating a full search for every active
+trip on every traffic tick is wasteful: most changes are nowhere near the
+trip.
+
+Each trip keeps a D* Lite search (Koenig & Likhachev) rooted at its
+hospital and searching back toward the vehicle, so the search tree stays
+valid while the vehicle moves; only the heuristic's origin shifts, which
+the key modifier `km` absorbs. The search is confined to a corridor of
+`corridor_m` around the route the trip started on: detours within it are
+found exactly, and traffic changes outside it are ignored. On a traffic
+update the trip diffs the copy-on-write CSR weights against the ones it
+last saw, adjusts the one-step lookahead (rhs) of the tails of the
+changed arcs inside the searched part of the corridor, and repairs just
+those vertices.
+
+The new route is handed to the fleet only if its ETA beats the current
+route's (under the new weights) by more than `min_gain_s`.
+"""
+import heapq
+import math
+import threading
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from metrics import REPLANS, SEARCH_EXPANDED, SEARCH_SECONDS
+
+INF = math.inf
+# plans assume arcs up to this much faster than today's fastest, so that
+# ordinary traffic swings do not force a restart from scratch
+HEURISTIC_MARGIN = 0.75
+
+
+class TripPlan:
+    """D* Lite state for one trip to a fixed goal node (CSR indexes)."""
+
+    def __init__(self, replanner, inside, goal, start, weights, weights_array, s_per_km):
+        self.r = replanner
+        self.inside = inside      # bytearray: 1 for corridor nodes
+        self.goal = goal
+        self.start = start
+        self.last_start = start
+        self.weights = weights
+        self.weights_array = weights_array
+        self.scale = s_per_km     # seconds per straight-line km, fixed for this plan
+        self.km = 0.0
+        self.g = {}
+        self.rhs = {goal: 0.0}
+        self.queued = {}          # node -> key of its live queue entry
+        self.queue = []
+        self._update(goal)
+
+    def _h(self, node):
+        # lower bound on the time from the vehicle to node
+        x, y = self.r.x, self.r.y
+        return math.hypot(x[self.start] - x[node], y[self.start] - y[node]) * self.scale
+
+    def _key(self, node):
+        best = min(self.g.get(node, INF), self.rhs.get(node, INF))
+        return (best + self._h(node) + self.km, best)
+
+    def _update(self, node):
+        if self.g.get(node, INF) != self.rhs.get(node, INF):
+            key = self._key(node)
+            self.queued[node] = key
+            heapq.heappush(self.queue, (key, node))
+        else:
+            self.queued.pop(node, None)
+
+    def _lookahead(self, node):
+        # best c(node, succ) + g(succ) over node's outgoing arcs
+        # (nodes outside the corridor never get a g value)
+        indptr, indices, weights, g = self.r.indptr, self.r.indices, self.weights, self.g
+        best = INF
+        for i in range(indptr[node], indptr[node + 1]):
+            cost = weights[i] + g.get(indices[i], INF)
+            if cost < best:
+                best = cost
+        return best
+
+    def move(self, start):
+        """The vehicle is now heading for `start`."""
+        if start != self.start:
+            self.start = start
+            x, y = self.r.x, self.r.y
+            self.km += math.hypot(x[self.last_start] - x[start], y[self.last_start] - y[start]) * self.scale
+            self.last_start = start
+
+    def reweight(self, weights, weights_array):
+        """Take new arc weights; returns how many changed arcs touched the search."""
+        changed = np.flatnonzero(weights_array != self.weights_array)
+        old = self.weights
+        self.weights, self.weights_array = weights, weights_array
+        tails, heads, g, rhs, inside = self.r.tails, self.r.indices, self.g, self.rhs, self.inside
+        touched = 0
+        for slot in changed.tolist():
+            u = tails[slot]
+            g_v = g.get(heads[slot], INF)
+            if u == self.goal or g_v == INF or not inside[u]:
+                continue  # outside the corridor, or nothing downstream was searched
+            touched += 1
+            before, after = old[slot], weights[slot]
+            if after < before:
+                if after + g_v < rhs.get(u, INF):
+                    rhs[u] = after + g_v
+            elif rhs.get(u, INF) == before + g_v:
+                rhs[u] = self._lookahead(u)
+            self._update(u)
+        return touched
+
+    def compute(self):
+        """Repair the search until the vehicle's node is consistent; returns expansions."""
+        g, rhs, queued, queue = self.g, self.rhs, self.queued, self.queue
+        rev_indptr, rev_tails, rev_arcs = self.r.rev_indptr, self.r.rev_tails, self.r.rev_arcs
+        weights, goal, start, inside = self.weights, self.goal, self.start, self.inside
+        pop = heapq.heappop
+        expanded = 0
+        while queue:
+            key, u = queue[0]
+            if queued.get(u) != key:
+                pop(queue)  # superseded entry
+                continue
+            g_start, rhs_start = g.get(start, INF), rhs.get(start, INF)
+            best = min(g_start, rhs_start)
+            if key >= (best + self.km, best) and rhs_start == g_start:
+                break
+            pop(queue)
+            expanded += 1
+            new_key = self._key(u)
+            if key < new_key:
+                queued[u] = new_key
+                heapq.heappush(queue, (new_key, u))
+                continue
+            del queued[u]
+            g_u, rhs_u = g.get(u, INF), rhs.get(u, INF)
+            if g_u > rhs_u:
+                g[u] = rhs_u
+                for j in range(rev_indptr[u], rev_indptr[u + 1]):
+                    p = rev_tails[j]
+                    if p != goal and inside[p] and weights[rev_arcs[j]] + rhs_u < rhs.get(p, INF):
+                        rhs[p] = weights[rev_arcs[j]] + rhs_u
+                        self._update(p)
+            else:
+                g[u] = INF
+                for j in range(rev_indptr[u], rev_indptr[u + 1]):
+                    p = rev_tails[j]
+                    if p != goal and inside[p] and rhs.get(p, INF) == weights[rev_arcs[j]] + g_u:
+                        rhs[p] = self._lookahead(p)
+                        self._update(p)
+                self._update(u)
+        return expanded
+
+    @property
+    def cost(self):
+        """Travel time from the vehicle's node to the goal, inf if unreachable."""
+        return self.g.get(self.start, INF)
+
+    def path(self):
+        """CSR node indexes from the vehicle's node to the goal, following g."""
+        indptr, indices, weights, g = self.r.indptr, self.r.indices, self.weights, self.g
+        node = self.start
+        path = [node]
+        while node != self.goal and len(path) <= len(indptr):
+            best, nxt = INF, None
+            for i in range(indptr[node], indptr[node + 1]):
+                cost = weights[i] + g.get(indices[i], INF)
+                if cost < best:
+                    best, nxt = cost, indices[i]
+            if nxt is None:
+                return None
+            node = nxt
+            path.append(node)
+        return path if node == self.goal else None
+
+
+class Replanner:
+    """D* Lite plans for active trips, keyed by vehicle id."""
+
+    def __init__(self, csr, min_gain_s=30.0, corridor_m=1500.0, max_trips=200):
+        self.csr = csr
+        self.min_gain_s = min_gain_s
+        self.corridor_km = corridor_m / 1000
+        self.max_trips = max_trips
+        self.plans = {}        # vehicle id -> TripPlan
+        self._lock = threading.Lock()
+        self._weights = None   # (weights list, as an array) of the last replan
+
+        n = len(csr)
+        self.indptr, self.indices = csr._indptr, csr._indices
+        self.x, self.y = csr._x, csr._y
+        tails = np.repeat(np.arange(n), np.diff(csr.indptr))
+        order = np.argsort(csr.indices, kind='stable')
+        self.tails = tails.tolist()
+        self.rev_indptr = np.concatenate(([0], np.cumsum(np.bincount(csr.indices, minlength=n)))).tolist()
+        self.rev_tails = tails[order].tolist()
+        self.rev_arcs = order.tolist()
+        self.tree = cKDTree(np.column_stack((csr._x, csr._y)))
+
+    def corridor(self, route):
+        """bytearray marking the nodes within corridor_km of any route node."""
+        inside = bytearray(len(self.indptr) - 1)
+        points = [(self.x[i], self.y[i]) for i in route]
+        for near in self.tree.query_ball_point(points, self.corridor_km):
+            for i in near:
+                inside[i] = 1
+        return inside
+
+    def drop(self, vehicle_id):
+        with self._lock:
+            self.plans.pop(vehicle_id, None)
+
+    def retain(self, vehicle_ids):
+        """Forget the plans of vehicles that arrived or left the fleet."""
+        keep = set(vehicle_ids)
+        with self._lock:
+            for vehicle_id in [v for v in self.plans if v not in keep]:
+                del self.plans[vehicle_id]
+
+    def _snapshot(self):
+        # one consistent weights list (plus its array, shared by all trips)
+        weights, s_per_km = self.csr._metric
+        cached = self._weights
+        if cached is None or cached[0] is not weights:
+            cached = self._weights = (weights, np.array(weights, dtype=np.float64))
+        return weights, cached[1], s_per_km
+
+    def route_cost(self, nodes, weights):
+        """Travel time along CSR node indexes under `weights`."""
+        indptr, indices = self.indptr, self.indices
+        total = 0.0
+        for u, v in zip(nodes, nodes[1:]):
+            best = INF
+            for i in range(indptr[u], indptr[u + 1]):
+                if indices[i] == v and weights[i] < best:
+                    best = weights[i]
+            total += best
+        return total
+
+    def replan(self, vehicle_id, route, start):
+        """Better route for a trip on `route` (CSR indexes), or None.
+
+        The vehicle is heading for route[start]. Returns (path from
+        route[start] as CSR indexes, its travel time, the current route's
+        travel time from there) when the gain exceeds min_gain_s.
+        """
+        started = time.perf_counter()
+        goal, node = route[-1], route[start]
+        weights, weights_array, s_per_km = self._snapshot()
+        with self._lock:
+            plan = self.plans.get(vehicle_id)
+            if plan is not None and (plan.goal != goal or not plan.inside[node] or s_per_km < plan.scale):
+                # new hospital or route, or an arc got faster than the heuristic assumes
+                REPLANS.inc("restarted")
+                plan = None
+            if plan is None:
+                plan = TripPlan(
+                    self, self.corridor(route[start:]), goal, node, weights, weights_array,
+                    s_per_km * HEURISTIC_MARGIN,
+                )
+                self.plans[vehicle_id] = plan
+                while len(self.plans) > self.max_trips:
+                    del self.plans[next(iter(self.plans))]
+                algorithm = "initial"
+            else:
+                algorithm = "repair"
+        plan.move(node)
+        if plan.weights is not weights:
+            plan.reweight(weights, weights_array)
+        expanded = plan.compute()
+        SEARCH_SECONDS.since(started, "dstar", algorithm)
+        SEARCH_EXPANDED.observe(expanded, "dstar", algorithm)
+
+        current = self.route_cost(route[start:], weights)
+        if not plan.cost < current - self.min_gain_s:
+            REPLANS.inc("kept")
+            return None
+        path = plan.path()
+        if path is None:
+            return None
+        return path, plan.cost, current
@@ -0,0 +1,109 @@
+"""Bounded LRU/TTL cache of computed routes.
+
+Entries are keyed by (start node, end) and belong to one weight version:
+a lookup only hits when the cache holds the version the caller is routing
+on. When traffic changes, `on_weights_changed` moves the cache to the new
+version. If every changed edge only got slower, routes that avoid those
+edges are still shortest and are kept; otherwise everything is dropped.
+An index from (u, v) pairs to entries keeps that check proportional to
+the delta rather than to the cache size.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class RouteCache:
+    def __init__(self, maxsize=4096, ttl_s=300.0):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.version = 0
+        self._entries = OrderedDict()   # key -> (value, pairs, stored_at), oldest first
+        self._by_pair = {}              # (u, v) -> keys whose routes use that edge
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version):
+        """Cached value for key at `version`, or None."""
+        with self._lock:
+            entry = self._entries.get(key) if version == self.version else None
+            if entry is not None and time.monotonic() - entry[2] > self.ttl_s:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, version, value, routes):
+        """Store value computed at `version`; routes are the node lists it depends on."""
+        if self.maxsize <= 0:
+            return
+        pairs = set()
+        for route in routes:
+            pairs.update(zip(route, route[1:]))
+        with self._lock:
+            if version != self.version:
+                return  # weights moved on while this was computed
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, pairs, time.monotonic())
+            for pair in pairs:
+                self._by_pair.setdefault(pair, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def on_weights_changed(self, version, changed_pairs=None):
+        """Advance to `version`.
+
+        Pass the changed (u, v) pairs when every change was a slowdown to
+        keep unaffected routes; pass None to invalidate everything.
+        """
+        with self._lock:
+            if changed_pairs is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._by_pair.clear()
+            else:
+                stale = set()
+                for pair in changed_pairs:
+                    stale.update(self._by_pair.get(pair, ()))
+                for key in stale:
+                    self._drop(key)
+                self.invalidations += len(stale)
+            self.version = version
+
+    def _drop(self, key):
+        _, pairs, _ = self._entries.pop(key)
+        for pair in pairs:
+            keys = self._by_pair.get(pair)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_pair[pair]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_s": self.ttl_s,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,141 @@
+"""Route geometry along the real road shapes, and compact encodings of it.
+
+OSM ways bend between intersections; OSMnx keeps those bends as each
+simplified edge's `geometry` LineString. Drawing a route from node to node
+cuts every corner, so `route_points` walks the edges the route actually
+uses (the fastest of parallel edges, as the searches do) and adds their
+interior shape points. Snapshots store the shapes as flat arrays
+(`EdgeShapes`), graphs straight from OSMnx are read from `geometry`.
+
+Long routes are thousands of points. Besides plain [[lat, lon], ...]
+they can be sent as a Google encoded polyline (1e-5 degrees, ~1 m, a few
+bytes per point) or as base64 little-endian float32 lat/lon pairs.
+"""
+import base64
+import math
+
+import numpy as np
+
+
+def _travel_time(data):
+    return data.get('current_travel_time', data.get('travel_time', 0))
+
+
+class EdgeShapes:
+    """Interior shape points of graph edges, from snapshot arrays."""
+
+    def __init__(self, node_ids, edge_u, edge_v, edge_key, offsets, lat, lon):
+        self.offsets = offsets.tolist()
+        self.lat = lat.tolist()
+        self.lon = lon.tolist()
+        # only edges that bend are indexed
+        shaped = np.flatnonzero(np.diff(offsets) > 0).tolist()
+        u, v, k = edge_u.tolist(), edge_v.tolist(), edge_key.tolist()
+        self.index = {(node_ids[u[i]], node_ids[v[i]], k[i]): i for i in shaped}
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, u, v, k):
+        """[(lat, lon), ...] between the ends of edge (u, v, k), [] if straight."""
+        i = self.index.get((u, v, k))
+        if i is None:
+            return []
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return list(zip(self.lat[a:b], self.lon[a:b]))
+
+
+def interior_points(G, u, v, data):
+    """[(lat, lon), ...] inside an OSMnx edge's geometry, oriented u -> v."""
+    geometry = data.get('geometry')
+    if geometry is None:
+        return []
+    coords = list(geometry.coords)
+    if len(coords) <= 2:
+        return []
+    # OSMnx orients shapes along the edge; check rather than trust it
+    ux, uy = G.nodes[u]['x'], G.nodes[u]['y']
+    vx, vy = G.nodes[v]['x'], G.nodes[v]['y']
+    (x0, y0), (x1, y1) = coords[0], coords[-1]
+    if math.hypot(x0 - vx, y0 - vy) + math.hypot(x1 - ux, y1 - uy) < math.hypot(x0 - ux, y0 - uy) + math.hypot(x1 - vx, y1 - vy):
+        coords.reverse()
+    return [(y, x) for x, y in coords[1:-1]]
+
+
+def route_points(G, route_nodes):
+    """[(lat, lon), ...] along route_nodes, following each edge's shape."""
+    if not route_nodes:
+        return []
+    shapes = G.graph.get('edge_shapes')
+    nodes = G.nodes
+    adj = G._adj
+    points = []
+    for u, v in zip(route_nodes, route_nodes[1:]):
+        points.append((nodes[u]['y'], nodes[u]['x']))
+        keydict = adj[u].get(v)
+        if not keydict:
+            continue
+        k = min(keydict, key=lambda key: _travel_time(keydict[key]))
+        if shapes is not None:
+            points.extend(shapes.get(u, v, k))
+        else:
+            points.extend(interior_points(G, u, v, keydict[k]))
+    last = route_nodes[-1]
+    points.append((nodes[last]['y'], nodes[last]['x']))
+    return points
+
+
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(points, precision=5):
+    """Google encoded polyline of [(lat, lon), ...]."""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in points:
+        lat = int(math.floor(lat * factor + 0.5))
+        lon = int(math.floor(lon * factor + 0.5))
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lon - prev_lon, out)
+        prev_lat, prev_lon = lat, lon
+    return "".join(out)
+
+
+def decode_polyline(text, precision=5):
+    """[(lat, lon), ...] from a Google encoded polyline."""
+    factor = 10 ** precision
+    values = []
+    value = shift = 0
+    for char in text:
+        b = ord(char) - 63
+        value |= (b & 0x1f) << shift
+        shift += 5
+        if b < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    lat = lon = 0
+    points = []
+    for dlat, dlon in zip(values[0::2], values[1::2]):
+        lat += dlat
+        lon += dlon
+        points.append((lat / factor, lon / factor))
+    return points
+
+
+def encode_float32(points):
+    """base64 of little-endian float32 lat, lon pairs."""
+    return base64.b64encode(np.asarray(points, dtype='<f4').tobytes()).decode('ascii')
+
+
+# geometry formats for route responses: key -> (response field, encoder)
+FORMATS = {
+    "coords": ("route", lambda points: [[lat, lon] for lat, lon in points]),
+    "polyline": ("route_polyline", encode_polyline),
+    "float32": ("route_f32", encode_float32),
+}
@@ -0,0 +1,254 @@
+"""Routing searches in worker processes over a shared, read-only graph.
+
+The Python search loops hold the GIL, so running them on the request
+threadpool stalls every other handler (including the per-second
+`/simulate/step` polling). `RoutePool` runs them in a process pool
+instead. The CSR arrays are written once to a memory-mapped file (in
+/dev/shm when available) that every worker maps read-only, so no worker
+needs its own NetworkX graph.
+
+Traffic weights are double-buffered in the same file: the server writes
+the inactive buffer, then flips the active index and bumps the version in
+a small header. A worker copies the active buffer before a search when
+the version moved, re-reading if it changed during the copy.
+
+All submissions go through one gate: at most `max_pending` searches may
+be queued or running (`PoolBusy` otherwise) and each is awaited for at
+most `deadline_s` seconds (`asyncio.TimeoutError`). A search that misses
+its deadline is cancelled if it has not started; one already running
+keeps its slot until it really finishes, so abandoned searches still
+count against `max_pending`.
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from csr_graph import CSRGraph
+from metrics import REGISTRY, SEARCH_FALLBACKS
+
+
+class PoolBusy(Exception):
+    """Raised when too many routing searches are already queued."""
+
+
+def _layout(n, m):
+    """(name, dtype, shape, offset) for every array in the shared file."""
+    fields = [
+        ('header', np.int64, (2,)),
+        ('node_ids', np.int64, (n,)),
+        ('lat', np.float32, (n,)),
+        ('lon', np.float32, (n,)),
+        ('indptr', np.int32, (n + 1,)),
+        ('indices', np.int32, (m,)),
+        ('weights', np.float64, (2, m)),
+    ]
+    layout = []
+    offset = 0
+    for name, dtype, shape in fields:
+        offset = (offset + 7) // 8 * 8
+        layout.append((name, np.dtype(dtype).str, shape, offset))
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, offset
+
+
+def _map(path, layout, mode):
+    return {
+        name: np.memmap(path, dtype=np.dtype(dtype), mode=mode, offset=offset, shape=shape)
+        for name, dtype, shape, offset in layout
+    }
+
+
+class SharedGraph:
+    """Owner side of the memory-mapped CSR graph."""
+
+    def __init__(self, csr):
+        layout, size = _layout(len(csr), csr.num_edges)
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        fd, self.path = tempfile.mkstemp(prefix='ambulance-graph-', suffix='.bin', dir=directory)
+        os.ftruncate(fd, size)
+        os.close(fd)
+        self.layout = layout
+        self.arrays = _map(self.path, layout, 'r+')
+        self.arrays['node_ids'][:] = np.asarray(csr.node_ids, dtype=np.int64)
+        self.arrays['lat'][:] = csr.lat
+        self.arrays['lon'][:] = csr.lon
+        self.arrays['indptr'][:] = csr.indptr
+        self.arrays['indices'][:] = csr.indices
+        self.arrays['weights'][0] = csr.weights
+        self.arrays['header'][:] = (csr.version, 0)
+
+    def publish(self, weights, version):
+        header = self.arrays['header']
+        inactive = 1 - int(header[1])
+        self.arrays['weights'][inactive] = weights
+        header[1] = inactive
+        header[0] = version
+
+    def close(self):
+        self.arrays = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# worker-process state, set up once by _init_worker
+_shared = None
+_graph = None
+
+
+def _init_worker(path, layout):
+    global _shared, _graph
+    _shared = _map(path, layout, 'r')
+    weights, version = _read_weights()
+    _graph = CSRGraph.from_arrays(
+        _shared['node_ids'], _shared['lat'], _shared['lon'],
+        _shared['indptr'], _shared['indices'], weights, version,
+    )
+
+
+def _read_weights():
+    header = _shared['header']
+    while True:
+        version, active = int(header[0]), int(header[1])
+        weights = np.array(_shared['weights'][active])
+        if int(header[0]) == version:
+            return weights, version
+
+
+def _current_graph():
+    if int(_shared['header'][0]) != _graph.version:
+        weights, version = _read_weights()
+        _graph._publish(weights.tolist(), version)
+    return _graph
+
+
+def worker_route(start_node, end_node):
+    """A* with Dijkstra fallback in a worker; returns ((route, time), version)."""
+    graph = _current_graph()
+    try:
+        return graph.astar(start_node, end_node), graph.version
+    except Exception:
+        SEARCH_FALLBACKS.inc("csr")
+        return graph.dijkstra(start_node, end_node), graph.version
+
+
+def worker_rank(start_node, target_nodes, k):
+    """One-to-many Dijkstra in a worker; returns (results, version)."""
+    graph = _current_graph()
+    return graph.dijkstra_to_targets(start_node, target_nodes, k=k), graph.version
+
+
+def worker_batch(origin_nodes, target_nodes, k, with_routes):
+    """One-to-many Dijkstra per origin in a worker; returns (results per origin, version)."""
+    graph = _current_graph()
+    results = []
+    for origin in origin_nodes:
+        found = graph.dijkstra_to_targets(origin, target_nodes, k=k)
+        if not with_routes:
+            # routes are the bulk of the reply; leave them in the worker
+            found = [(node, travel_time, None) for node, travel_time, _ in found]
+        results.append(found)
+    return results, graph.version
+
+
+def _with_metrics(fn, *args):
+    # hand the worker's observations back with every reply
+    return fn(*args), REGISTRY.take()
+
+
+def _ping():
+    return os.getpid()
+
+
+class RoutePool:
+    def __init__(self, csr=None, workers=0, max_pending=64, deadline_s=10.0):
+        self.workers = workers if csr is not None else 0
+        self.max_pending = max_pending
+        self.deadline_s = deadline_s
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.shared = None
+        self.executor = None
+        self.threads = None    # in-process searches, started on first use
+        self._lock = threading.Lock()
+        if self.workers > 0:
+            self.shared = SharedGraph(csr)
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.shared.path, self.shared.layout),
+            )
+
+    def warm(self):
+        """Start every worker now instead of on the first request."""
+        if self.executor is not None:
+            for _ in range(self.workers):
+                self.executor.submit(_ping)
+
+    def publish(self, weights, version):
+        if self.shared is not None:
+            self.shared.publish(weights, version)
+
+    def _release(self, future):
+        # runs when the executor job ends, not when its awaiter gives up
+        with self._lock:
+            self.pending -= 1
+
+    async def _gate(self, executor, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolBusy(f"{self.pending} routing searches already pending")
+            self.pending += 1
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        try:
+            # on timeout this cancels the job if it has not started yet
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.deadline_s)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    async def run_in_worker(self, fn, *args):
+        """Run a module-level worker function (worker_route/worker_rank/worker_batch) in the pool."""
+        result, delta = await self._gate(self.executor, _with_metrics, fn, *args)
+        REGISTRY.merge(delta)
+        return result
+
+    async def run_in_thread(self, fn, *args):
+        """Run an in-process search on a thread, under the same limits."""
+        if self.threads is None:
+            with self._lock:
+                if self.threads is None:
+                    self.threads = ThreadPoolExecutor(thread_name_prefix="route")
+        return await self._gate(self.threads, fn, *args)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "deadline_s": self.deadline_s,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.threads is not None:
+            self.threads.shutdown(wait=False, cancel_futures=True)
+        if self.shared is not None:
+            self.shared.close()
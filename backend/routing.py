@@ -1,8 +1,30 @@
 import networkx as nx
+import heapq
 import math
+import time
+from itertools import count
+
+from geofencing import get_distance
+from metrics import SEARCH_EXPANDED, SEARCH_SECONDS
+
+def heuristic_speed_kph(G):
+    """Highest current speed on any edge, cached on the graph until traffic changes."""
+    speed = G.graph.get('max_speed_kph')
+    if speed is None:
+        speed = max(
+            (d.get('current_speed_kph', d.get('speed_kph', 0)) or 0 for _, _, d in G.edges(data=True)),
+            default=0,
+        )
+        G.graph['max_speed_kph'] = speed
+    return speed
 
 def heuristic(u, v, G):
-    """Heuristic function for A* - straight-line distance converted to time."""
+    """Heuristic function for A* - straight-line distance converted to time.
+
+    Longitude degrees shrink with cos(latitude), and no edge is faster than
+    the graph's top current speed, so the estimate never exceeds the real
+    travel time.
+    """
     try:
         node_u = G.nodes[u]
         node_v = G.nodes[v]
@@ -11,11 +33,14 @@ def heuristic(u, v, G):
         
         if None in (u_y, u_x, v_y, v_x):
             return 0
-            
-        # Distance in km roughly
-        dist = math.hypot(v_y - u_y, v_x - u_x) * 111
-        # Assuming max speed 80 km/h, min time in secondsī:
-        return (dist / 80) * 3600
+        speed = heuristic_speed_kph(G)
+        if speed <= 0:
+            return 0
+
+        # Distance in km, slightly under the great-circle distance
+        dx = (v_x - u_x) * math.cos(math.radians((u_y + v_y) / 2))
+        dist = math.hypot(v_y - u_y, dx) * 111
+        return (dist / speed) * 3600
     except Exception:
         return 0
 
@@ -42,13 +67,23 @@ def calculate_route_astar(G, start_node, end_node):
     The heuristic remains straight-line but the edge cost uses the latest
     `current_travel_time` value which our traffic module updates.
     """
+    started = time.perf_counter()
+    # nx caches the heuristic per queued node, so its calls count the nodes reached
+    reached = [0]
+
+    def h(u, v):
+        reached[0] += 1
+        return heuristic(u, v, G)
+
     route = nx.astar_path(
         G,
         source=start_node,
         target=end_node,
-        heuristic=lambda u, v: heuristic(u, v, G),
+        heuristic=h,
         weight=_edge_weight, # type: ignore
     )
+    SEARCH_SECONDS.since(started, "networkx", "astar")
+    SEARCH_EXPANDED.observe(reached[0], "networkx", "astar")
 
     # Calculate total travel time safely for multigraphs
     travel_time = 0
@@ -65,6 +100,154 @@ def calculate_route_astar(G, start_node, end_node):
 
 def calculate_route_dijkstra(G, start_node, end_node):
     """Fallback shortest path using Dijkstra with dynamic weights."""
+    started = time.perf_counter()
     route = nx.shortest_path(G, source=start_node, target=end_node, weight=_edge_weight)
     travel_time = nx.shortest_path_length(G, source=start_node, target=end_node, weight=_edge_weight)
+    SEARCH_SECONDS.since(started, "networkx", "dijkstra")
     return route, travel_time
+
+def calculate_routes_to_targets(G, start_node, target_nodes, k=None):
+    """One-to-many Dijkstra on the NetworkX graph.
+
+    Stops once every target (or the first `k`) is settled and returns
+    (target_node, travel_time, route_nodes) tuples sorted by travel time.
+    """
+    started = time.perf_counter()
+    remaining = set(target_nodes)
+    wanted = len(remaining) if k is None else min(k, len(remaining))
+    dist = {start_node: 0}
+    parents = {start_node: None}
+    settled = set()
+    results = []
+    c = count()
+    queue = [(0, next(c), start_node)]
+    while queue and len(results) < wanted:
+        d, _, cur = heapq.heappop(queue)
+        if cur in settled:
+            continue
+        settled.add(cur)
+        if cur in remaining:
+            route = []
+            node = cur
+            while node is not None:
+                route.append(node)
+                node = parents[node]
+            route.reverse()
+            results.append((cur, d, route))
+
+        for nbr, data in G._adj[cur].items():
+            nd = d + _edge_weight(cur, nbr, data)
+            if nbr not in dist or nd < dist[nbr]:
+                dist[nbr] = nd
+                parents[nbr] = cur
+                heapq.heappush(queue, (nd, next(c), nbr))
+    SEARCH_SECONDS.since(started, "networkx", "dijkstra_to_targets")
+    SEARCH_EXPANDED.observe(len(settled), "networkx", "dijkstra_to_targets")
+    return results
+
+def calculate_route_time_dependent(G, start_node, end_node, profiles, departure_s):
+    """A* on arrival time with historical speed profiles.
+
+    Each edge is costed at the time the ambulance is predicted to enter it
+    (departure_s is seconds since local midnight). Profiles are FIFO, so the
+    first time a node is settled is its earliest arrival. The heuristic is
+    the great-circle distance at the fastest speed in any profile, a lower
+    bound on the remaining time. Returns (route, travel_time).
+    """
+    if start_node not in G or end_node not in G:
+        raise nx.NodeNotFound(f"Either source {start_node} or target {end_node} is not in G")
+    started = time.perf_counter()
+    target = G.nodes[end_node]
+    t_lat, t_lon = target.get('y', target.get('lat')), target.get('x', target.get('lon'))
+    inv_speed = 1.0 / profiles.max_speed_ms
+    h_cache = {}
+
+    def h(n):
+        est = h_cache.get(n)
+        if est is None:
+            data = G.nodes[n]
+            est = get_distance(data.get('y', data.get('lat')), data.get('x', data.get('lon')), t_lat, t_lon) * inv_speed
+            h_cache[n] = est
+        return est
+
+    travel_time = profiles.travel_time
+    out = profiles.out
+    arrival = {start_node: 0.0}
+    parents = {start_node: None}
+    settled = set()
+    c = count()
+    queue = [(h(start_node), next(c), start_node, 0.0)]
+    while queue:
+        _, _, cur, g = heapq.heappop(queue)
+        if cur in settled:
+            continue
+        if cur == end_node:
+            route = []
+            node = cur
+            while node is not None:
+                route.append(node)
+                node = parents[node]
+            route.reverse()
+            SEARCH_SECONDS.since(started, "profiles", "astar")
+            SEARCH_EXPANDED.observe(len(settled), "profiles", "astar")
+            return route, g
+        settled.add(cur)
+
+        now = departure_s + g
+        for nbr, edge_ids in out[cur]:
+            if nbr in settled:
+                continue
+            cost = min(travel_time(e, now) for e in edge_ids)
+            ng = g + cost
+            if nbr not in arrival or ng < arrival[nbr]:
+                arrival[nbr] = ng
+                parents[nbr] = cur
+                heapq.heappush(queue, (ng + h(nbr), next(c), nbr, ng))
+    raise nx.NetworkXNoPath(f"Node {end_node} not reachable from {start_node}")
+
+def calculate_routes_to_targets_time_dependent(G, start_node, target_nodes, profiles, departure_s, k=None):
+    """One-to-many Dijkstra on arrival time with historical speed profiles.
+
+    Same result shape as calculate_routes_to_targets: (target_node,
+    travel_time, route_nodes) tuples sorted by travel time, stopping once
+    every target (or the first `k`) is settled.
+    """
+    if start_node not in G:
+        raise nx.NodeNotFound(f"Source {start_node} is not in G")
+    started = time.perf_counter()
+    remaining = set(target_nodes)
+    wanted = len(remaining) if k is None else min(k, len(remaining))
+    travel_time = profiles.travel_time
+    out = profiles.out
+    arrival = {start_node: 0.0}
+    parents = {start_node: None}
+    settled = set()
+    results = []
+    c = count()
+    queue = [(0.0, next(c), start_node)]
+    while queue and len(results) < wanted:
+        g, _, cur = heapq.heappop(queue)
+        if cur in settled:
+            continue
+        settled.add(cur)
+        if cur in remaining:
+            route = []
+            node = cur
+            while node is not None:
+                route.append(node)
+                node = parents[node]
+            route.reverse()
+            results.append((cur, g, route))
+
+        now = departure_s + g
+        for nbr, edge_ids in out[cur]:
+            if nbr in settled:
+                continue
+            ng = g + min(travel_time(e, now) for e in edge_ids)
+            if nbr not in arrival or ng < arrival[nbr]:
+                arrival[nbr] = ng
+                parents[nbr] = cur
+                heapq.heappush(queue, (ng, next(c), nbr))
+    SEARCH_SECONDS.since(started, "profiles", "dijkstra_to_targets")
+    SEARCH_EXPANDED.observe(len(settled), "profiles", "dijkstra_to_targets")
+    return results
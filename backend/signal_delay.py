@@ -0,0 +1,63 @@
+"""Expected wait at traffic signals, for signal-aware ("green wave") routing.
+
+Plain routing treats every intersection as free. In this mode reaching a
+signalized node costs the wait its phase predicts at the moment the
+ambulance gets there: nothing on GREEN, the rest of RED, or the rest of
+YELLOW plus a full RED. With preemption the ambulance turns the signal
+green ahead of arrival, so the wait shrinks to the time cross traffic
+needs to clear (`PREEMPT_RESIDUAL_S`), unless another fleet vehicle holds
+the signal, in which case it is red for us until that clean window ends.
+
+Everything the search needs is precomputed per signal as flat lists
+(`row_of` per CSR node, the controller's `anchor` per signal), so the extra
+cost per relaxation is one list lookup, plus a few arithmetic operations
+at signalized nodes.
+"""
+from signal_model import CYCLE, CYCLE_S
+
+# wait left at a preempted signal while the junction clears (s)
+PREEMPT_RESIDUAL_S = 3.0
+
+_RED_S = CYCLE[0][1]
+_GREEN_END_S = CYCLE[0][1] + CYCLE[1][1]
+
+
+class SignalDelays:
+    def __init__(self, csr, signals, controller):
+        self.controller = controller
+        self.signals = signals
+        # CSR node index -> signal position (controller index), -1 if none
+        self.row_of = [-1] * len(csr)
+        for i, s in enumerate(signals):
+            node = csr.index.get(s.get("node_id"))
+            if node is not None:
+                self.row_of[node] = i
+
+    def wait_function(self, depart_s=None, preemption=True, blocked=None):
+        """wait(row, elapsed_s) for a search leaving at depart_s.
+
+        blocked maps signal positions held by other vehicles to the time
+        their hold ends.
+        """
+        depart_s = self.controller.clock() if depart_s is None else depart_s
+        anchor = self.controller.anchor
+        until = self.controller.preempted_until
+        blocked = blocked or {}
+
+        def wait(row, elapsed):
+            t = depart_s + elapsed
+            end = blocked.get(row)
+            if end is not None and t < end:
+                return end - t
+            if until[row] is not None and t < until[row]:
+                return 0.0
+            position = (t - anchor[row]) % CYCLE_S
+            if position < _RED_S:
+                delay = _RED_S - position
+            elif position < _GREEN_END_S:
+                return 0.0
+            else:
+                delay = CYCLE_S - position + _RED_S
+            return min(delay, PREEMPT_RESIDUAL_S) if preemption else delay
+
+        return wait
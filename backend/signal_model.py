@@ -1,8 +1,23 @@
 # Traffic signal state management is now integrated with graph_loader.py
 # This module focus on signal logic and preemption.
+import heapq
+import math
+import threading
+import time
+
+# fixed-time plan shared by every signal (same phases as update_signals)
+CYCLE = [("RED", 30), ("GREEN", 40), ("YELLOW", 5)]
+CYCLE_S = sum(duration for _, duration in CYCLE)
+CLEAN_WINDOW_S = 25
+
+_preemption_listeners = []
 
 def update_signals(signals):
-    """Tick the state machine for traffic signals (1 second per tick roughly in real time, or simulation step)."""
+    """Tick the state machine for traffic signals (1 second per tick roughly in real time, or simulation step).
+
+    Kept for scripts that step signals by hand; the API runs signals on
+    time with SignalController.
+    """
     for s in signals:
         if s["timer"] > 0:
             s["timer"] -= 1
@@ -26,6 +41,118 @@ def trigger_preemption(s):
     """Set signal to Preempted Green mode for a fixed Clean Window."""
     if s["state"] != "PREEMPTED_GREEN":
         s["state"] = "PREEMPTED_GREEN"
-        s["timer"] = 25 # 25 seconds clean window
+        s["timer"] = CLEAN_WINDOW_S # 25 seconds clean window
+        for callback in _preemption_listeners:
+            callback(s)
         return True
     return False
+
+def add_preemption_listener(callback):
+    """callback(signal) runs whenever trigger_preemption switches a signal."""
+    _preemption_listeners.append(callback)
+
+def remove_preemption_listener(callback):
+    if callback in _preemption_listeners:
+        _preemption_listeners.remove(callback)
+
+class SignalController:
+    """Signal states derived from time instead of a per-call countdown.
+
+    Each signal follows the fixed CYCLE anchored at the moment one of its
+    RED phases began, so its state at any time t is a pure function of
+    (anchor, t). The initial anchors come from the signals' `timer` values
+    relative to a fixed epoch, which means every process that loads the
+    same signals agrees on every state at the same wall-clock time.
+
+    A heap holds each signal's next transition time. `advance(now)` pops
+    only the transitions that are due and writes the new state into the
+    signal dict, so an update costs nothing for signals whose phase did not
+    change, and it is independent of how often it is called. A preemption
+    holds PREEMPTED_GREEN for the clean window, then restarts the cycle
+    with RED.
+
+    `clock` is wall-clock time by default; pass a simulation clock to run
+    the signals on simulated time.
+
+    Request threads, the event loop and preemption listeners all call in,
+    so `advance` and `preempt` hold a lock while they touch the heap and
+    the signal dicts.
+    """
+    def __init__(self, signals, clock=time.time, epoch=0.0):
+        self.signals = signals
+        self.clock = clock
+        self.index = {s["id"]: i for i, s in enumerate(signals)}
+        red = CYCLE[0][1]
+        # a signal in RED with `timer` seconds left entered RED (red - timer) s ago
+        self.anchor = [epoch - (red - s.get("timer", red)) for s in signals]
+        self.preempted_until = [None] * len(signals)
+        self._generation = [0] * len(signals)
+        self._heap = []
+        self.transitions = 0
+        self.changes = 0  # bumped on every state write, for cached views
+        self._lock = threading.Lock()
+        now = clock()
+        for i in range(len(signals)):
+            self._schedule(i, now)
+        heapq.heapify(self._heap)
+        add_preemption_listener(self._on_preempt)
+
+    def close(self):
+        remove_preemption_listener(self._on_preempt)
+
+    def state_at(self, i, t):
+        """(state, seconds until the next transition) of signal i at time t."""
+        until = self.preempted_until[i]
+        if until is not None and t < until:
+            return "PREEMPTED_GREEN", until - t
+        position = (t - self.anchor[i]) % CYCLE_S
+        for state, duration in CYCLE:
+            if position < duration:
+                return state, duration - position
+            position -= duration
+        return CYCLE[0][0], CYCLE[0][1]
+
+    def _schedule(self, i, now, push=False):
+        state, remaining = self.state_at(i, now)
+        s = self.signals[i]
+        s["state"] = state
+        s["timer"] = int(math.ceil(remaining))
+        self.changes += 1
+        entry = (now + remaining, self._generation[i], i)
+        if push:
+            heapq.heappush(self._heap, entry)
+        else:
+            self._heap.append(entry)
+
+    def advance(self, now=None):
+        """Apply every transition due by `now`; returns the signals that changed."""
+        now = self.clock() if now is None else now
+        changed = []
+        heap = self._heap
+        with self._lock:
+            while heap and heap[0][0] <= now:
+                _, generation, i = heapq.heappop(heap)
+                if generation != self._generation[i]:
+                    continue  # re-planned by a preemption
+                if self.preempted_until[i] is not None and now >= self.preempted_until[i]:
+                    self.preempted_until[i] = None
+                self._schedule(i, now, push=True)
+                self.transitions += 1
+                changed.append(self.signals[i])
+        return changed
+
+    def preempt(self, s, now=None):
+        """Give signal s a clean window of PREEMPTED_GREEN starting now."""
+        now = self.clock() if now is None else now
+        i = self.index[s["id"]]
+        with self._lock:
+            self.preempted_until[i] = now + CLEAN_WINDOW_S
+            # the regular cycle restarts with RED once the window closes
+            self.anchor[i] = now + CLEAN_WINDOW_S
+            self._generation[i] += 1
+            self._schedule(i, now, push=True)
+
+    def _on_preempt(self, s):
+        # preempt() takes the lock; trigger_preemption already wrote the state
+        if s["id"] in self.index and self.signals[self.index[s["id"]]] is s:
+            self.preempt(s)
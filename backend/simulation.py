@@ -1,5 +1,77 @@
-from geofencing import check_geofence
+from geofencing import check_geofence, get_distance
+from metrics import PREEMPTIONS
+from signal_model import trigger_preemption
 
-def simulate_step(current_lat, current_lon, signals):
+# preempt an on-route signal when the ambulance is this many seconds away
+PREEMPT_LEAD_TIME_S = 20
+
+def simulate_step(current_lat, current_lon, signals, index=None):
     """Geofencing check: trigger preemption if signal is within range."""
-    return check_geofence(current_lat, current_lon, signals)
+    return check_geofence(current_lat, current_lon, signals, index=index)
+
+class RouteCorridor:
+    """The signals along one computed route, ordered by distance along it.
+
+    Built once when the route is computed. Each simulation step advances a
+    cursor along the route vertices and a cursor over the upcoming signals,
+    so a tick costs O(1) amortized. Signals on cross streets the ambulance
+    never passes are never preempted.
+    """
+    def __init__(self, G, route_nodes, signals_by_node):
+        self.lats = [G.nodes[n]['y'] for n in route_nodes]
+        self.lons = [G.nodes[n]['x'] for n in route_nodes]
+
+        # cumulative distance (m) along the route at each vertex
+        self.dist_along = [0.0]
+        for i in range(1, len(route_nodes)):
+            self.dist_along.append(self.dist_along[-1] + get_distance(
+                self.lats[i - 1], self.lons[i - 1], self.lats[i], self.lons[i]))
+
+        # (distance along route, signal) for every signalized node on the route
+        self.nodes = list(route_nodes)
+        self.stops = []
+        self.stop_vertices = []
+        for i, n in enumerate(route_nodes):
+            if G.nodes[n].get('is_signal') and n in signals_by_node:
+                self.stops.append((self.dist_along[i], signals_by_node[n]))
+                self.stop_vertices.append(i)
+
+        self.vertex = 0
+        self.next_stop = 0
+
+    def locate(self, lat, lon):
+        """Advance the vertex cursor to the route vertex nearest (lat, lon)."""
+        last = len(self.lats) - 1
+        here = get_distance(lat, lon, self.lats[self.vertex], self.lons[self.vertex])
+        while self.vertex < last:
+            ahead = get_distance(lat, lon, self.lats[self.vertex + 1], self.lons[self.vertex + 1])
+            if ahead > here:
+                break
+            self.vertex += 1
+            here = ahead
+        return self.dist_along[self.vertex]
+
+    def upcoming_signals(self):
+        return [s for _, s in self.stops[self.next_stop:]]
+
+    def step(self, lat, lon, speed_kmh, lead_time_s=PREEMPT_LEAD_TIME_S):
+        """Preempt on-route signals the ambulance will reach within lead_time_s."""
+        position = self.locate(lat, lon)
+        speed_ms = max(speed_kmh, 1.0) / 3.6
+
+        # drop signals already passed
+        while self.next_stop < len(self.stops) and self.stops[self.next_stop][0] < position:
+            self.next_stop += 1
+
+        preempted = 0
+        i = self.next_stop
+        while i < len(self.stops):
+            dist_along, s = self.stops[i]
+            eta = (dist_along - position) / speed_ms
+            if eta > lead_time_s:
+                break
+            if s["state"] != "PREEMPTED_GREEN" and trigger_preemption(s):
+                preempted += 1
+            i += 1
+        PREEMPTIONS.observe(preempted, "corridor")
+        return preempted > 0
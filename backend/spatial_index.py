@@ -0,0 +1,55 @@
+"""KD-tree over lat/lon points for nearest-node snapping and radius queries.
+
+Points are placed on the unit sphere, so straight-line (chord) distance
+orders neighbours exactly like great-circle distance. The tree is built
+once, and each query costs O(log n) instead of a scan over every node.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_M = 6371e3
+
+
+def to_xyz(lats, lons):
+    """Unit-sphere coordinates for arrays of lat/lon degrees."""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)), axis=-1)
+
+
+def chord_for_radius(radius_m):
+    # straight-line distance through the sphere for an arc of radius_m
+    return 2 * np.sin(radius_m / (2 * EARTH_RADIUS_M))
+
+
+class SpatialIndex:
+    def __init__(self, ids, lats, lons):
+        self.ids = np.asarray(ids)
+        self.tree = cKDTree(to_xyz(lats, lons))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, lats, lons):
+        """IDs of the nearest points for arrays of query coordinates."""
+        _, idx = self.tree.query(to_xyz(np.atleast_1d(lats), np.atleast_1d(lons)))
+        return self.ids[idx]
+
+    def nearest_k(self, lat, lon, k):
+        """Positions (into ids) of the k points nearest one location, nearest first."""
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return []
+        _, idx = self.tree.query(to_xyz(lat, lon), k=k)
+        return np.atleast_1d(idx).tolist()
+
+    def within(self, lat, lon, radius_m):
+        """Positions (into ids) of all points within radius_m of one location."""
+        return self.tree.query_ball_point(to_xyz(lat, lon), chord_for_radius(radius_m))
+
+    def within_many(self, lats, lons, radius_m):
+        """`within` for many locations at once; returns one list per location."""
+        return self.tree.query_ball_point(
+            to_xyz(np.atleast_1d(lats), np.atleast_1d(lons)), chord_for_radius(radius_m)
+        )
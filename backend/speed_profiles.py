@@ -0,0 +1,147 @@
+"""Historical speed profiles: expected speed per edge by time of day.
+
+Every edge gets one speed per time-of-day bucket (15 minutes by default),
+stored once as an (edges x buckets) float32 array in m/s, already clamped
+to MIN_SPEED_KPH: about 22 MB for the Kochi graph. Edges without observed
+data keep their base speed in every bucket.
+
+Travel times are computed by driving the edge through the buckets: the
+vehicle moves at the bucket's speed until the bucket ends, then continues
+at the next bucket's speed. Leaving later can therefore never mean
+arriving earlier (the FIFO property), so a label-setting search on arrival
+time such as `routing.calculate_route_time_dependent` stays exact.
+
+Profiles are loaded from a CSV or Parquet file of observed speeds with the
+columns `u`, `v`, optional `key` (default 0), `speed_kph`, and either
+`bucket` (index into the day) or `time` ("HH:MM" local time). Repeated
+observations for the same edge and bucket are averaged. Loading needs
+pandas (and pyarrow for Parquet), imported only when a file is read.
+"""
+import numpy as np
+
+from traffic import MIN_SPEED_KPH
+
+DAY_S = 24 * 3600
+BUCKET_S = 15 * 60
+
+
+def _to_ms(speeds_kph):
+    return (np.maximum(np.asarray(speeds_kph, dtype=np.float64), MIN_SPEED_KPH) / 3.6).astype(np.float32)
+
+
+class SpeedProfileError(Exception):
+    """Raised when a speed profile file cannot be read."""
+
+
+class SpeedProfiles:
+    def __init__(self, G, bucket_s=BUCKET_S):
+        if DAY_S % bucket_s:
+            raise ValueError("bucket_s must divide a day")
+        self.bucket_s = bucket_s
+        self.num_buckets = DAY_S // bucket_s
+
+        # edge IDs follow G.edges order, same as TrafficModel
+        self.edge_id = {}
+        self.out = {}   # u -> [(v, (edge_id, ...)), ...] with parallel edges grouped
+        length, base = [], []
+        for u, nbrs in G._adj.items():
+            groups = []
+            for v, keydict in nbrs.items():
+                ids = []
+                for k, data in keydict.items():
+                    ids.append(len(length))
+                    self.edge_id[(u, v, k)] = ids[-1]
+                    length.append(data.get('length', 0.0))
+                    base.append(data.get('base_speed_kph', data.get('speed_kph', 50.0)))
+                groups.append((v, tuple(ids)))
+            self.out[u] = groups
+        self.length = np.array(length, dtype=np.float64)
+        self._length = self.length.tolist()
+        self.speed_ms = np.repeat(_to_ms(base)[:, None], self.num_buckets, axis=1)
+        self._finalize()
+
+    def __len__(self):
+        return len(self.length)
+
+    def _finalize(self):
+        # flat row-major view; memoryview indexing yields plain floats fast
+        self._speed_ms = memoryview(self.speed_ms.ravel())
+        # fastest speed anywhere, any time: bounds every remaining trip from below
+        ms = self.speed_ms
+        self.max_speed_ms = float(ms.max()) if ms.size else MIN_SPEED_KPH / 3.6
+
+    def bucket(self, t):
+        """Bucket index for t seconds since local midnight (wraps daily)."""
+        return int(t % DAY_S // self.bucket_s)
+
+    def set_speeds(self, edge_ids, buckets, speeds_kph):
+        """Overwrite profile entries (vectorized), then refresh the speed bound."""
+        self.speed_ms[np.asarray(edge_ids), np.asarray(buckets)] = _to_ms(speeds_kph)
+        self._finalize()
+
+    def travel_time(self, edge_id, t):
+        """Seconds to traverse edge_id when entering it at time t."""
+        nb = self.num_buckets
+        bs = self.bucket_s
+        speeds = self._speed_ms
+        row = edge_id * nb
+        remaining = self._length[edge_id]
+        tod = t % DAY_S
+        b = int(tod // bs)
+        window = (b + 1) * bs - tod
+        elapsed = 0.0
+        while True:
+            v = speeds[row + b]
+            if v * window >= remaining:
+                return elapsed + remaining / v
+            remaining -= v * window
+            elapsed += window
+            window = bs
+            b = b + 1 if b + 1 < nb else 0
+
+    def load(self, path):
+        """Read observed speeds from a .csv or .parquet file; returns rows applied."""
+        try:
+            import pandas as pd
+
+            if str(path).endswith('.parquet'):
+                df = pd.read_parquet(path)
+            else:
+                df = pd.read_csv(path)
+        except (OSError, ValueError, ImportError) as e:
+            raise SpeedProfileError(f"cannot read {path}: {e}") from e
+
+        missing = {'u', 'v', 'speed_kph'} - set(df.columns)
+        if missing or ('bucket' not in df.columns and 'time' not in df.columns):
+            raise SpeedProfileError(
+                f"{path} needs u, v, speed_kph and bucket or time columns"
+            )
+        try:
+            if 'bucket' in df.columns:
+                buckets = df['bucket'].astype(np.int64) % self.num_buckets
+            else:
+                hm = df['time'].astype(str).str.split(':', expand=True)
+                if hm.shape[1] < 2:
+                    raise ValueError("time must be HH:MM")
+                hm = hm[[0, 1]].astype(np.int64)
+                buckets = (hm[0] * 3600 + hm[1] * 60) // self.bucket_s % self.num_buckets
+            keys = df['key'] if 'key' in df.columns else pd.Series(0, index=df.index)
+
+            ids = [
+                self.edge_id.get((u, v, k), -1)
+                for u, v, k in zip(df['u'].tolist(), df['v'].tolist(), keys.astype(np.int64).tolist())
+            ]
+            obs = pd.DataFrame({'edge': ids, 'bucket': buckets, 'speed': df['speed_kph'].astype(np.float64)})
+        except (ValueError, TypeError, KeyError) as e:
+            raise SpeedProfileError(f"bad values in {path}: {e}") from e
+        obs = obs[obs['edge'] >= 0].groupby(['edge', 'bucket'], as_index=False)['speed'].mean()
+        self.set_speeds(obs['edge'].to_numpy(), obs['bucket'].to_numpy(), obs['speed'].to_numpy())
+        return len(obs)
+
+
+def load_speed_profiles(G, path, bucket_s=BUCKET_S):
+    """SpeedProfiles for G filled from a CSV/Parquet file of observed speeds."""
+    profiles = SpeedProfiles(G, bucket_s=bucket_s)
+    count = profiles.load(path)
+    print(f"Loaded {count} edge/time-of-day speed entries from {path}.")
+    return profiles
@@ -1,4 +1,34 @@
 import random
+import threading
+import time
+
+import numpy as np
+
+from metrics import TRAFFIC_SECONDS
+
+
+MIN_SPEED_KPH = 5.0
+
+
+def travel_time_s(length_m, speed_kph):
+    """Seconds to cover length_m meters at speed_kph."""
+    return length_m / speed_kph * 3.6
+
+
+def random_speed(data, variation):
+    base = data.get('base_speed_kph', data.get('speed_kph', 50.0))
+    # randomly vary around base
+    factor = 1 + random.uniform(-variation, variation)
+    return max(MIN_SPEED_KPH, base * factor)
+
+
+def set_edge_speed(data, new_speed):
+    data['current_speed_kph'] = new_speed
+    length = data.get('length', 0.0)
+    if new_speed > 0:
+        data['current_travel_time'] = travel_time_s(length, new_speed)
+    else:
+        data['current_travel_time'] = data.get('travel_time', 0)
 
 
 def randomize_traffic(G, variation=0.3):
@@ -8,17 +38,140 @@ def randomize_traffic(G, variation=0.3):
     Speeds are clamped to a reasonable minimum (5 km/h) to avoid zero.
     After adjusting, update the edge's current_travel_time accordingly.
     """
+    started = time.perf_counter()
     for u, v, k, data in G.edges(keys=True, data=True):
-        base = data.get('base_speed_kph', data.get('speed_kph', 50.0))
+        set_edge_speed(data, random_speed(data, variation))
+    # routing.heuristic_speed_kph re-reads the top speed
+    G.graph.pop('max_speed_kph', None)
+    TRAFFIC_SECONDS.since(started, "randomize_traffic")
+
+
+class TrafficModel:
+    """Array-backed edge speeds with sparse, versioned updates.
+
+    Edges get stable integer IDs. Base speed, current speed, length and
+    travel time live in contiguous NumPy arrays indexed by edge ID, so
+    randomizing, clamping, recomputing travel times and summary statistics
+    are single vectorized operations. A traffic tick (random or from a live
+    feed) only touches the edges whose speed changed. Every applied delta
+    bumps `version` and is passed to the listeners as an array of changed
+    edge IDs, so routing engines refresh just those weights.
+
+    The NetworkX edge attributes are synced lazily: call `sync_graph()`
+    before reading current_speed_kph / current_travel_time from G.
+    """
+
+    def __init__(self, G, seed=None):
+        self.G = G
+        self.edges = list(G.edges(keys=True, data=True))
+        self.edge_id = {(u, v, k): i for i, (u, v, k, _) in enumerate(self.edges)}
+        data = [d for _, _, _, d in self.edges]
+        self.length = np.array([d.get('length', 0.0) for d in data], dtype=np.float64)
+        self.base_speed = np.array(
+            [d.get('base_speed_kph', d.get('speed_kph', 50.0)) for d in data], dtype=np.float64
+        )
+        self.speed = np.array(
+            [d.get('current_speed_kph', d.get('base_speed_kph', 50.0)) for d in data], dtype=np.float64
+        )
+        self.travel_time = np.array(
+            [d.get('current_travel_time', d.get('travel_time', 0)) for d in data], dtype=np.float64
+        )
+        self._dirty = np.zeros(len(self.edges), dtype=np.bool_)
+        self.rng = np.random.default_rng(seed)
+        self.version = 0
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.edges)
+
+    def add_listener(self, callback):
+        """callback(changed_edge_ids, version) runs after every applied delta."""
+        self.listeners.append(callback)
+
+    def apply_updates(self, edge_ids, speeds=None):
+        """Apply a sparse delta of new speeds (km/h).
+
+        Takes either two arrays (edge_ids, speeds) or one iterable of
+        (edge_id, speed_kph) pairs. Returns the new version, or the current
+        one if nothing changed.
+        """
+        started = time.perf_counter()
+        if speeds is None:
+            pairs = list(edge_ids)
+            edge_ids = [e for e, _ in pairs]
+            speeds = [s for _, s in pairs]
+        edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        speeds = np.maximum(MIN_SPEED_KPH, np.asarray(speeds, dtype=np.float64))
+
+        with self._lock:
+            changed = speeds != self.speed[edge_ids]
+            edge_ids = edge_ids[changed]
+            if edge_ids.size == 0:
+                return self.version
+            speeds = speeds[changed]
+            self.speed[edge_ids] = speeds
+            self.travel_time[edge_ids] = travel_time_s(self.length[edge_ids], speeds)
+            self._dirty[edge_ids] = True
+            self.version += 1
+            version = self.version
+            notified = time.perf_counter()
+            for callback in self.listeners:
+                callback(edge_ids, version)
+        TRAFFIC_SECONDS.since(notified, "listeners")
+        TRAFFIC_SECONDS.since(started, "apply_updates")
+        return version
+
+    def _random_speeds(self, edge_ids, variation):
         # randomly vary around base
-        factor = 1 + random.uniform(-variation, variation)
-        new_speed = max(5.0, base * factor)
-        data['current_speed_kph'] = new_speed
-        length = data.get('length', 0.0)
-        if new_speed > 0:
-            data['current_travel_time'] = length / new_speed * 3600
-        else:
-            data['current_travel_time'] = data.get('travel_time', 0)
+        factor = 1 + self.rng.uniform(-variation, variation, size=len(edge_ids))
+        return self.base_speed[edge_ids] * factor
+
+    def tick(self, fraction=0.02, variation=0.3):
+        """Randomly re-draw the speed of `fraction` of the edges."""
+        started = time.perf_counter()
+        count = min(len(self.edges), max(1, int(len(self.edges) * fraction)))
+        edge_ids = self.rng.choice(len(self.edges), size=count, replace=False)
+        version = self.apply_updates(edge_ids, self._random_speeds(edge_ids, variation))
+        TRAFFIC_SECONDS.since(started, "tick")
+        return version
+
+    def randomize(self, variation=0.3):
+        """Re-draw every edge speed (the old whole-graph randomize_traffic)."""
+        started = time.perf_counter()
+        edge_ids = np.arange(len(self.edges))
+        version = self.apply_updates(edge_ids, self._random_speeds(edge_ids, variation))
+        TRAFFIC_SECONDS.since(started, "randomize")
+        return version
+
+    def summary(self):
+        """min/avg/max current speed over all edges, like get_overall_traffic."""
+        if not len(self.edges):
+            return {}
+        speed = self.speed
+        return {
+            'min_speed': float(speed.min()),
+            'max_speed': float(speed.max()),
+            'avg_speed': float(speed.mean()),
+            'count': int(speed.size),
+        }
+
+    def sync_graph(self):
+        """Write speeds changed since the last sync back to the NetworkX edges."""
+        started = time.perf_counter()
+        with self._lock:
+            dirty = np.flatnonzero(self._dirty)
+            if dirty.size == 0:
+                return
+            for i, speed, travel_time in zip(
+                dirty.tolist(), self.speed[dirty].tolist(), self.travel_time[dirty].tolist()
+            ):
+                data = self.edges[i][3]
+                data['current_speed_kph'] = speed
+                data['current_travel_time'] = travel_time
+            self._dirty[dirty] = False
+            self.G.graph['max_speed_kph'] = float(self.speed.max())
+        TRAFFIC_SECONDS.since(started, "sync_graph")
 
 
 def get_route_traffic(G, route_nodes):
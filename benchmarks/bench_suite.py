@@ -0,0 +1,241 @@
+"""Offline latency benchmarks for routing, geofencing, signals and the API.
+
+Usage:
+    python benchmarks/bench_suite.py [--scale kochi|10x] [--seed N]
+                                     [--snapshot PATH] [--queries N]
+                                     [--only NAME ...] [--save-baseline]
+
+Runs on a seeded synthetic graph (see synthetic_graph.py) or on a saved
+snapshot, never on the network. Every case is timed call by call and
+reported as p50/p95/p99 latency plus throughput. The API cases go through
+the real FastAPI app in-process (TestClient, with the lifespan), with
+background ticks and worker processes turned off so that runs are
+repeatable.
+
+Results are compared with benchmarks/baseline.json, which stores one
+entry per graph label (e.g. "synthetic-kochi-42"). A case whose p50 or
+p95 is more than --tolerance (and --min-delta-ms) slower than its
+baseline is reported as a regression, and the script then exits with
+status 1. --save-baseline writes the current numbers as the new baseline
+for that graph.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(script_dir, '..', 'backend')
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from synthetic_graph import SCALES, synthetic_snapshot
+
+BASELINE_PATH = os.path.join(script_dir, 'baseline.json')
+CACHE_DIR = os.path.join(script_dir, 'cache')
+
+
+def measure(fn, calls, warmup=1):
+    """Per-call latencies (ms) of fn(i) for i in range(calls)."""
+    for i in range(warmup):
+        fn(i)
+    latencies = []
+    for i in range(calls):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    lat = np.asarray(latencies)
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+    return {
+        "calls": len(lat),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "per_s": round(len(lat) / (lat.sum() / 1000), 1) if lat.sum() > 0 else None,
+    }
+
+
+def library_cases(G, signals, queries, seed):
+    """(name, fn(i), calls) for the backend functions."""
+    from csr_graph import CSRGraph
+    from graph_loader import get_nearest_node
+    from geofencing import SignalIndex, check_geofence
+    from landmarks import LandmarkRouter
+    from routing import calculate_route_astar, calculate_route_dijkstra
+    from signal_model import update_signals
+    from traffic import randomize_traffic
+
+    rng = random.Random(seed)
+    nodes = list(G.nodes)
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(queries)]
+    lats = [G.nodes[n]['y'] for n in nodes]
+    lons = [G.nodes[n]['x'] for n in nodes]
+    points = [
+        (rng.uniform(min(lats), max(lats)), rng.uniform(min(lons), max(lons)))
+        for _ in range(queries * 10)
+    ]
+    index = SignalIndex(signals)
+    csr = CSRGraph(G)
+    alt = LandmarkRouter(csr)
+
+    return [
+        ("calculate_route_astar", lambda i: calculate_route_astar(G, *pairs[i]), queries),
+        ("calculate_route_dijkstra", lambda i: calculate_route_dijkstra(G, *pairs[i]), queries),
+        ("CSRGraph.astar", lambda i: csr.astar(*pairs[i]), queries),
+        ("LandmarkRouter.query", lambda i: alt.query(*pairs[i]), queries),
+        ("get_nearest_node", lambda i: get_nearest_node(G, *points[i]), len(points)),
+        ("check_geofence", lambda i: check_geofence(*points[i], signals, index=index), len(points)),
+        ("check_geofence (scan)", lambda i: check_geofence(*points[i], signals), len(points)),
+        ("update_signals", lambda i: update_signals(signals), len(points)),
+        ("randomize_traffic", lambda i: randomize_traffic(G), max(3, queries // 10)),
+    ]
+
+
+def api_cases(snapshot, queries, seed):
+    """(name, fn(i), calls) for /route and /simulate/step through the app."""
+    os.environ['GRAPH_SNAPSHOT'] = snapshot
+    for name in ('TRAFFIC_TICK_S', 'FLEET_TICK_S', 'ROUTE_WORKERS'):
+        os.environ[name] = '0'
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    client.__enter__()
+    G = main.G
+    rng = random.Random(seed + 1)
+    nodes = list(G.nodes)
+    starts = [G.nodes[rng.choice(nodes)] for _ in range(queries)]
+    cases = ["Trauma", "Cardiac", "General"]
+    bodies = [
+        {"start_lat": s['y'], "start_lon": s['x'], "case_type": cases[i % len(cases)]}
+        for i, s in enumerate(starts)
+    ]
+
+    # one route and one registered vehicle to step through
+    trip = client.post('/route', json=bodies[0]).json()
+    vehicle_id = client.post('/fleet/vehicles', json={"route_id": trip["route_id"]}).json()["vehicle_id"]
+    route = trip["route"]
+
+    def route_call(i):
+        r = client.post('/route', json=bodies[i])
+        r.raise_for_status()
+
+    def step_fleet(i):
+        r = client.post('/simulate/step', json={"vehicle_id": vehicle_id, "include_signals": False})
+        r.raise_for_status()
+
+    def step_client(i):
+        lat, lon = route[i % len(route)]
+        r = client.post('/simulate/step', json={
+            "current_lat": lat, "current_lon": lon, "route": route, "route_id": trip["route_id"],
+        })
+        r.raise_for_status()
+
+    def close():
+        client.__exit__(None, None, None)
+
+    return [
+        ("POST /route", route_call, queries),
+        ("POST /simulate/step (fleet)", step_fleet, queries * 5),
+        ("POST /simulate/step (client)", step_client, queries * 5),
+    ], close
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Print the table; returns the names of regressed cases.
+
+    A case regresses when its p50 or p95 is more than `tolerance` slower
+    than the baseline and also by more than `min_delta_ms`, so that timer
+    noise on microsecond-scale cases is not reported.
+    """
+    regressions = []
+    print(f"{'case':<32}{'calls':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'per s':>10}  vs baseline")
+    for name, stats in results.items():
+        base = baseline.get(name)
+        note = ""
+        if base:
+            slower = [
+                k for k in ('p50_ms', 'p95_ms')
+                if base.get(k) and stats[k] > base[k] * (1 + tolerance) and stats[k] - base[k] > min_delta_ms
+            ]
+            note = f"x{stats['p50_ms'] / base['p50_ms']:.2f} p50" if base.get('p50_ms') else ""
+            if slower:
+                regressions.append(name)
+                note += "  REGRESSION"
+        print(f"{name:<32}{stats['calls']:>7}{stats['p50_ms']:>11.3f}{stats['p95_ms']:>11.3f}"
+              f"{stats['p99_ms']:>11.3f}{stats['per_s'] or 0:>10.1f}  {note}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='kochi')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--snapshot', help="benchmark a saved graph snapshot instead")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--only', nargs='*', help="case names (prefix match)")
+    parser.add_argument('--no-api', action='store_true', help="skip the in-process API cases")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-delta-ms', type=float, default=0.05)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    if args.snapshot:
+        snapshot = args.snapshot
+        label = os.path.splitext(os.path.basename(snapshot))[0]
+    else:
+        snapshot = synthetic_snapshot(args.scale, args.seed, CACHE_DIR)
+        label = f"synthetic-{args.scale}-{args.seed}"
+
+    from graph_loader import load_graph
+    random.seed(args.seed)
+    G, signals = load_graph(snapshot_path=snapshot)
+    print(f"{label}: {len(G.nodes)} nodes, {len(G.edges)} edges, {len(signals)} signals")
+
+    cases = library_cases(G, signals, args.queries, args.seed)
+    close = None
+    if not args.no_api:
+        more, close = api_cases(snapshot, args.queries, args.seed)
+        cases += more
+    if args.only:
+        cases = [c for c in cases if any(c[0].startswith(p) for p in args.only)]
+
+    results = {}
+    try:
+        for name, fn, calls in cases:
+            results[name] = summarize(measure(fn, calls))
+    finally:
+        if close is not None:
+            close()
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+    regressions = compare(results, stored.get(label, {}).get("cases", {}), args.tolerance, args.min_delta_ms)
+
+    if args.save_baseline:
+        entry = stored.setdefault(label, {"cases": {}})
+        entry["nodes"] = len(G.nodes)
+        entry["edges"] = len(G.edges)
+        entry["cases"].update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baseline for {label} to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
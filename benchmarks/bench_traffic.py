@@ -0,0 +1,59 @@
+"""Compare the per-edge traffic loop against the array-backed TrafficModel.
+
+Usage: python benchmarks/bench_traffic.py [--snapshot PATH] [--repeat N]
+
+Loads the Kochi graph (from the snapshot if present, otherwise via OSMnx)
+and times a whole-graph randomize, a 2% tick and the overall summary.
+"""
+import argparse
+import os
+import sys
+import time
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(script_dir, '..', 'backend')
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from graph_loader import load_graph
+from traffic import TrafficModel, randomize_traffic, get_overall_traffic
+
+
+def best_of(repeat, fn):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--snapshot', default=os.environ.get('GRAPH_SNAPSHOT', os.path.join(backend_dir, 'graph_snapshot.npz')))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    G, _ = load_graph(snapshot_path=args.snapshot)
+    model = TrafficModel(G, seed=42)
+    print(f"{len(G.nodes)} nodes, {len(model)} edges, best of {args.repeat}")
+
+    rows = [
+        ("randomize (all edges)",
+         best_of(args.repeat, lambda: randomize_traffic(G)),
+         best_of(args.repeat, model.randomize)),
+        ("overall summary",
+         best_of(args.repeat, lambda: get_overall_traffic(G)),
+         best_of(args.repeat, model.summary)),
+        ("tick (2% of edges)", None, best_of(args.repeat, model.tick)),
+    ]
+    print(f"{'operation':<24}{'loop ms':>10}{'numpy ms':>10}{'speedup':>9}")
+    for name, loop_ms, numpy_ms in rows:
+        if loop_ms is None:
+            print(f"{name:<24}{'-':>10}{numpy_ms:>10.2f}{'-':>9}")
+        else:
+            print(f"{name:<24}{loop_ms:>10.2f}{numpy_ms:>10.2f}{loop_ms / numpy_ms:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Seeded synthetic road graphs at Kochi scale, for offline benchmarks.
+
+A jittered grid over the Kochi bounding box: two-way residential streets,
+a faster arterial every tenth row and column, some diagonal shortcuts and
+about 5% of the streets removed. Only the largest connected part is kept.
+"kochi" has about as many nodes as the prepared Kochi drive graph (~14k),
+and "10x" has ten times as many. The arrays use the snapshot layout
+(graph_snapshot.graph_to_arrays), so the result loads like a real
+snapshot and can be saved as one for the API.
+"""
+import os
+import sys
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(script_dir, '..', 'backend')
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from graph_snapshot import (
+    EDGE_FLOAT_ATTRS, SnapshotError, arrays_to_graph, encode_tags, read_snapshot_arrays, save_snapshot,
+)
+
+# grid side per scale
+SCALES = {"kochi": 120, "10x": 380}
+# south, west, north, east: covers every hospital in hospital_data
+BBOX = (9.90, 76.20, 10.12, 76.42)
+SIGNALS_PER_NODE = 200 / 14400
+
+
+def synthetic_arrays(side, seed=42):
+    """Snapshot arrays for a side x side grid graph."""
+    rng = np.random.default_rng(seed)
+    south, west, north, east = BBOX
+    n = side * side
+    rows, cols = np.divmod(np.arange(n), side)
+    step_lat = (north - south) / (side - 1)
+    step_lon = (east - west) / (side - 1)
+    lat = south + rows * step_lat + rng.uniform(-0.2, 0.2, n) * step_lat
+    lon = west + cols * step_lon + rng.uniform(-0.2, 0.2, n) * step_lon
+
+    ids = np.arange(n).reshape(side, side)
+    right = np.stack((ids[:, :-1].ravel(), ids[:, 1:].ravel()), axis=1)
+    down = np.stack((ids[:-1, :].ravel(), ids[1:, :].ravel()), axis=1)
+    diagonal = np.stack((ids[:-1, :-1].ravel(), ids[1:, 1:].ravel()), axis=1)
+    diagonal = diagonal[rng.random(len(diagonal)) < 0.1]
+    roads = np.concatenate((right, down, diagonal))
+    # arterials: both ends on a row or column that is a multiple of 10
+    arterial = ((rows[roads[:, 0]] % 10 == 0) & (rows[roads[:, 1]] % 10 == 0)) | (
+        (cols[roads[:, 0]] % 10 == 0) & (cols[roads[:, 1]] % 10 == 0)
+    )
+    keep = arterial | (rng.random(len(roads)) > 0.05)
+    roads, arterial = roads[keep], arterial[keep]
+
+    # largest connected part (every road is two-way, so it is strongly connected)
+    adjacency = coo_matrix((np.ones(len(roads)), (roads[:, 0], roads[:, 1])), shape=(n, n))
+    _, label = connected_components(adjacency, directed=False)
+    main = np.argmax(np.bincount(label))
+    alive = label == main
+    roads_ok = alive[roads[:, 0]] & alive[roads[:, 1]]
+    roads, arterial = roads[roads_ok], arterial[roads_ok]
+    new_index = np.cumsum(alive) - 1
+
+    speed = np.where(arterial, 60.0, rng.choice([30.0, 40.0, 50.0], len(roads)))
+    u = np.concatenate((roads[:, 0], roads[:, 1]))
+    v = np.concatenate((roads[:, 1], roads[:, 0]))
+    speed = np.concatenate((speed, speed))
+    highway = np.where(np.concatenate((arterial, arterial)), 'primary', 'residential').tolist()
+    mid_lat = np.radians((lat[u] + lat[v]) / 2)
+    length = np.hypot(
+        (lat[u] - lat[v]) * 111_000, (lon[u] - lon[v]) * 111_000 * np.cos(mid_lat)
+    )
+    travel_time = length / speed * 3.6
+
+    node_count = int(alive.sum())
+    signal_count = max(1, round(node_count * SIGNALS_PER_NODE))
+    arrays = {
+        'node_id': (1_000_000 + np.flatnonzero(alive)).astype(np.int64),
+        'node_x': lon[alive],
+        'node_y': lat[alive],
+        'node_is_signal': np.zeros(node_count, dtype=np.bool_),
+        'edge_u': new_index[u].astype(np.int32),
+        'edge_v': new_index[v].astype(np.int32),
+        'edge_key': np.zeros(len(u), dtype=np.int32),
+        'signal_node': np.sort(rng.choice(node_count, signal_count, replace=False)).astype(np.int32),
+        'signal_timer': rng.integers(10, 31, signal_count).astype(np.int32),
+        # straight streets: no shape points between the ends
+        'edge_shape_offset': np.zeros(len(u) + 1, dtype=np.int64),
+        'shape_x': np.zeros(0),
+        'shape_y': np.zeros(0),
+        'node_tags': encode_tags([], []),
+        'edge_tags': encode_tags([{'highway': h} for h in highway], ['highway']),
+    }
+    arrays['node_is_signal'][arrays['signal_node']] = True
+    columns = {
+        'length': length,
+        'speed_kph': speed,
+        'travel_time': travel_time,
+        'base_speed_kph': speed,
+        'current_speed_kph': speed,
+        'current_travel_time': travel_time,
+    }
+    for attr in EDGE_FLOAT_ATTRS:
+        arrays['edge_' + attr] = columns[attr]
+    return arrays
+
+
+def synthetic_graph(scale="kochi", seed=42):
+    """(G, signals) for a named scale."""
+    return arrays_to_graph(synthetic_arrays(SCALES[scale], seed))
+
+
+def synthetic_snapshot(scale, seed, directory):
+    """Path of a snapshot for (scale, seed), written on first use."""
+    path = os.path.join(directory, f"synthetic-{scale}-{seed}.npz")
+    if os.path.exists(path):
+        try:
+            read_snapshot_arrays(path)
+            return path
+        except SnapshotError:
+            pass  # written by an older snapshot version
+    os.makedirs(directory, exist_ok=True)
+    G, signals = synthetic_graph(scale, seed)
+    save_snapshot(G, signals, path, place_name=f"synthetic {scale} (seed {seed})")
+    return path
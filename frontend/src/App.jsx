@@ -34,6 +34,8 @@ function App() {
 
     const simIntervalRef = useRef(null)
     const routeRef = useRef([])
+    const routeIdRef = useRef(null)
+    const vehicleIdRef = useRef(null)
     useEffect(() => { routeRef.current = route }, [route])
 
     useEffect(() => {
@@ -57,15 +59,26 @@ function App() {
         fetchOsmSignals()
 
         
-        let signalInterval;
+        // live signal states arrive as deltas on the push channel
+        let events;
         if (graphLoaded) {
-            signalInterval = setInterval(fetchSignals, 2000)
+            events = new EventSource(`${API_BASE}/events`)
+            events.onmessage = (e) => applyPush(JSON.parse(e.data))
         }
         return () => {
-            if (signalInterval) clearInterval(signalInterval)
+            if (events) events.close()
         }
     }, [graphLoaded])
 
+    const applyPush = (msg) => {
+        if (msg.type === 'snapshot') {
+            setSignals(msg.signals)
+        } else if (msg.type === 'delta' && msg.signals.length) {
+            const changed = new Map(msg.signals.map(s => [s.id, s.state]))
+            setSignals(prev => prev.map(s => changed.has(s.id) ? { ...s, state: changed.get(s.id) } : s))
+        }
+    }
+
     const fetchSignals = async () => {
         try {
             const res = await axios.get(`${API_BASE}/signals/status`)
@@ -106,6 +119,7 @@ function App() {
             setTargetHospital(res.data.hospital)
             setRoute(res.data.route)
             routeRef.current = res.data.route
+            routeIdRef.current = res.data.route_id
             setTravelTime(res.data.estimated_time_minutes)
             setAmbulancePos([startLat, startLon])
             setRouteIndex(0)
@@ -114,6 +128,14 @@ function App() {
             setIsPickingLocation(false) 
             addAlert(`Route calculated to ${res.data.hospital.name}. ETA: ${res.data.estimated_time_minutes} min.`)
 
+            // the server drives the ambulance along the route from now on
+            const vehicle = await axios.post(`${API_BASE}/fleet/vehicles`, {
+                route_id: res.data.route_id,
+                speed_kmh: 60 * simulationSpeed,
+                vehicle_id: vehicleIdRef.current
+            })
+            vehicleIdRef.current = vehicle.data.vehicle_id
+
             if (simIntervalRef.current) clearInterval(simIntervalRef.current)
             simIntervalRef.current = setInterval(simulateMovement, 1000 / simulationSpeed)
         } catch (e) {
@@ -125,32 +147,23 @@ function App() {
     }
 
     const simulateMovement = () => {
-        setRouteIndex(prev => {
-            const currentRoute = routeRef.current
-            if (prev >= currentRoute.length - 1) {
+        axios.post(`${API_BASE}/simulate/step`, {
+            vehicle_id: vehicleIdRef.current,
+            include_signals: false
+        }).then(res => {
+            const vehicle = res.data.vehicle
+            setAmbulancePos([vehicle.lat, vehicle.lon])
+            setRouteIndex(prev => prev + 1)
+            if (res.data.preemption_active) {
+                addAlert('Green Signal Preempted Ahead! Clean Window active.')
+            }
+            if (vehicle.arrived) {
                 clearInterval(simIntervalRef.current)
+                simIntervalRef.current = null
                 setSimulationActive(false)
                 addAlert('Ambulance arrived at the destination. 🏥')
-                return prev
             }
-
-            const nextPos = currentRoute[prev + 1]
-            setAmbulancePos(nextPos)
-
-            axios.post(`${API_BASE}/simulate/step`, {
-                current_lat: nextPos[0],
-                current_lon: nextPos[1],
-                route: currentRoute,
-                speed_kmh: 60
-            }).then(res => {
-                setSignals(res.data.signals)
-                if (res.data.preemption_active) {
-                    addAlert('Green Signal Preempted Ahead! Clean Window active.')
-                }
-            }).catch(e => console.error('Sim step failed', e))
-
-            return prev + 1
-        })
+        }).catch(e => console.error('Sim step failed', e))
     }
 
     const stopSimulation = () => {
@@ -158,6 +171,10 @@ function App() {
             clearInterval(simIntervalRef.current)
             simIntervalRef.current = null
         }
+        if (vehicleIdRef.current) {
+            axios.delete(`${API_BASE}/fleet/vehicles/${vehicleIdRef.current}`).catch(() => {})
+            vehicleIdRef.current = null
+        }
         setSimulationActive(false)
         addAlert('Simulation stopped by operator.')
     }